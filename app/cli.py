@@ -0,0 +1,216 @@
+# Purpose: 命令列維運工具（批次匯入等）
+#
+# 使用方式:
+#   python -m app.cli migrate
+#   python -m app.cli import-relationships relationships.csv
+#   python -m app.cli import-relationships relationships.json --dry-run
+#   python -m app.cli import-villagers census.csv --threshold 0.7
+#   python -m app.cli traces traces.jsonl --slowest 5
+
+import argparse
+import csv
+import json
+import sys
+
+from pydantic import ValidationError
+
+from app.database import Base, SessionLocal, engine
+from app.migrations import run_migrations
+from app import models  # noqa: F401 - 註冊所有資料表到 Base.metadata
+from app.crud import Villager
+from app import schemas
+from app.services.villager_import import DEFAULT_SIMILARITY_THRESHOLD
+from app.utils.tracing import render_waterfall
+
+
+def _read_rows(path):
+    """
+    讀取 CSV（含標題列）或 JSON 陣列檔案
+
+    Raises:
+        ValueError: JSON 格式錯誤（json.JSONDecodeError）、編碼錯誤或最上層不是陣列
+        csv.Error: CSV 格式錯誤
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+        if not isinstance(rows, list):
+            raise ValueError(f"JSON 檔案的最上層必須是陣列，而不是 {type(rows).__name__}")
+        return rows
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def _load_rows(path):
+    """讀取檔案，無法解析時輸出原因並回傳 None"""
+    try:
+        return _read_rows(path)
+    except (ValueError, csv.Error) as e:
+        print(f"無法讀取 {path}: {e}", file=sys.stderr)
+        return None
+
+
+def _parse_rows(rows, schema, prepare=dict):
+    """
+    逐列驗證檔案內容，格式錯誤的列輸出列號與原因
+
+    Returns:
+        list | None: 驗證後的模型列表，有任何一列格式錯誤時為 None（不匯入任何資料）
+    """
+    parsed, invalid = [], 0
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            invalid += 1
+            print(f"第 {index + 1} 筆格式錯誤: 必須是物件，而不是 {type(row).__name__}", file=sys.stderr)
+            continue
+        try:
+            parsed.append(schema(**prepare(row)))
+        except (ValidationError, TypeError, ValueError) as e:
+            invalid += 1
+            reasons = (
+                "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+                if isinstance(e, ValidationError) else str(e)
+            )
+            print(f"第 {index + 1} 筆格式錯誤: {reasons}", file=sys.stderr)
+    if invalid:
+        print(f"共 {invalid} 筆格式錯誤，未匯入任何資料", file=sys.stderr)
+        return None
+    return parsed
+
+
+def migrate(args):
+    """建立缺少的資料表並套用尚未執行的結構遷移"""
+    Base.metadata.create_all(bind=engine)
+    applied = run_migrations(engine)
+    print(f"已套用 {len(applied)} 個遷移" + (f": {', '.join(applied)}" if applied else ""))
+    return 0
+
+
+def import_relationships(args):
+    """批次匯入村民親屬關係，欄位: source_villager_id, target_villager_id, relationship_type_id"""
+    rows = _load_rows(args.file)
+    if rows is None:
+        return 1
+    relationships = _parse_rows(rows, schemas.RelationshipCreate)
+    if relationships is None:
+        return 1
+    if not relationships:
+        print("檔案中沒有任何親屬關係")
+        return 1
+
+    db = SessionLocal()
+    try:
+        result = Villager.bulk_create_relationships(db, relationships, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    for error in result["errors"]:
+        print(
+            f"第 {error['index'] + 1} 筆失敗 "
+            f"({error['source_villager_id']} -> {error['target_villager_id']}, "
+            f"類型 {error['relationship_type_id']}): {error['error']}",
+            file=sys.stderr
+        )
+    action = "可建立" if args.dry_run else "已建立"
+    print(f"共 {len(relationships)} 筆，{action} {len(result['created'])} 筆，失敗 {len(result['errors'])} 筆")
+    return 1 if result["errors"] else 0
+
+
+def import_villagers(args):
+    """批次匯入村民並標記疑似重複，欄位: name, gender, job, url, photo, location_id"""
+    rows = _load_rows(args.file)
+    if rows is None:
+        return 1
+    villagers = _parse_rows(
+        rows,
+        schemas.VillagerCreate,
+        lambda row: {key: (value if value != "" else None) for key, value in row.items()}
+    )
+    if villagers is None:
+        return 1
+    if not villagers:
+        print("檔案中沒有任何村民資料")
+        return 1
+
+    db = SessionLocal()
+    try:
+        result = Villager.bulk_create_villagers(
+            db,
+            villagers,
+            similarity_threshold=args.threshold,
+            force_indexes=args.force,
+            dry_run=args.dry_run
+        )
+    finally:
+        db.close()
+
+    for duplicate in result["duplicates"]:
+        candidates = []
+        for match in duplicate["matches"]:
+            if match["villagerid"] is not None:
+                source = f"村民ID {match['villagerid']}"
+            else:
+                source = f"第 {match['index'] + 1} 筆"
+            candidates.append(f"{match['name']}({source}, {match['score']})")
+        candidates = ", ".join(candidates)
+        print(f"第 {duplicate['index'] + 1} 筆 {duplicate['name']} 疑似重複: {candidates}", file=sys.stderr)
+    for error in result["errors"]:
+        print(f"第 {error['index'] + 1} 筆 {error['name']} 失敗: {error['error']}", file=sys.stderr)
+    if result["skipped_blocks"]:
+        print(f"略過 {result['skipped_blocks']} 個過於常見的姓名 block，相似但不完全相同的姓名可能未被偵測", file=sys.stderr)
+
+    action = "可新增" if args.dry_run else "已新增"
+    print(
+        f"共 {len(villagers)} 筆，{action} {len(result['created'])} 筆，"
+        f"疑似重複 {len(result['duplicates'])} 筆，失敗 {len(result['errors'])} 筆"
+    )
+    return 1 if result["duplicates"] or result["errors"] else 0
+
+
+def show_traces(args):
+    """以瀑布圖顯示 TRACE_FILE 中的 trace（指定 ID 或最慢的幾筆）"""
+    with open(args.file, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if args.trace_id:
+        records = [record for record in records if record["trace_id"] == args.trace_id]
+    else:
+        records = sorted(records, key=lambda record: record["duration_ms"] or 0, reverse=True)[:args.slowest]
+    if not records:
+        print("找不到符合的 trace")
+        return 1
+    print("\n\n".join(render_waterfall(record) for record in records))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="kanahcian-backend 維運工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="建立資料表並套用結構遷移")
+    migrate_parser.set_defaults(func=migrate)
+
+    rel_parser = subparsers.add_parser("import-relationships", help="批次匯入村民親屬關係")
+    rel_parser.add_argument("file", help="CSV 或 JSON 檔案路徑")
+    rel_parser.add_argument("--dry-run", action="store_true", help="只驗證不寫入")
+    rel_parser.set_defaults(func=import_relationships)
+
+    villager_parser = subparsers.add_parser("import-villagers", help="批次匯入村民（含重複偵測）")
+    villager_parser.add_argument("file", help="CSV 或 JSON 檔案路徑")
+    villager_parser.add_argument("--threshold", type=float, default=DEFAULT_SIMILARITY_THRESHOLD, help="姓名相似度門檻")
+    villager_parser.add_argument("--force", type=lambda v: int(v) - 1, action="append", default=[], metavar="ROW",
+                                 help="即使疑似重複仍要新增的列號（從 1 開始，可重複指定）")
+    villager_parser.add_argument("--dry-run", action="store_true", help="只偵測不寫入")
+    villager_parser.set_defaults(func=import_villagers)
+
+    traces_parser = subparsers.add_parser("traces", help="以瀑布圖檢視追蹤檔案中的 trace")
+    traces_parser.add_argument("file", help="TRACE_FILE（JSON Lines）")
+    traces_parser.add_argument("--trace-id", help="只顯示指定的 trace")
+    traces_parser.add_argument("--slowest", type=int, default=5, help="顯示最慢的幾筆")
+    traces_parser.set_defaults(func=show_traces)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
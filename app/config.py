@@ -0,0 +1,107 @@
+# Purpose: 應用程式設定（由環境變數讀取）
+
+import os
+from dotenv import load_dotenv
+
+# 載入 .env 變數
+load_dotenv()
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """讀取布林環境變數（1/true/yes/on 為真）"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name: str, default: int) -> int:
+    """讀取整數環境變數"""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    """讀取浮點數環境變數"""
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+# **由 PostgreSQL 以 json_agg / json_build_object 組出大型列表回應，應用程式直接回傳 bytes**
+# 適用: 所有地點、地點的村民（含親屬關係）、地點的家訪紀錄；非 PostgreSQL 時自動停用
+DB_JSON_AGGREGATION = env_bool("DB_JSON_AGGREGATION")
+
+# **連接池前的准入控制（超載時回傳 503 + Retry-After）**
+ADMISSION_CONTROL = env_bool("ADMISSION_CONTROL", True)
+
+# **連線洩漏追蹤：記錄借出連線的呼叫堆疊與各路由的持有時間（/api/pool-status/leaks）**
+POOL_LEAK_TRACER = env_bool("POOL_LEAK_TRACER")
+
+# **每個請求的查詢數與資料庫時間（X-DB-Query-Count / X-DB-Time-Ms 標頭），同一語句重複達門檻時標記 N+1**
+QUERY_COUNTER = env_bool("QUERY_COUNTER", True)
+N_PLUS_ONE_THRESHOLD = env_int("N_PLUS_ONE_THRESHOLD", 5)
+
+# **慢查詢紀錄：超過 SLOW_QUERY_MS 的查詢保存在環狀緩衝區（/api/admin/slow-queries），0 為停用**
+SLOW_QUERY_MS = env_int("SLOW_QUERY_MS", 500)
+SLOW_QUERY_LOG_SIZE = env_int("SLOW_QUERY_LOG_SIZE", 200)
+# 依語句形狀彙整的統計（含執行計畫）最多保存的種類數
+SLOW_QUERY_MAX_SHAPES = env_int("SLOW_QUERY_MAX_SHAPES", 100)
+# 語句形狀第一次變慢時在背景擷取 EXPLAIN (ANALYZE, BUFFERS)（會再執行一次該查詢）
+SLOW_QUERY_EXPLAIN = env_bool("SLOW_QUERY_EXPLAIN")
+
+# **PostgreSQL statement_timeout（毫秒），0 為不限制**
+DB_STATEMENT_TIMEOUT_MS = env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+
+# **管理端點（/api/admin）的權杖，以 X-Admin-Token 標頭傳送；未設定時停用管理端點**
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# **Prometheus /metrics（多 worker 時另設 PROMETHEUS_MULTIPROC_DIR 存放各 worker 的快照）**
+METRICS = env_bool("METRICS", True)
+
+# **Server-Timing 標頭（db / orm / crud / handler / serialize / session）的抽樣比例**
+# 未抽中的請求帶有 X-Server-Timing: 1 標頭時仍會量測（0 表示只量測帶有此標頭的請求）
+SERVER_TIMING_SAMPLE_RATE = env_float("SERVER_TIMING_SAMPLE_RATE", 1.0)
+
+# **請求追蹤（request -> handler -> crud -> sql / serialize 的 span），保留的 trace 寫入 TRACE_FILE（JSON Lines）**
+TRACING = env_bool("TRACING")
+# head sampling 比例；未抽中但超過 TRACE_SLOW_MS 的 trace 也會保留
+TRACE_SAMPLE_RATE = env_float("TRACE_SAMPLE_RATE", 0.01)
+TRACE_SLOW_MS = env_int("TRACE_SLOW_MS", 1000)
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_FILE_MAX_BYTES = env_int("TRACE_FILE_MAX_BYTES", 50 * 1024 * 1024)
+
+# **啟動時的結構初始化（create_all 與結構遷移）**
+#   startup    匯入 app.main 時執行（預設，與先前行為相同）
+#   background 開始服務後由暖機執行緒執行，完成前 /ready 回傳 503
+#   skip       不執行，部署時另外執行 `python -m app.cli migrate`（冷啟動最快）
+SCHEMA_INIT = os.getenv("SCHEMA_INIT", "startup").strip().lower()
+
+# **開始服務後在背景暖機：建立 WARM_POOL_CONNECTIONS 條連接池連線、預先載入地點與村民數量快取**
+WARM_UP = env_bool("WARM_UP", True)
+WARM_POOL_CONNECTIONS = env_int("WARM_POOL_CONNECTIONS", 2)
+
+# **查詢快取（app/utils/cache.py）：memory（行程內 LRU）、redis（CACHE_URL，多 worker 與多台機器共用）、local（行程內的 Redis 協定伺服器，測試用）；地點的村民與家訪紀錄只在 redis 時快取**
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").strip().lower()
+CACHE_URL = os.getenv("CACHE_URL", "")
+# redis / local 後端的序列化格式：orjson 或 msgpack（需安裝 msgpack）
+CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "orjson").strip().lower()
+CACHE_TTL = env_float("CACHE_TTL", 30.0)
+CACHE_MAX_ENTRIES = env_int("CACHE_MAX_ENTRIES", 1024)
+
+# **背景定期工作（app/utils/scheduler.py），間隔為 0 時停用該工作**
+SCHEDULER_JITTER = env_float("SCHEDULER_JITTER", 0.1)
+# 定期請求自己的網址，避免 Render 免費方案閒置休眠（多 worker 時只由一個 worker 執行）；空字串為停用
+KEEP_ALIVE_URL = os.getenv("KEEP_ALIVE_URL", "https://kanahcian-backend.onrender.com/")
+KEEP_ALIVE_INTERVAL = env_int("KEEP_ALIVE_INTERVAL", 300)
+# 在 query_cache 過期前重新載入常用的快取（每個 worker 各自執行）
+CACHE_REFRESH_INTERVAL = env_int("CACHE_REFRESH_INTERVAL", 25)
+# 重新計算所有村民的家訪統計（VisitCount / LastVisited），修正寫入路徑之外的資料異動（只由一個 worker 執行）
+VISIT_STATS_INTERVAL = env_int("VISIT_STATS_INTERVAL", 3600)
+
+# **多 worker 共用的唯讀資料快照（地點列表），以 mmap 映射；未設定路徑時停用**
+# 同一台機器上的 worker 須使用同一個路徑（例如 /dev/shm/kanahcian-read-model.bin）
+READ_MODEL_PATH = os.getenv("READ_MODEL_PATH", "")
+# 快照來源時間超過此秒數時不再使用（涵蓋其他機器上的寫入）
+READ_MODEL_MAX_AGE = env_float("READ_MODEL_MAX_AGE", 300.0)
+# 檢查快照是否過期並重建的間隔秒數
+READ_MODEL_REFRESH_INTERVAL = env_float("READ_MODEL_REFRESH_INTERVAL", 2.0)
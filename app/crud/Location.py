@@ -1,13 +1,114 @@
 # 負責 Location 的資料庫 CRUD
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session, load_only
+from typing import Optional
 from .. import models, schemas
+from ..utils.instrumentation import instrument_crud
+from ..utils.cache import query_cache
+
+# 地點資料列快取的 namespace（寫入 Location 後失效）
+LOCATION_ROWS_CACHE = "location_rows"
+query_cache.register(LOCATION_ROWS_CACHE, (models.Location.__tablename__,))
+
+# fields= 可選的欄位：API 欄位名稱 → ORM 欄位
+LOCATION_FIELDS = {
+    "id": models.Location.LocationID,
+    "name": models.Location.name,
+    "latitude": models.Location.Latitude,
+    "longitude": models.Location.Longitude,
+    "address": models.Location.Address,
+    "brief_description": models.Location.BriefDescription,
+    "photo": models.Location.Photo,
+    "tag": models.Location.Tag,
+}
+
+# 由 PostgreSQL 組出地點列表（GET /api/locations 的 data），有效座標的地點在前
+LOCATIONS_JSON_SQL = text('''
+WITH loc AS (
+    SELECT *,
+        "Latitude" IS NOT NULL AND "Longitude" IS NOT NULL
+            AND btrim("Latitude") <> '' AND btrim("Longitude") <> '' AS valid
+    FROM "Location"
+)
+SELECT
+    count(*) FILTER (WHERE valid) AS valid_count,
+    count(*) FILTER (WHERE NOT valid) AS invalid_count,
+    coalesce(
+        json_agg(json_build_object(
+            'id', "LocationID",
+            'name', "name",
+            'latitude', "Latitude",
+            'longitude', "Longitude",
+            'address', "Address",
+            'brief_description', "BriefDescription",
+            'photo', "Photo",
+            'tag', "Tag"
+        ) ORDER BY NOT valid, "LocationID") FILTER (WHERE valid OR :include_invalid),
+        '[]'
+    )::text AS data
+FROM loc
+''')
 
 # **取得所有地點**
-def get_locations(db: Session):
-    return db.query(models.Location).all()
+@instrument_crud
+def get_locations(db: Session, columns: Optional[list] = None):
+    """取得所有地點，提供 columns 時只載入這些欄位（主鍵一律載入）"""
+    query = db.query(models.Location)
+    if columns:
+        query = query.options(load_only(*columns))
+    return query.all()
+
+@instrument_crud
+def get_location_rows(db: Session, columns: Optional[list] = None):
+    """
+    以 Core select 取得所有地點，回傳 tuple 形式的資料列（不建立 ORM 物件）
+    
+    Args:
+        db (Session): 資料庫連線
+        columns (list): 要查詢的欄位，None 表示 LOCATION_FIELDS 的全部欄位
+    
+    Returns:
+        List[Row]: 欄位順序與 columns 相同的資料列
+    """
+    columns = columns or list(LOCATION_FIELDS.values())
+    return db.execute(select(*columns)).all()
+
+@instrument_crud
+def get_cached_location_rows(db: Session, columns: Optional[list] = None):
+    """
+    同 get_location_rows，結果保存在查詢快取（寫入 Location 後失效）
+    
+    Args:
+        db (Session): 資料庫連線
+        columns (list): 要查詢的欄位，None 表示 LOCATION_FIELDS 的全部欄位
+    
+    Returns:
+        List[list]: 欄位順序與 columns 相同的資料列
+    """
+    columns = columns or list(LOCATION_FIELDS.values())
+    return query_cache.get_or_set(
+        LOCATION_ROWS_CACHE,
+        tuple(column.key for column in columns),
+        lambda: [list(row) for row in db.execute(select(*columns))]
+    )
+
+@instrument_crud
+def get_locations_json(db: Session, include_invalid: bool = False):
+    """
+    由 PostgreSQL 以 json_agg 組出地點列表（僅 PostgreSQL）
+    
+    Args:
+        db (Session): 資料庫連線
+        include_invalid (bool): 是否包含座標無效的地點
+    
+    Returns:
+        Row: (valid_count, invalid_count, data)，data 為 JSON 陣列字串
+    """
+    return db.execute(LOCATIONS_JSON_SQL, {"include_invalid": include_invalid}).one()
 
 # **新增地點**
+@instrument_crud
 def add_location(db: Session, location: schemas.LocationCreate):
     # 將 schema 轉換為與 ORM 模型相符的格式
     location_data = {
@@ -25,6 +126,7 @@ def add_location(db: Session, location: schemas.LocationCreate):
     db.refresh(new_location)
     return new_location
 
+@instrument_crud
 def update_location(db: Session, location_id: int, location: schemas.LocationUpdate):
     loc = db.query(models.Location).filter(models.Location.LocationID == location_id).first()
     if not loc:
@@ -40,6 +142,7 @@ def update_location(db: Session, location_id: int, location: schemas.LocationUpd
     db.refresh(loc)
     return loc
 
+@instrument_crud
 def delete_location(db: Session, location_id: int):
     loc = db.query(models.Location).filter(models.Location.LocationID == location_id).first()
     if not loc:
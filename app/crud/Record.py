@@ -1,20 +1,67 @@
 # app/crud/Record.py - 完整替換版本
 
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, text, tuple_
+from sqlalchemy.orm import Session, load_only
+from typing import List, Optional
 from .. import models, schemas
+from ..utils.instrumentation import instrument_crud
+from ..utils.cache import query_cache
+from .Villager import refresh_visit_counters
 
-def get_all_records(db: Session):
+# 地點家訪紀錄（回應格式）快取的 namespace（寫入 Record 後失效），只在共用後端（CACHE_BACKEND=redis）時快取
+RECORDS_BY_LOCATION_CACHE = "records_by_location"
+query_cache.register(RECORDS_BY_LOCATION_CACHE, (models.Record.__tablename__,), shared_only=True)
+
+# fields= 可選的欄位：API 欄位名稱 → ORM 欄位
+RECORD_FIELDS = {
+    "record_id": models.Record.RecordID,
+    "semester": models.Record.Semester,
+    "date": models.Record.Date,
+    "photo": models.Record.Photo,
+    "description": models.Record.Description,
+    "location_id": models.Record.Location,
+    "account_id": models.Record.Account,
+}
+
+# 由 PostgreSQL 組出地點的家訪紀錄（GET /api/records/location/{id} 的 data）
+RECORDS_BY_LOCATION_JSON_SQL = text('''
+SELECT
+    count(*) AS record_count,
+    coalesce(json_agg(json_build_object(
+        'record_id', "RecordID",
+        'semester', coalesce("Semester", ''),
+        'date', "Date",
+        'photo', "Photo",
+        'description', "Description",
+        'location_id', "Location",
+        'account_id', "Account"
+    ) ORDER BY "Date" DESC, "RecordID" DESC), '[]')::text AS data
+FROM "Record"
+WHERE "Location" = :location_id
+''')
+
+def _load_columns(query, columns: Optional[list]):
+    """提供 columns 時只載入這些欄位（主鍵一律載入）"""
+    if columns:
+        query = query.options(load_only(*columns))
+    return query
+
+@instrument_crud
+def get_all_records(db: Session, columns: Optional[list] = None):
     """
     取得所有家訪紀錄
     
     Args:
         db (Session): 資料庫連線
+        columns (list): 只載入的欄位，None 表示全部
     
     Returns:
         List[models.Record]: 所有家訪紀錄
     """
-    return db.query(models.Record).order_by(models.Record.Date.desc()).all()
+    query = _load_columns(db.query(models.Record), columns)
+    return query.order_by(models.Record.Date.desc()).all()
 
+@instrument_crud
 def get_record_by_id(db: Session, record_id: int):
     """
     根據 ID 取得單筆家訪紀錄
@@ -28,21 +75,38 @@ def get_record_by_id(db: Session, record_id: int):
     """
     return db.query(models.Record).filter(models.Record.RecordID == record_id).first()
 
-def get_records_by_location(db: Session, location_id: int):
+@instrument_crud
+def get_records_by_location(db: Session, location_id: int, columns: Optional[list] = None):
     """
     根據地點 ID 取得該地點的所有家訪紀錄
     
     Args:
         db (Session): 資料庫連線
         location_id (int): 地點 ID
+        columns (list): 只載入的欄位，None 表示全部
     
     Returns:
         List[models.Record]: 該地點的家訪紀錄列表
     """
-    return db.query(models.Record).filter(
+    return _load_columns(db.query(models.Record), columns).filter(
         models.Record.Location == location_id
     ).order_by(models.Record.Date.desc()).all()
 
+@instrument_crud
+def get_records_by_location_json(db: Session, location_id: int):
+    """
+    由 PostgreSQL 以 json_agg 組出地點的家訪紀錄（僅 PostgreSQL）
+    
+    Args:
+        db (Session): 資料庫連線
+        location_id (int): 地點 ID
+    
+    Returns:
+        Row: (record_count, data)，data 為 JSON 陣列字串
+    """
+    return db.execute(RECORDS_BY_LOCATION_JSON_SQL, {"location_id": location_id}).one()
+
+@instrument_crud
 def get_records_by_account(db: Session, account_id: int):
     """
     根據帳號 ID 取得該帳號創建的所有家訪紀錄
@@ -58,6 +122,7 @@ def get_records_by_account(db: Session, account_id: int):
         models.Record.Account == account_id
     ).order_by(models.Record.Date.desc()).all()
 
+@instrument_crud
 def get_records_by_semester(db: Session, semester: str):
     """
     根據學期取得該學期的所有家訪紀錄
@@ -73,6 +138,63 @@ def get_records_by_semester(db: Session, semester: str):
         models.Record.Semester == semester
     ).order_by(models.Record.Date.desc()).all()
 
+@instrument_crud
+def get_recent_records_by_location(db: Session, location_id: int, limit: int = 10):
+    """
+    取得地點最近的家訪紀錄
+    
+    Args:
+        db (Session): 資料庫連線
+        location_id (int): 地點 ID
+        limit (int): 取得筆數上限
+    
+    Returns:
+        List[models.Record]: 依日期由新到舊的家訪紀錄列表
+    """
+    return db.query(models.Record).filter(
+        models.Record.Location == location_id
+    ).order_by(models.Record.Date.desc(), models.Record.RecordID.desc()).limit(limit).all()
+
+@instrument_crud
+def get_record_participants(db: Session, record_ids):
+    """
+    批次取得多筆家訪紀錄的參與學生與受訪村民
+    
+    不論紀錄數量，固定以兩次查詢取得。
+    
+    Args:
+        db (Session): 資料庫連線
+        record_ids (Iterable[int]): 紀錄 ID
+    
+    Returns:
+        Dict[int, dict]: 紀錄 ID 對應 {"students": [...], "villagers": [...]}
+    """
+    record_ids = list(dict.fromkeys(record_ids))
+    participants = {record_id: {"students": [], "villagers": []} for record_id in record_ids}
+    if not record_ids:
+        return participants
+    
+    students = (
+        db.query(models.StudentsAtRecord.Record, models.Account.AccountID, models.Account.Name)
+        .join(models.Account, models.Account.AccountID == models.StudentsAtRecord.Account)
+        .filter(models.StudentsAtRecord.Record.in_(record_ids))
+        .all()
+    )
+    villagers = (
+        db.query(models.VillagersAtRecord.Record, models.Villager.VillagerID, models.Villager.Name)
+        .join(models.Villager, models.Villager.VillagerID == models.VillagersAtRecord.Villager)
+        .filter(models.VillagersAtRecord.Record.in_(record_ids))
+        .all()
+    )
+    
+    for record_id, account_id, name in students:
+        participants[record_id]["students"].append({"account_id": account_id, "name": name})
+    for record_id, villager_id, name in villagers:
+        participants[record_id]["villagers"].append({"villagerid": villager_id, "name": name})
+    
+    return participants
+
+@instrument_crud
 def create_record(db: Session, record: schemas.RecordCreate):
     """
     創建新的家訪紀錄
@@ -83,7 +205,13 @@ def create_record(db: Session, record: schemas.RecordCreate):
     
     Returns:
         models.Record: 創建的家訪紀錄
+    
+    Raises:
+        ValueError: 有村民不存在
     """
+    villager_ids = set(record.villager_ids or [])
+    _check_villagers_exist(db, villager_ids)
+    
     db_record = models.Record(
         Semester=record.semester,
         Date=record.date,
@@ -94,10 +222,22 @@ def create_record(db: Session, record: schemas.RecordCreate):
     )
     
     db.add(db_record)
+    
+    # 同時建立村民關聯並更新家訪統計
+    if villager_ids:
+        db.flush()
+        db.add_all([
+            models.VillagersAtRecord(Villager=villager_id, Record=db_record.RecordID)
+            for villager_id in villager_ids
+        ])
+        db.flush()
+        refresh_visit_counters(db, villager_ids)
+    
     db.commit()
     db.refresh(db_record)
     return db_record
 
+@instrument_crud
 def update_record(db: Session, record_id: int, record: schemas.RecordUpdate):
     """
     更新家訪紀錄
@@ -129,10 +269,16 @@ def update_record(db: Session, record_id: int, record: schemas.RecordUpdate):
     if record.account_id is not None:
         db_record.Account = record.account_id
     
+    # 家訪日期變更時，重新計算相關村民的最後家訪日期
+    if record.date is not None:
+        db.flush()
+        refresh_visit_counters(db, _get_record_villager_ids(db, record_id))
+    
     db.commit()
     db.refresh(db_record)
     return db_record
 
+@instrument_crud
 def delete_record(db: Session, record_id: int):
     """
     刪除家訪紀錄
@@ -149,10 +295,130 @@ def delete_record(db: Session, record_id: int):
     if not db_record:
         return False
     
-    db.delete(db_record)
+    # 先移除學生與村民關聯，刪除後再重新計算這些村民的家訪統計
+    villager_ids = _get_record_villager_ids(db, record_id)
+    for association in (models.VillagersAtRecord, models.StudentsAtRecord):
+        db.execute(
+            delete(association)
+            .where(association.Record == record_id)
+            .execution_options(synchronize_session=False)
+        )
+    db.execute(
+        delete(models.Record)
+        .where(models.Record.RecordID == record_id)
+        .execution_options(synchronize_session=False)
+    )
+    refresh_visit_counters(db, villager_ids)
     db.commit()
     return True
 
+def _check_villagers_exist(db: Session, villager_ids):
+    """
+    確認村民都存在
+
+    Raises:
+        ValueError: 有村民不存在
+    """
+    if not villager_ids:
+        return
+    existing_villagers = {
+        row.VillagerID for row in
+        db.query(models.Villager.VillagerID).filter(models.Villager.VillagerID.in_(villager_ids)).all()
+    }
+    missing = set(villager_ids) - existing_villagers
+    if missing:
+        raise ValueError(f"找不到指定的村民: {sorted(missing)}")
+
+def _get_record_villager_ids(db: Session, record_id: int):
+    """取得家訪紀錄關聯的村民ID"""
+    return [
+        row.Villager for row in
+        db.query(models.VillagersAtRecord.Villager).filter(models.VillagersAtRecord.Record == record_id).all()
+    ]
+
+@instrument_crud
+def add_villagers_to_record(db: Session, record_id: int, villager_ids: List[int]):
+    """
+    將村民加入家訪紀錄，並更新其家訪統計
+    
+    Args:
+        db (Session): 資料庫連線
+        record_id (int): 紀錄 ID
+        villager_ids (List[int]): 村民 ID 列表
+    
+    Returns:
+        List[int]: 新加入的村民 ID（已在紀錄中的會略過），若未找到紀錄則回傳 None
+    
+    Raises:
+        ValueError: 有村民不存在
+    """
+    if not db.query(models.Record.RecordID).filter(models.Record.RecordID == record_id).first():
+        return None
+    
+    villager_ids = set(villager_ids)
+    _check_villagers_exist(db, villager_ids)
+    
+    new_ids = sorted(villager_ids - set(_get_record_villager_ids(db, record_id)))
+    if new_ids:
+        db.add_all([models.VillagersAtRecord(Villager=villager_id, Record=record_id) for villager_id in new_ids])
+        db.flush()
+        refresh_visit_counters(db, new_ids)
+        db.commit()
+    return new_ids
+
+@instrument_crud
+def remove_villager_from_record(db: Session, record_id: int, villager_id: int):
+    """
+    將村民從家訪紀錄移除，並更新其家訪統計
+    
+    Args:
+        db (Session): 資料庫連線
+        record_id (int): 紀錄 ID
+        villager_id (int): 村民 ID
+    
+    Returns:
+        bool: 移除成功返回 True，未找到關聯返回 False
+    """
+    deleted = db.execute(
+        delete(models.VillagersAtRecord)
+        .where(
+            models.VillagersAtRecord.Record == record_id,
+            models.VillagersAtRecord.Villager == villager_id
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    
+    if not deleted:
+        return False
+    
+    refresh_visit_counters(db, [villager_id])
+    db.commit()
+    return True
+
+@instrument_crud
+def get_records_by_villager(db: Session, villager_id: int, limit: int = 20, before: Optional[list] = None):
+    """
+    取得村民的家訪紀錄（依日期由新到舊，keyset 分頁）
+    
+    Args:
+        db (Session): 資料庫連線
+        villager_id (int): 村民 ID
+        limit (int): 取得筆數上限
+        before (list): 上一頁最後一筆的 [Date, RecordID]
+    
+    Returns:
+        List[models.Record]: 該村民的家訪紀錄列表
+    """
+    query = (
+        db.query(models.Record)
+        .join(models.VillagersAtRecord, models.VillagersAtRecord.Record == models.Record.RecordID)
+        .filter(models.VillagersAtRecord.Villager == villager_id)
+    )
+    if before is not None:
+        query = query.filter(tuple_(models.Record.Date, models.Record.RecordID) < tuple_(*before))
+    return query.order_by(models.Record.Date.desc(), models.Record.RecordID.desc()).limit(limit).all()
+
+@instrument_crud
 def get_records_count(db: Session):
     """
     取得家訪紀錄總數
@@ -165,6 +431,7 @@ def get_records_count(db: Session):
     """
     return db.query(models.Record).count()
 
+@instrument_crud
 def get_records_count_by_location(db: Session, location_id: int):
     """
     取得特定地點的家訪紀錄數量
@@ -180,10 +447,12 @@ def get_records_count_by_location(db: Session, location_id: int):
 
 # ===== 舊版函數 - 保持向後兼容 =====
 
+@instrument_crud
 def get_records(db: Session):
     """舊版函數名稱，重定向到新版"""
     return get_all_records(db)
 
+@instrument_crud
 def get_record_by_location(db: Session, ID: int):
     """
     舊版函數 - 保持向後兼容
@@ -207,6 +476,7 @@ def get_record_by_location(db: Session, ID: int):
     
     return result
 
+@instrument_crud
 def get_record_by_location_with_details(db: Session, location_id: int):
     """
     舊版函數 - 保持向後兼容
@@ -232,6 +502,7 @@ def get_record_by_location_with_details(db: Session, location_id: int):
     
     return result
 
+@instrument_crud
 def get_students_by_record(db: Session, record_id: int):
     """
     舊版函數 - 保持向後兼容
@@ -239,6 +510,7 @@ def get_students_by_record(db: Session, record_id: int):
     """
     return []
 
+@instrument_crud
 def get_villagers_by_record(db: Session, record_id: int):
     """
     舊版函數 - 保持向後兼容
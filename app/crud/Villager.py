@@ -1,8 +1,38 @@
 # 負責 Villager 的資料庫 CRUD
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, func, insert, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only
+from typing import List, Optional
 from .. import models, schemas
+from ..utils.instrumentation import instrument_crud
+from ..services.villager_import import DuplicateIndex, DEFAULT_SIMILARITY_THRESHOLD
+from ..utils.cache import query_cache
 
+# 村民總數快取的 namespace（寫入 Villager 後失效）
+VILLAGER_COUNT_CACHE = "villager_count"
+query_cache.register(VILLAGER_COUNT_CACHE, (models.Villager.__tablename__,))
+
+# 地點村民列表（含親屬關係）快取的 namespace，只在共用後端（CACHE_BACKEND=redis）時快取
+VILLAGERS_BY_LOCATION_CACHE = "villagers_by_location"
+query_cache.register(VILLAGERS_BY_LOCATION_CACHE, (
+    models.Villager.__tablename__,
+    models.VillagerRelationship.__tablename__,
+    models.RelationshipType.__tablename__,
+), shared_only=True)
+
+# 村民列表 fields= 可選的欄位：API 欄位名稱 → ORM 欄位
+VILLAGER_LIST_FIELDS = {
+    "villagerid": models.Villager.VillagerID,
+    "name": models.Villager.Name,
+    "gender": models.Villager.Gender,
+    "job": models.Villager.Job,
+    "locationid": models.Villager.Location,
+    "visit_count": models.Villager.VisitCount,
+    "last_visited": models.Villager.LastVisited,
+}
+
+@instrument_crud
 def get_villager_by_id(db: Session, villager_id: int):
     """
     根據ID取得村民資料
@@ -16,20 +46,165 @@ def get_villager_by_id(db: Session, villager_id: int):
     """
     return db.query(models.Villager).filter(models.Villager.VillagerID == villager_id).first()
 
-def get_villagers(db: Session, skip: int = 0, limit: int = 100):
+def _filter_villagers(query, location_id: Optional[int] = None, gender: Optional[str] = None, job: Optional[str] = None):
+    """套用村民列表的篩選條件"""
+    if location_id is not None:
+        query = query.filter(models.Villager.Location == location_id)
+    if gender is not None:
+        query = query.filter(models.Villager.Gender == gender)
+    if job is not None:
+        query = query.filter(models.Villager.Job == job)
+    return query
+
+@instrument_crud
+def get_villagers(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[list] = None,
+    sort: str = "id",
+    location_id: Optional[int] = None,
+    gender: Optional[str] = None,
+    job: Optional[str] = None,
+    columns: Optional[list] = None
+):
     """
     取得所有村民 (支援分頁)
     
+    提供 after 時使用 keyset 分頁（排序鍵 > 上一頁最後一筆），任何深度的分頁成本都相同；
+    skip 僅為舊版相容保留。
+    
     Args:
         db (Session): 資料庫連線
-        skip (int): 跳過筆數
+        skip (int): 跳過筆數（舊版 offset 分頁）
         limit (int): 取得筆數上限
+        after (list): 上一頁最後一筆的排序鍵，見 villager_sort_key
+        sort (str): "id" 依村民ID，"least_recently_visited" 依最後家訪日期（從未家訪者優先）
+        location_id (int): 篩選地點ID
+        gender (str): 篩選性別
+        job (str): 篩選職業
+        columns (list): 只載入的欄位，None 表示全部（主鍵一律載入）
     
     Returns:
-        List[models.Villager]: 村民資料列表
+        List[models.Villager]: 排序後的村民資料列表
+    """
+    query = _filter_villagers(db.query(models.Villager), location_id, gender, job)
+    if columns:
+        query = query.options(load_only(*columns))
+    
+    if sort == "least_recently_visited":
+        if after is not None:
+            last_visited, last_id = after
+            if last_visited is None:
+                query = query.filter(or_(
+                    and_(models.Villager.LastVisited.is_(None), models.Villager.VillagerID > last_id),
+                    models.Villager.LastVisited.isnot(None)
+                ))
+            else:
+                query = query.filter(or_(
+                    models.Villager.LastVisited > last_visited,
+                    and_(models.Villager.LastVisited == last_visited, models.Villager.VillagerID > last_id)
+                ))
+        query = query.order_by(models.Villager.LastVisited.asc().nulls_first(), models.Villager.VillagerID)
+    else:
+        if after is not None:
+            query = query.filter(models.Villager.VillagerID > after[0])
+        query = query.order_by(models.Villager.VillagerID)
+    
+    if after is None and skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+def villager_sort_key(villager, sort: str = "id"):
+    """取得村民在指定排序下的 keyset 分頁鍵"""
+    if sort == "least_recently_visited":
+        return [villager.LastVisited, villager.VillagerID]
+    return [villager.VillagerID]
+
+@instrument_crud
+def count_villagers(
+    db: Session,
+    location_id: Optional[int] = None,
+    gender: Optional[str] = None,
+    job: Optional[str] = None,
+    refresh: bool = False
+):
+    """
+    取得符合篩選條件的村民總數（快取，寫入 Villager 後失效）
+    
+    Args:
+        db (Session): 資料庫連線
+        location_id (int): 篩選地點ID
+        gender (str): 篩選性別
+        job (str): 篩選職業
+        refresh (bool): 不讀取快取，重新查詢並寫入快取（背景更新使用）
+    
+    Returns:
+        int: 村民總數
     """
-    return db.query(models.Villager).offset(skip).limit(limit).all()
+    key = (location_id, gender, job)
+    def load():
+        return _filter_villagers(
+            db.query(func.count(models.Villager.VillagerID)), location_id, gender, job
+        ).scalar()
+    if refresh:
+        total = load()
+        query_cache.set(VILLAGER_COUNT_CACHE, key, total)
+        return total
+    return query_cache.get_or_set(VILLAGER_COUNT_CACHE, key, load)
 
+# 由 PostgreSQL 組出地點的村民與親屬關係（GET /api/villagers/location/{id} 的 data）
+VILLAGERS_BY_LOCATION_JSON_SQL = text('''
+WITH rels AS (
+    SELECT r."SourceVillagerID" AS villager_id, 0 AS side, r."RelationshipID" AS relationship_id,
+           r."TargetVillagerID" AS relative_id, other."Name" AS relative_name,
+           t."Name" AS relationship_type, t."Source_Role" AS role
+    FROM "VillagerRelationship" r
+    JOIN "RelationshipType" t ON t."RelationshipTypeID" = r."RelationshipTypeID"
+    JOIN "Villager" other ON other."VillagerID" = r."TargetVillagerID"
+    JOIN "Villager" v ON v."VillagerID" = r."SourceVillagerID"
+    WHERE v."Location" = :location_id
+    UNION ALL
+    SELECT r."TargetVillagerID", 1, r."RelationshipID",
+           r."SourceVillagerID", other."Name",
+           t."Name", t."Target_Role"
+    FROM "VillagerRelationship" r
+    JOIN "RelationshipType" t ON t."RelationshipTypeID" = r."RelationshipTypeID"
+    JOIN "Villager" other ON other."VillagerID" = r."SourceVillagerID"
+    JOIN "Villager" v ON v."VillagerID" = r."TargetVillagerID"
+    WHERE v."Location" = :location_id
+),
+grouped AS (
+    SELECT villager_id, json_agg(json_build_object(
+        'relationship_id', relationship_id,
+        'relative_id', relative_id,
+        'relative_name', relative_name,
+        'relationship_type', relationship_type,
+        'role', role
+    ) ORDER BY side, relationship_id) AS items
+    FROM rels
+    GROUP BY villager_id
+)
+SELECT
+    count(*) AS villager_count,
+    coalesce(json_agg(json_build_object(
+        'villagerid', v."VillagerID",
+        'name', v."Name",
+        'gender', v."Gender",
+        'job', v."Job",
+        'url', v."URL",
+        'photo', v."Photo",
+        'locationid', v."Location",
+        'visit_count', v."VisitCount",
+        'last_visited', v."LastVisited",
+        'relationships', coalesce(grouped.items, '[]')
+    ) ORDER BY v."VillagerID"), '[]')::text AS data
+FROM "Villager" v
+LEFT JOIN grouped ON grouped.villager_id = v."VillagerID"
+WHERE v."Location" = :location_id
+''')
+
+@instrument_crud
 def get_villagers_by_location(db: Session, location_id: int):
     """
     根據地點ID取得該地點的所有村民
@@ -43,6 +218,21 @@ def get_villagers_by_location(db: Session, location_id: int):
     """
     return db.query(models.Villager).filter(models.Villager.Location == location_id).all()
 
+@instrument_crud
+def get_villagers_by_location_json(db: Session, location_id: int):
+    """
+    由 PostgreSQL 以 json_agg 組出地點的村民與親屬關係（僅 PostgreSQL）
+    
+    Args:
+        db (Session): 資料庫連線
+        location_id (int): 地點ID
+    
+    Returns:
+        Row: (villager_count, data)，data 為 JSON 陣列字串
+    """
+    return db.execute(VILLAGERS_BY_LOCATION_JSON_SQL, {"location_id": location_id}).one()
+
+@instrument_crud
 def create_villager(db: Session, villager: schemas.VillagerCreate):
     """
     新增村民資料
@@ -70,6 +260,107 @@ def create_villager(db: Session, villager: schemas.VillagerCreate):
     db.refresh(new_villager)
     return new_villager
 
+@instrument_crud
+def bulk_create_villagers(
+    db: Session,
+    villagers: List[schemas.VillagerCreate],
+    similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    force_indexes: Optional[List[int]] = None,
+    dry_run: bool = False
+):
+    """
+    批次新增村民資料，寫入前先偵測可能重複的村民
+
+    只載入匯入資料所涉及地點的既有村民（僅姓名、性別、地點欄位），以姓名 n-gram、
+    性別與地點做 blocking 比對；同一批次中較早接受的資料也會納入比對。
+    未被標記為重複的資料以單一 INSERT ... RETURNING 批次寫入。
+
+    Args:
+        db (Session): 資料庫連線
+        villagers (List[schemas.VillagerCreate]): 村民資料列表
+        similarity_threshold (float): 姓名相似度門檻
+        force_indexes (List[int]): 即使被標記為重複仍要寫入的資料列號
+        dry_run (bool): 只偵測不寫入
+
+    Returns:
+        dict: created 為寫入（或可寫入）的村民，duplicates 為可能重複的資料，errors 為無效資料，
+              skipped_blocks 為因過於常見而未用來比對的 block 數（大於 0 時相似但不完全相同的姓名可能未被偵測）
+    """
+    force_indexes = set(force_indexes or [])
+    location_ids = {v.location_id for v in villagers}
+
+    existing_locations = {
+        row.LocationID for row in
+        db.query(models.Location.LocationID).filter(models.Location.LocationID.in_(location_ids)).all()
+    }
+
+    # 建立 blocking 索引：只需要相關地點的既有村民
+    index = DuplicateIndex(threshold=similarity_threshold)
+    for row in (
+        db.query(models.Villager.VillagerID, models.Villager.Name, models.Villager.Gender, models.Villager.Location)
+        .filter(models.Villager.Location.in_(existing_locations))
+        .all()
+    ):
+        index.add(("villager", row.VillagerID), row.Name, row.Gender, row.Location)
+
+    accepted_rows = []
+    accepted_indexes = []
+    duplicates = []
+    errors = []
+
+    for i, villager in enumerate(villagers):
+        if villager.location_id not in existing_locations:
+            errors.append({"index": i, "name": villager.name, "error": "找不到指定的地點"})
+            continue
+
+        matches = index.find_matches(villager.name, villager.gender, villager.location_id)
+        if matches and i not in force_indexes:
+            duplicates.append({
+                "index": i,
+                "name": villager.name,
+                "matches": [
+                    {
+                        "villagerid": key[1] if key[0] == "villager" else None,
+                        "index": key[1] if key[0] == "row" else None,
+                        "name": name,
+                        "score": score
+                    }
+                    for key, name, score in matches
+                ]
+            })
+            continue
+
+        index.add(("row", i), villager.name, villager.gender, villager.location_id)
+        accepted_indexes.append(i)
+        accepted_rows.append({
+            "Name": villager.name,
+            "Gender": villager.gender,
+            "Job": villager.job,
+            "URL": villager.url,
+            "Photo": villager.photo,
+            "Location": villager.location_id
+        })
+
+    if dry_run or not accepted_rows:
+        created = [
+            {"index": i, "villagerid": None, "name": row["Name"]}
+            for i, row in zip(accepted_indexes, accepted_rows)
+        ]
+        return {"created": created, "duplicates": duplicates, "errors": errors, "skipped_blocks": index.skipped_blocks}
+
+    inserted = db.execute(
+        insert(models.Villager).returning(models.Villager.VillagerID, sort_by_parameter_order=True),
+        accepted_rows
+    ).all()
+    db.commit()
+
+    created = [
+        {"index": i, "villagerid": row.VillagerID, "name": data["Name"]}
+        for i, row, data in zip(accepted_indexes, inserted, accepted_rows)
+    ]
+    return {"created": created, "duplicates": duplicates, "errors": errors, "skipped_blocks": index.skipped_blocks}
+
+@instrument_crud
 def update_villager(db: Session, villager_id: int, villager: schemas.VillagerUpdate):
     """
     更新村民資料
@@ -99,6 +390,38 @@ def update_villager(db: Session, villager_id: int, villager: schemas.VillagerUpd
     db.refresh(db_villager)
     return db_villager
 
+@instrument_crud
+def delete_villagers(db: Session, villager_ids: Optional[List[int]] = None, location_id: Optional[int] = None):
+    """
+    批次刪除村民資料
+    
+    以單一 DELETE ... RETURNING 在同一個交易中刪除，親屬關係與家訪紀錄關聯
+    由資料庫的 ON DELETE CASCADE 一併刪除；快取只在整批完成後失效一次。
+    
+    Args:
+        db (Session): 資料庫連線
+        villager_ids (List[int]): 要刪除的村民ID
+        location_id (int): 刪除該地點的所有村民
+    
+    Returns:
+        List[int]: 實際刪除的村民ID
+    """
+    if villager_ids is None and location_id is None:
+        raise ValueError("必須指定村民ID或地點ID")
+    
+    stmt = delete(models.Villager)
+    if villager_ids is not None:
+        stmt = stmt.where(models.Villager.VillagerID.in_(villager_ids))
+    if location_id is not None:
+        stmt = stmt.where(models.Villager.Location == location_id)
+    
+    deleted_ids = db.execute(
+        stmt.returning(models.Villager.VillagerID).execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return deleted_ids
+
+@instrument_crud
 def delete_villager(db: Session, villager_id: int):
     """
     刪除村民資料
@@ -110,28 +433,73 @@ def delete_villager(db: Session, villager_id: int):
     Returns:
         bool: 刪除成功返回 True，未找到村民返回 False
     """
-    # 先確認是否存在
-    db_villager = db.query(models.Villager).filter(models.Villager.VillagerID == villager_id).first()
+    return bool(delete_villagers(db, villager_ids=[villager_id]))
+
+@instrument_crud
+def refresh_visit_counters(db: Session, villager_ids):
+    """
+    重新計算村民的家訪統計 (VisitCount, LastVisited)
     
-    if not db_villager:
-        return False
+    以單一 UPDATE 搭配關聯子查詢計算，只更新指定的村民；不會 commit，
+    由呼叫端與觸發異動的寫入在同一個交易中提交。
     
-    # 刪除相關的親屬關係 (先處理外鍵約束)
-    db.query(models.VillagerRelationship).filter(
-        (models.VillagerRelationship.SourceVillagerID == villager_id) | 
-        (models.VillagerRelationship.TargetVillagerID == villager_id)
-    ).delete()
+    Args:
+        db (Session): 資料庫連線
+        villager_ids (Iterable[int]): 需要重新計算的村民ID
+    """
+    villager_ids = set(villager_ids)
+    if not villager_ids:
+        return
+    
+    visit_count = (
+        select(func.count())
+        .select_from(models.VillagersAtRecord)
+        .where(models.VillagersAtRecord.Villager == models.Villager.VillagerID)
+        .scalar_subquery()
+    )
+    last_visited = (
+        select(func.max(models.Record.Date))
+        .select_from(models.VillagersAtRecord)
+        .join(models.Record, models.Record.RecordID == models.VillagersAtRecord.Record)
+        .where(models.VillagersAtRecord.Villager == models.Villager.VillagerID)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(models.Villager)
+        .where(models.Villager.VillagerID.in_(villager_ids))
+        .values(VisitCount=visit_count, LastVisited=last_visited)
+        .execution_options(synchronize_session=False)
+    )
+
+@instrument_crud
+def reconcile_visit_counters(db: Session, batch_size: int = 500):
+    """
+    依村民ID分批重新計算所有村民的家訪統計，每批各自提交（避免長時間鎖住整個資料表）
     
-    # 刪除村民與家訪紀錄的關聯
-    db.query(models.VillagersAtRecord).filter(
-        models.VillagersAtRecord.Villager == villager_id
-    ).delete()
+    Args:
+        db (Session): 資料庫連線
+        batch_size (int): 每批的村民數
     
-    # 刪除村民
-    db.delete(db_villager)
-    db.commit()
-    return True
+    Returns:
+        int: 重新計算的村民數
+    """
+    total = 0
+    after = 0
+    while True:
+        villager_ids = db.execute(
+            select(models.Villager.VillagerID)
+            .where(models.Villager.VillagerID > after)
+            .order_by(models.Villager.VillagerID)
+            .limit(batch_size)
+        ).scalars().all()
+        if not villager_ids:
+            return total
+        refresh_visit_counters(db, villager_ids)
+        db.commit()
+        total += len(villager_ids)
+        after = villager_ids[-1]
 
+@instrument_crud
 def get_villager_relationships(db: Session, villager_id: int):
     """
     取得村民的親屬關係
@@ -143,7 +511,28 @@ def get_villager_relationships(db: Session, villager_id: int):
     Returns:
         List[dict]: 親屬關係列表
     """
-    # 查詢該村民作為源頭的親屬關係
+    return get_relationships_for_villagers(db, [villager_id])[villager_id]
+
+@instrument_crud
+def get_relationships_for_villagers(db: Session, villager_ids):
+    """
+    批次取得多位村民的親屬關係
+    
+    不論村民數量，固定以兩次查詢（作為源頭、作為目標）取得所有關係。
+    
+    Args:
+        db (Session): 資料庫連線
+        villager_ids (Iterable[int]): 村民ID
+    
+    Returns:
+        Dict[int, List[dict]]: 村民ID 對應的親屬關係列表
+    """
+    villager_ids = list(dict.fromkeys(villager_ids))
+    relationships = {villager_id: [] for villager_id in villager_ids}
+    if not villager_ids:
+        return relationships
+    
+    # 查詢這些村民作為源頭的親屬關係
     source_relationships = (
         db.query(
             models.VillagerRelationship,
@@ -158,11 +547,11 @@ def get_villager_relationships(db: Session, villager_id: int):
             models.Villager, 
             models.VillagerRelationship.TargetVillagerID == models.Villager.VillagerID
         )
-        .filter(models.VillagerRelationship.SourceVillagerID == villager_id)
+        .filter(models.VillagerRelationship.SourceVillagerID.in_(villager_ids))
         .all()
     )
 
-    # 查詢該村民作為目標的親屬關係
+    # 查詢這些村民作為目標的親屬關係
     target_relationships = (
         db.query(
             models.VillagerRelationship,
@@ -177,16 +566,13 @@ def get_villager_relationships(db: Session, villager_id: int):
             models.Villager, 
             models.VillagerRelationship.SourceVillagerID == models.Villager.VillagerID
         )
-        .filter(models.VillagerRelationship.TargetVillagerID == villager_id)
+        .filter(models.VillagerRelationship.TargetVillagerID.in_(villager_ids))
         .all()
     )
 
-    # 整理結果
-    relationships = []
-    
     # 處理源頭關係
     for relationship, rel_type, relative_name in source_relationships:
-        relationships.append({
+        relationships[relationship.SourceVillagerID].append({
             'relationship_id': relationship.RelationshipID,
             'relative_id': relationship.TargetVillagerID,
             'relative_name': relative_name,
@@ -196,7 +582,7 @@ def get_villager_relationships(db: Session, villager_id: int):
     
     # 處理目標關係
     for relationship, rel_type, relative_name in target_relationships:
-        relationships.append({
+        relationships[relationship.TargetVillagerID].append({
             'relationship_id': relationship.RelationshipID,
             'relative_id': relationship.SourceVillagerID,
             'relative_name': relative_name,
@@ -206,6 +592,7 @@ def get_villager_relationships(db: Session, villager_id: int):
     
     return relationships
 
+@instrument_crud
 def create_relationship(db: Session, relationship: schemas.RelationshipCreate):
     """
     建立村民親屬關係
@@ -244,6 +631,131 @@ def create_relationship(db: Session, relationship: schemas.RelationshipCreate):
     db.refresh(new_relationship)
     return new_relationship
 
+@instrument_crud
+def bulk_create_relationships(db: Session, relationships: List[schemas.RelationshipCreate], dry_run: bool = False):
+    """
+    批次建立村民親屬關係
+
+    所有引用的村民與關係類型各用一次集合查詢驗證，重複的關係
+    (unique_relationship 約束) 在記憶體中比對，有效的關係在同一個交易中寫入。
+
+    Args:
+        db (Session): 資料庫連線
+        relationships (List[schemas.RelationshipCreate]): 親屬關係資料列表
+        dry_run (bool): 只驗證不寫入
+
+    Returns:
+        dict: created 為成功（或可建立）的關係，errors 為每筆失敗的原因
+    """
+    villager_ids = {r.source_villager_id for r in relationships} | {r.target_villager_id for r in relationships}
+    type_ids = {r.relationship_type_id for r in relationships}
+
+    # 集合查詢：一次確認所有村民與關係類型是否存在
+    existing_villagers = {
+        row.VillagerID for row in
+        db.query(models.Villager.VillagerID).filter(models.Villager.VillagerID.in_(villager_ids)).all()
+    }
+    existing_types = {
+        row.RelationshipTypeID for row in
+        db.query(models.RelationshipType.RelationshipTypeID).filter(
+            models.RelationshipType.RelationshipTypeID.in_(type_ids)
+        ).all()
+    }
+
+    # 已存在的關係 (對應 unique_relationship 約束)
+    existing_edges = set(
+        db.query(
+            models.VillagerRelationship.SourceVillagerID,
+            models.VillagerRelationship.TargetVillagerID,
+            models.VillagerRelationship.RelationshipTypeID
+        )
+        .filter(
+            models.VillagerRelationship.SourceVillagerID.in_({r.source_villager_id for r in relationships}),
+            models.VillagerRelationship.TargetVillagerID.in_({r.target_villager_id for r in relationships})
+        )
+        .all()
+    )
+
+    valid_rows = []
+    valid_indexes = []
+    errors = []
+
+    for index, relationship in enumerate(relationships):
+        edge = (relationship.source_villager_id, relationship.target_villager_id, relationship.relationship_type_id)
+
+        if relationship.source_villager_id not in existing_villagers:
+            error = "找不到來源村民"
+        elif relationship.target_villager_id not in existing_villagers:
+            error = "找不到目標村民"
+        elif relationship.relationship_type_id not in existing_types:
+            error = "找不到指定的關係類型"
+        elif edge in existing_edges:
+            error = "親屬關係已存在"
+        else:
+            error = None
+
+        if error:
+            errors.append({
+                "index": index,
+                "source_villager_id": relationship.source_villager_id,
+                "target_villager_id": relationship.target_villager_id,
+                "relationship_type_id": relationship.relationship_type_id,
+                "error": error
+            })
+            continue
+
+        # 同一批次內的重複也視為已存在
+        existing_edges.add(edge)
+        valid_indexes.append(index)
+        valid_rows.append({
+            "SourceVillagerID": relationship.source_villager_id,
+            "TargetVillagerID": relationship.target_villager_id,
+            "RelationshipTypeID": relationship.relationship_type_id
+        })
+
+    if dry_run or not valid_rows:
+        created = [
+            {
+                "index": index,
+                "relationship_id": None,
+                "source_villager_id": row["SourceVillagerID"],
+                "target_villager_id": row["TargetVillagerID"],
+                "relationship_type_id": row["RelationshipTypeID"]
+            }
+            for index, row in zip(valid_indexes, valid_rows)
+        ]
+        return {"created": created, "errors": errors}
+
+    # 單一交易批次寫入
+    try:
+        inserted = db.execute(
+            insert(models.VillagerRelationship).returning(
+                models.VillagerRelationship.RelationshipID,
+                models.VillagerRelationship.SourceVillagerID,
+                models.VillagerRelationship.TargetVillagerID,
+                models.VillagerRelationship.RelationshipTypeID,
+                sort_by_parameter_order=True
+            ),
+            valid_rows
+        ).all()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise ValueError(f"批次寫入親屬關係失敗: {e.orig}")
+
+    created = [
+        {
+            "index": index,
+            "relationship_id": row.RelationshipID,
+            "source_villager_id": row.SourceVillagerID,
+            "target_villager_id": row.TargetVillagerID,
+            "relationship_type_id": row.RelationshipTypeID
+        }
+        for index, row in zip(valid_indexes, inserted)
+    ]
+    return {"created": created, "errors": errors}
+
+@instrument_crud
 def delete_relationship(db: Session, relationship_id: int):
     """
     刪除村民親屬關係
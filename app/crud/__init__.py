@@ -1,4 +1,4 @@
 # Import all CRUD modules
-from app.crud.Location import get_locations, add_location, update_location, delete_location
-from app.crud.Record import get_records, get_record_by_location, get_record_by_location_with_details, get_students_by_record, get_villagers_by_record
-from app.crud.Villager import get_villager_by_id, get_villagers, get_villagers_by_location, create_villager, update_villager, delete_villager, create_relationship, delete_relationship, get_villager_relationships
\ No newline at end of file
+from app.crud.Location import get_locations, get_location_rows, get_cached_location_rows, get_locations_json, add_location, update_location, delete_location
+from app.crud.Record import get_records, get_record_by_location, get_record_by_location_with_details, get_students_by_record, get_villagers_by_record, add_villagers_to_record, remove_villager_from_record, get_records_by_location_json, get_records_by_villager, get_recent_records_by_location, get_record_participants
+from app.crud.Villager import get_villager_by_id, get_villagers, count_villagers, get_villagers_by_location, get_villagers_by_location_json, create_villager, bulk_create_villagers, update_villager, delete_villager, delete_villagers, refresh_visit_counters, reconcile_visit_counters, create_relationship, bulk_create_relationships, delete_relationship, get_villager_relationships, get_relationships_for_villagers
\ No newline at end of file
@@ -6,40 +6,59 @@ from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
 
+from app import config
+from app.utils.instrumentation import timed
+from app.utils.memory import session_tracker
+
 # 載入 .env 變數
 load_dotenv()
 
 # **取得資料庫連線字串**
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# **連接池大小（准入控制依此決定同時使用資料庫的請求數）**
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+
+# **連線參數（主連接池與其他直接建立的連線共用，例如排程的 leader 選舉連線）**
+CONNECT_ARGS = {
+    "sslmode": "require",
+    "connect_timeout": 10,  # 縮短連接超時
+    # 查詢超時（DB_STATEMENT_TIMEOUT_MS，0 為不限制）
+    **({"options": f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}"} if config.DB_STATEMENT_TIMEOUT_MS else {})
+}
+
 # **修復連接洩漏的資料庫連線設定**
 engine = create_engine(
     DATABASE_URL, 
-    connect_args={
-        "sslmode": "require",
-        "connect_timeout": 10,  # 縮短連接超時
-        # "options": "-c statement_timeout=10000"  # 縮短查詢超時到10秒
-    },
+    connect_args=CONNECT_ARGS,
     # 嚴格的連接池設定防止洩漏
-    pool_size=5,  # 減少基本連接池大小
-    max_overflow=10,  # 減少額外連接數
+    pool_size=POOL_SIZE,  # 減少基本連接池大小
+    max_overflow=MAX_OVERFLOW,  # 減少額外連接數
     pool_timeout=20,  # 縮短獲取連接的超時時間
     pool_recycle=1800,  # 30分鐘後回收連接（更頻繁）
     pool_pre_ping=True,  # 使用前檢查連接是否有效
     
-    # 新增：強制回收閒置連接
-    pool_reset_on_return='commit',  # 返回時重置連接狀態
+    # 連線歸還時回滾（寫入路徑皆已明確 commit，唯讀請求不需額外 COMMIT）
+    pool_reset_on_return='rollback',
     echo=False  # 生產環境關閉 SQL 日誌
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# **唯讀 session**
+# PostgreSQL 上以 BEGIN READ ONLY 開始交易（由 psycopg2 送出，不需額外往返），
+# 連線歸還連接池時自動重設為一般模式
+read_only_engine = engine.execution_options(postgresql_readonly=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_only_engine)
+
 # **改進的 DB session 函數 - 防止連接洩漏**
 def get_db():
     db = None
     try:
         db = SessionLocal()
+        session_tracker.track(db)
         yield db
     except Exception as e:
         if db:
@@ -49,10 +68,35 @@ def get_db():
     finally:
         if db:
             try:
-                db.close()
+                session_tracker.closing(db)
+                with timed("session"):
+                    db.close()
             except Exception as close_error:
                 print(f"Error closing database session: {close_error}")
 
+# **GET 路由使用的唯讀 DB session**
+def get_read_db():
+    """
+    提供唯讀 session：直到第一個查詢才向連接池取得連線（由快取回應或驗證失敗的請求不佔用連線），
+    交易為 READ ONLY，結束時一律回滾並歸還連線
+    """
+    db = ReadSessionLocal()
+    session_tracker.track(db)
+    try:
+        yield db
+    finally:
+        try:
+            session_tracker.closing(db)
+            with timed("session"):
+                db.close()
+        except Exception as close_error:
+            print(f"Error closing database session: {close_error}")
+
+# **是否由資料庫組出 JSON 回應**
+def use_db_json_aggregation(db) -> bool:
+    """DB_JSON_AGGREGATION 開啟且連線的是 PostgreSQL 時回傳 True"""
+    return config.DB_JSON_AGGREGATION and db.get_bind().dialect.name == "postgresql"
+
 # **添加連接池監控函數**
 def get_pool_status():
     """獲取連接池狀態用於監控"""
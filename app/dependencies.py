@@ -0,0 +1,22 @@
+# Purpose: 共用的 FastAPI 依賴
+
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+from app import config
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理端點：檢查 X-Admin-Token 標頭與 ADMIN_TOKEN 相同，未設定 ADMIN_TOKEN 時一律拒絕"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="管理功能未啟用"
+        )
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, config.ADMIN_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="管理權杖無效"
+        )
@@ -1,24 +1,138 @@
 # Purpose: FastAPI 應用程式的進入點
 
-from fastapi import FastAPI
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.router import locations, record, villagers
-from app.database import Base, engine, get_pool_status
+from app.router import locations, record, villagers, batch, admin
+from app import config
+from app.crud import Location, Villager
+from app.database import Base, engine, SessionLocal, ReadSessionLocal, get_pool_status, POOL_SIZE, MAX_OVERFLOW
+from app.migrations import run_migrations
 from app.utils.connection_monitor import connection_monitor
-import threading
-import time
-import requests
+from app.utils.leak_tracer import leak_tracer
+from app.utils.admission import AdmissionController, AdmissionMiddleware
+from app.utils.request_context import RequestContextMiddleware
+from app.utils import query_counter
+from app.utils.slow_query import slow_query_recorder
+from app.utils import metrics
+from app.utils.cache import query_cache
+from app.utils.write_tracker import write_tracker
+from app.utils.instrumentation import ServerTimingMiddleware
+from app.utils import tracing
+from app.utils.memory import session_tracker
+from app.utils.startup import startup_state, warm_pool
+from app.utils.scheduler import scheduler
+from app.utils.read_model import read_model
+from app.services.read_model import SNAPSHOT_SOURCES, refresh_read_model
 import logging
 
+startup_state.record("import", time.perf_counter() - _IMPORT_STARTED)
+
 # 設置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# **建立資料表**
-Base.metadata.create_all(bind=engine)
+
+def init_schema():
+    """建立資料表並套用結構遷移"""
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+
+# **建立資料表並套用結構遷移（SCHEMA_INIT=background / skip 時延後或略過）**
+if config.SCHEMA_INIT == "startup":
+    with startup_state.phase("schema"):
+        init_schema()
+
+
+def warm_caches():
+    """預先執行地點列表與村民數量查詢（編譯語句快取、載入村民數量快取）"""
+    db = ReadSessionLocal()
+    try:
+        Location.get_location_rows(db)
+        Villager.count_villagers(db)
+    finally:
+        db.close()
+
+
+def warm_up_steps():
+    """背景暖機步驟：(名稱, callable, 是否必要)"""
+    steps = []
+    if config.SCHEMA_INIT == "background":
+        steps.append(("schema", init_schema, True))
+    if config.WARM_UP:
+        steps.append(("pool", lambda: warm_pool(engine, config.WARM_POOL_CONNECTIONS), False))
+        steps.append(("cache", warm_caches, False))
+        if read_model.enabled:
+            steps.append(("read-model", refresh_read_model, False))
+    return steps
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """開始服務時啟動背景暖機與定期工作排程，關閉時停止排程（等待執行中的工作）"""
+    steps = warm_up_steps()
+    if steps:
+        startup_state.start_warm_up(steps)
+    else:
+        startup_state.run_warm_up(steps)
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    cleanup()
+
 
 # **FastAPI 應用程式**
-app = FastAPI()
+_APP_STARTED = time.perf_counter()
+app = FastAPI(lifespan=lifespan)
+
+# **准入控制：同時使用資料庫的請求數不超過連接池容量**
+# 須在 CORS 之前加入，503 回應才會帶有 CORS 標頭
+admission_controller = AdmissionController(capacity=POOL_SIZE + MAX_OVERFLOW)
+if config.ADMISSION_CONTROL:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# **Prometheus 指標：延遲與回應大小直方圖、處理中請求數、連接池等待時間、快取命中**
+# 加在准入控制之外（延遲包含排隊時間）、查詢計數之內（可讀取該請求的 SQL 數量）
+if config.METRICS:
+    metrics.instrument_engine(engine)
+    metrics.track_cache(query_cache)
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# **Server-Timing：各階段耗時，須在查詢計數之內（讀取該請求的 SQL 時間）**
+app.add_middleware(ServerTimingMiddleware, sample_rate=config.SERVER_TIMING_SAMPLE_RATE)
+
+# **記錄各路由 session 載入的 ORM 物件數（/api/admin/memory）**
+session_tracker.install()
+
+# **共用唯讀快照：寫入來源資料表的交易提交後讓對應的快照資料表過期**
+if read_model.enabled:
+    read_model.install(SNAPSHOT_SOURCES)
+
+# **查詢快取：寫入資料表的交易提交後遞增該資料表的版本（redis 後端時所有 worker 與機器共用版本）**
+write_tracker.subscribe(query_cache.bump_tables)
+write_tracker.install()
+
+# **請求追蹤（span 寫入 TRACE_FILE）**
+if config.TRACING:
+    tracing.install(engine)
+    app.add_middleware(tracing.TracingMiddleware, tracer=tracing.tracer)
+
+# **統計每個請求的查詢數與資料庫時間，偵測 N+1**
+if config.QUERY_COUNTER:
+    query_counter.install(engine)
+    app.add_middleware(query_counter.QueryCounterMiddleware, n_plus_one_threshold=config.N_PLUS_ONE_THRESHOLD)
+
+# **記錄超過 SLOW_QUERY_MS 的查詢**
+if config.SLOW_QUERY_MS > 0:
+    slow_query_recorder.install(engine)
+
+# **記錄目前請求的路由（連接池追蹤等使用）**
+app.add_middleware(RequestContextMiddleware)
 
 # **設定 CORS**
 app.add_middleware(
@@ -33,12 +147,24 @@ app.add_middleware(
 app.include_router(locations.router, prefix="/api")
 app.include_router(record.router, prefix="/api")
 app.include_router(villagers.router, prefix="/api")
+app.include_router(batch.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+startup_state.record("app", time.perf_counter() - _APP_STARTED)
 
 # **測試 API**
 @app.get("/")
 def read_root():
     return {"message": "FastAPI 伺服器運行中"}
 
+# **就緒檢查：背景暖機（與延後的結構初始化）完成前回傳 503**
+@app.get("/ready")
+def get_readiness():
+    """暖機完成時回傳 200，否則 503（含各啟動階段耗時）"""
+    return JSONResponse(
+        status_code=200 if startup_state.ready else 503,
+        content=startup_state.status()
+    )
+
 # **連接池監控端點**
 @app.get("/api/pool-status")
 def get_connection_pool_status():
@@ -48,6 +174,8 @@ def get_connection_pool_status():
         return {
             "status": "ok",
             "pool_info": status,
+            "admission": admission_controller.stats(),
+            "monitor": connection_monitor.stats(),
             "timestamp": time.time()
         }
     except Exception as e:
@@ -57,69 +185,85 @@ def get_connection_pool_status():
             "timestamp": time.time()
         }
 
-# **改進的 Keep Alive 機制**
-KEEP_ALIVE_URL = "https://kanahcian-backend.onrender.com/"
-KEEP_ALIVE_INTERVAL = 300  # 改為 5 分鐘（減少頻率）
+# **Prometheus 指標端點**
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=metrics.registry.collect(), media_type=metrics.CONTENT_TYPE)
 
-# 添加停止標誌
-keep_alive_stop_event = threading.Event()
+# **連線洩漏追蹤端點**
+@app.get("/api/pool-status/leaks")
+def get_connection_leaks(min_seconds: float = Query(1.0, ge=0, description="只列出持有超過此秒數的連線")):
+    """列出長時間借出的連線（含路由與呼叫堆疊）及各路由的連線持有時間直方圖"""
+    return {
+        "status": "ok",
+        "tracer_enabled": leak_tracer.enabled,
+        "held_connections": connection_monitor.held_connections(min_seconds=min_seconds),
+        "routes": leak_tracer.route_histograms(),
+        "timestamp": time.time()
+    }
+
+# **Keep Alive：定期請求自己的網址，避免 Render 閒置休眠**
+_keep_alive_session = None
 
 def keep_alive():
-    """改進的 Keep Alive 函數，避免連接洩漏"""
-    initial_delay = 60
-    time.sleep(initial_delay)
-    
-    session = requests.Session()  # 重用 session
-    session.timeout = 10  # 設置超時
-    
+    """請求一次 /api/pool-status 並記錄連線數（由排程執行，失敗時拋出例外）"""
+    global _keep_alive_session
+    # 只有背景工作使用 requests，延後匯入以縮短冷啟動
+    import requests
+
+    if _keep_alive_session is None:
+        _keep_alive_session = requests.Session()  # 重用 session
+    response = _keep_alive_session.get(f"{config.KEEP_ALIVE_URL}api/pool-status", timeout=10)
+    if response.status_code != 200:
+        logger.warning(f"Keep-alive failed with status: {response.status_code}")
+        return
+
+    checked_out = response.json().get('pool_info', {}).get('checked_out', 0)
+    logger.info(f"Keep-alive successful. Active connections: {checked_out}")
+    # 如果連接數過高，發出警告
+    if checked_out > 15:
+        logger.warning(f"High connection count detected: {checked_out}")
+
+
+def refresh_caches():
+    """在 query_cache 過期前重新查詢村民總數（未篩選的列表第一頁）"""
+    db = ReadSessionLocal()
     try:
-        while not keep_alive_stop_event.is_set():
-            try:
-                # 使用更輕量的端點
-                response = session.get(f"{KEEP_ALIVE_URL}api/pool-status", timeout=10)
-                
-                if response.status_code == 200:
-                    pool_info = response.json().get('pool_info', {})
-                    checked_out = pool_info.get('checked_out', 0)
-                    
-                    logger.info(f"Keep-alive successful. Active connections: {checked_out}")
-                    
-                    # 如果連接數過高，發出警告
-                    if checked_out > 15:
-                        logger.warning(f"High connection count detected: {checked_out}")
-                else:
-                    logger.warning(f"Keep-alive failed with status: {response.status_code}")
-                    
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Keep-alive request failed: {e}")
-            except Exception as e:
-                logger.error(f"Keep-alive unexpected error: {e}")
-            
-            # 等待下一次請求，但檢查停止事件
-            if not keep_alive_stop_event.wait(KEEP_ALIVE_INTERVAL):
-                continue
-            else:
-                break
-                
+        Villager.count_villagers(db, refresh=True)
     finally:
-        session.close()
-        logger.info("Keep-alive thread stopped")
+        db.close()
 
-# **啟動 Keep Alive 背景執行緒**
-keep_alive_thread = threading.Thread(target=keep_alive, daemon=True)
-keep_alive_thread.start()
 
-# **優雅關閉處理**
-import atexit
+def reconcile_visit_stats():
+    """重新計算所有村民的家訪統計"""
+    db = SessionLocal()
+    try:
+        total = Villager.reconcile_visit_counters(db)
+        logger.info(f"Visit counters reconciled for {total} villagers")
+    finally:
+        db.close()
 
+
+# **背景定期工作（singleton 工作在多個 worker 中只由一個執行）**
+scheduler.add_job("pool-check", connection_monitor.tick, connection_monitor.check_interval)
+if config.METRICS and metrics.registry.multiprocess_dir:
+    scheduler.add_job("metrics-flush", metrics.registry.flush, 10)
+if config.KEEP_ALIVE_URL and config.KEEP_ALIVE_INTERVAL > 0:
+    scheduler.add_job("keep-alive", keep_alive, config.KEEP_ALIVE_INTERVAL, singleton=True, initial_delay=60)
+if config.CACHE_REFRESH_INTERVAL > 0:
+    scheduler.add_job("cache-refresh", refresh_caches, config.CACHE_REFRESH_INTERVAL)
+if config.VISIT_STATS_INTERVAL > 0:
+    scheduler.add_job("visit-stats", reconcile_visit_stats, config.VISIT_STATS_INTERVAL, singleton=True)
+# 每個 worker 都檢查，實際重建由檔案鎖確保同一台機器只有一個 worker 執行
+if read_model.enabled:
+    scheduler.add_job("read-model", refresh_read_model, config.READ_MODEL_REFRESH_INTERVAL)
+
+# **優雅關閉處理**
 def cleanup():
-    """應用程式關閉時的清理函數"""
+    """應用程式關閉時的清理函數（由 lifespan 在關閉時呼叫）"""
     logger.info("Shutting down application...")
-    keep_alive_stop_event.set()
-    
-    # 等待 keep_alive 線程結束
-    if keep_alive_thread.is_alive():
-        keep_alive_thread.join(timeout=5)
+    if _keep_alive_session is not None:
+        _keep_alive_session.close()
     
     # 關閉資料庫連接池
     try:
@@ -128,10 +272,11 @@ def cleanup():
     except Exception as e:
         logger.error(f"Error disposing database connections: {e}")
 
-atexit.register(cleanup)
-
 
-connection_monitor.start_monitoring()
+if config.POOL_LEAK_TRACER:
+    leak_tracer.enable(connection_monitor)
+# 連接池事件在匯入時註冊，定期檢查（pool-check）於 lifespan 開始時由排程執行
+connection_monitor.attach()
 
 # **啟動指令**
 # uvicorn app.main:app --reload
@@ -0,0 +1,133 @@
+# Purpose: 既有資料庫的結構遷移
+#
+# Base.metadata.create_all 只會建立不存在的資料表，不會修改既有資料表的欄位或約束。
+# 這裡的遷移依序執行、每個只執行一次（記錄於 schema_migrations 資料表），僅支援 PostgreSQL。
+
+import logging
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+# 遷移用的 advisory lock 鍵值
+MIGRATION_LOCK_KEY = 727001
+
+# (名稱, SQL 陳述式列表)，只能在尾端新增；陳述式也可以是 callable(conn)，回傳依現有結構產生的陳述式列表
+MIGRATIONS = [
+    (
+        "0001_villager_on_delete_cascade",
+        [
+            lambda conn: _cascade_villager_fk(conn, "VillagerRelationship", "SourceVillagerID"),
+            lambda conn: _cascade_villager_fk(conn, "VillagerRelationship", "TargetVillagerID"),
+            # 串聯刪除依 TargetVillagerID 查找，需要索引（SourceVillagerID 已由 unique_relationship 涵蓋）
+            '''CREATE INDEX IF NOT EXISTS "ix_VillagerRelationship_TargetVillagerID"
+                ON "VillagerRelationship" ("TargetVillagerID")''',
+            lambda conn: _cascade_villager_fk(conn, "Villagers_at_record", "Villager", schema="public"),
+        ],
+    ),
+    (
+        "0002_villager_visit_counters",
+        [
+            '''ALTER TABLE "Villager"
+                ADD COLUMN IF NOT EXISTS "VisitCount" INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS "LastVisited" DATE''',
+            '''CREATE INDEX IF NOT EXISTS "ix_Villager_LastVisited_VillagerID"
+                ON "Villager" ("LastVisited" NULLS FIRST, "VillagerID")''',
+            # 以既有的家訪紀錄回填統計
+            '''UPDATE "Villager" AS v SET
+                "VisitCount" = stats.visit_count,
+                "LastVisited" = stats.last_visited
+            FROM (
+                SELECT var."Villager" AS villager_id,
+                       count(*) AS visit_count,
+                       max(r."Date") AS last_visited
+                FROM public."Villagers_at_record" AS var
+                JOIN "Record" AS r ON r."RecordID" = var."Record"
+                GROUP BY var."Villager"
+            ) AS stats
+            WHERE stats.villager_id = v."VillagerID"''',
+        ],
+    ),
+]
+
+
+def _cascade_villager_fk(conn, table, column, schema=None):
+    """
+    讓 table.column 參照 Villager 的外鍵改為 ON DELETE CASCADE
+
+    外鍵名稱由 inspector 取得（不假設預設名稱）；已是 CASCADE 的外鍵保留，
+    其餘刪除後以原名稱重建，沒有任何外鍵時以預設名稱新增。
+
+    Returns:
+        List[str]: 要執行的 SQL 陳述式
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    qualified = f"{quote(schema)}.{quote(table)}" if schema else quote(table)
+    foreign_keys = [
+        fk for fk in inspect(conn).get_foreign_keys(table, schema=schema)
+        if fk["constrained_columns"] == [column] and fk["referred_table"] == "Villager"
+    ]
+    if any((fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE" for fk in foreign_keys):
+        # 已有 CASCADE 外鍵，只移除重複的非 CASCADE 外鍵
+        return [
+            f"ALTER TABLE {qualified} DROP CONSTRAINT {quote(fk['name'])}"
+            for fk in foreign_keys
+            if (fk.get("options") or {}).get("ondelete", "").upper() != "CASCADE"
+        ]
+
+    names = [fk["name"] for fk in foreign_keys] or [f"{table}_{column}_fkey"]
+    actions = [f"DROP CONSTRAINT {quote(name)}" for name in names if foreign_keys]
+    actions.append(
+        f"ADD CONSTRAINT {quote(names[0])} "
+        f"FOREIGN KEY ({quote(column)}) REFERENCES {quote('Villager')} ({quote('VillagerID')}) ON DELETE CASCADE"
+    )
+    return [f"ALTER TABLE {qualified} " + ", ".join(actions)]
+
+
+def run_migrations(engine):
+    """
+    執行尚未套用的遷移
+
+    Args:
+        engine: SQLAlchemy engine
+
+    Returns:
+        List[str]: 本次套用的遷移名稱
+    """
+    if engine.dialect.name != "postgresql":
+        logger.info(f"Skipping schema migrations on {engine.dialect.name}")
+        return []
+
+    applied = []
+    with engine.connect() as conn:
+        # 多個 worker 同時啟動時，以 advisory lock 確保只有一個在執行遷移
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.commit()
+        try:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "name VARCHAR(100) PRIMARY KEY, "
+                "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+            ))
+            done = set(conn.execute(text("SELECT name FROM schema_migrations")).scalars())
+            conn.commit()
+
+            for name, statements in MIGRATIONS:
+                if name in done:
+                    continue
+                # 每個遷移在自己的交易中執行，失敗時整個遷移回滾
+                try:
+                    for statement in statements:
+                        for sql in (statement(conn) if callable(statement) else [statement]):
+                            conn.execute(text(sql))
+                    conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                logger.info(f"Applied schema migration {name}")
+                applied.append(name)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+
+    return applied
@@ -1,6 +1,6 @@
 # Purpose: Define the database schema
 
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Date, CHAR, ARRAY, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Date, CHAR, ARRAY, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -42,22 +42,34 @@ class Villager(Base):
     Location = Column(Integer, ForeignKey("Location.LocationID"))
     ContactInfo = Column(Text)
     
-    records = relationship("VillagersAtRecord", back_populates="villager")
+    # 家訪統計（反正規化欄位，由家訪紀錄與村民關聯異動時維護）
+    VisitCount = Column(Integer, nullable=False, default=0, server_default="0")
+    LastVisited = Column(Date)
+    
+    # 關聯資料由資料庫 ON DELETE CASCADE 刪除，ORM 不需先載入
+    records = relationship("VillagersAtRecord", back_populates="villager", passive_deletes=True)
     location = relationship("Location", back_populates="villagers")
 
     # 新增關聯關係
     relationships_as_source = relationship("VillagerRelationship", 
                                           foreign_keys="VillagerRelationship.SourceVillagerID",
-                                          back_populates="source_villager")
+                                          back_populates="source_villager",
+                                          passive_deletes=True)
     relationships_as_target = relationship("VillagerRelationship", 
                                           foreign_keys="VillagerRelationship.TargetVillagerID",
-                                          back_populates="target_villager")
+                                          back_populates="target_villager",
+                                          passive_deletes=True)
     
     # 輔助方法：獲取所有關係（無論是源還是目標）
     @property
     def all_relationships(self):
         return self.relationships_as_source + self.relationships_as_target
 
+    __table_args__ = (
+        # 支援「最久未家訪」排序的 keyset 分頁
+        Index("ix_Villager_LastVisited_VillagerID", LastVisited.asc().nulls_first(), VillagerID),
+    )
+
 class Record(Base):
     __tablename__ = "Record"
     
@@ -93,7 +105,7 @@ class StudentsAtRecord(Base):
 class VillagersAtRecord(Base):
     __tablename__ = "Villagers_at_record"
     
-    Villager = Column(Integer, ForeignKey("Villager.VillagerID"), primary_key=True)
+    Villager = Column(Integer, ForeignKey("Villager.VillagerID", ondelete="CASCADE"), primary_key=True)
     Record = Column(Integer, ForeignKey("Record.RecordID"), primary_key=True)
     
     # 關聯關係
@@ -121,8 +133,8 @@ class VillagerRelationship(Base):
     __tablename__ = "VillagerRelationship"
     
     RelationshipID = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    SourceVillagerID = Column(Integer, ForeignKey("Villager.VillagerID"), nullable=False)  # 關係源，例如父親
-    TargetVillagerID = Column(Integer, ForeignKey("Villager.VillagerID"), nullable=False)  # 關係目標，例如兒子
+    SourceVillagerID = Column(Integer, ForeignKey("Villager.VillagerID", ondelete="CASCADE"), nullable=False)  # 關係源，例如父親
+    TargetVillagerID = Column(Integer, ForeignKey("Villager.VillagerID", ondelete="CASCADE"), nullable=False, index=True)  # 關係目標，例如兒子
     RelationshipTypeID = Column(Integer, ForeignKey("RelationshipType.RelationshipTypeID"), nullable=False)
     
     # 關聯關係
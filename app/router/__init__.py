@@ -1,7 +1,7 @@
 # app/crud/__init__.py - 修復版本
 
 # Import Location CRUD
-from app.crud.Location import get_locations, add_location, update_location, delete_location
+from app.crud.Location import get_locations, get_location_rows, get_cached_location_rows, get_locations_json, add_location, update_location, delete_location
 
 # Import Record CRUD - 確保所有函數都存在
 from app.crud.Record import (
@@ -9,6 +9,7 @@ from app.crud.Record import (
     get_all_records, 
     get_record_by_id, 
     get_records_by_location, 
+    get_records_by_location_json, 
     get_records_by_account, 
     get_records_by_semester,
     create_record, 
@@ -16,6 +17,11 @@ from app.crud.Record import (
     delete_record,
     get_records_count,
     get_records_count_by_location,
+    add_villagers_to_record,
+    remove_villager_from_record,
+    get_records_by_villager,
+    get_recent_records_by_location,
+    get_record_participants,
     
     # 舊版兼容函數
     get_records,
@@ -29,11 +35,19 @@ from app.crud.Record import (
 from app.crud.Villager import (
     get_villager_by_id, 
     get_villagers, 
+    count_villagers, 
     get_villagers_by_location, 
+    get_villagers_by_location_json, 
     create_villager, 
+    bulk_create_villagers, 
     update_villager, 
     delete_villager, 
+    delete_villagers, 
+    refresh_visit_counters, 
+    reconcile_visit_counters, 
     create_relationship, 
+    bulk_create_relationships, 
     delete_relationship, 
-    get_villager_relationships
+    get_villager_relationships,
+    get_relationships_for_villagers
 )
\ No newline at end of file
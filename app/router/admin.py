@@ -0,0 +1,211 @@
+# Purpose: 管理與診斷 API（需要 X-Admin-Token）
+
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse, Response
+
+from ..dependencies import require_admin
+from ..utils.slow_query import slow_query_recorder
+from ..utils.tracing import tracer, render_waterfall
+from ..utils.profiler import SamplingProfiler, ProfilerBusy
+from ..utils.fast_json import dumps
+from ..utils.memory import snapshot_store, session_tracker, largest_responses, process_memory
+from ..utils.instrumentation import TimedRoute
+from ..utils.scheduler import scheduler
+from ..utils.read_model import read_model
+from ..utils.cache import query_cache
+from ..services.read_model import refresh_read_model
+
+router = APIRouter(tags=["Admin"], route_class=TimedRoute, dependencies=[Depends(require_admin)])
+
+# **慢查詢紀錄**
+@router.get("/admin/slow-queries", response_model=dict)
+def get_slow_queries(limit: int = Query(50, ge=1, le=1000, description="回傳最近幾筆慢查詢")):
+    """最近的慢查詢，以及依語句形狀彙整的次數、時間與 EXPLAIN 執行計畫"""
+    return {
+        "status": "success",
+        "data": {
+            "threshold_ms": round(slow_query_recorder.threshold * 1000, 1),
+            "explain": slow_query_recorder.explain,
+            "recent": slow_query_recorder.entries(limit),
+            "shapes": slow_query_recorder.shapes(),
+        }
+    }
+
+# **清除慢查詢紀錄**
+@router.delete("/admin/slow-queries", response_model=dict)
+def clear_slow_queries():
+    slow_query_recorder.clear()
+    return {"status": "success", "message": "已清除慢查詢紀錄"}
+
+# **最近保留的 trace**
+@router.get("/admin/traces", response_model=dict)
+def get_traces(limit: int = Query(20, ge=1, le=200)):
+    """最近保留的 trace 摘要（head sampling 抽中或超過 TRACE_SLOW_MS）"""
+    return {
+        "status": "success",
+        "data": [
+            {
+                "trace_id": record["trace_id"],
+                "name": record["name"],
+                "duration_ms": record["duration_ms"],
+                "started_at": record["started_at"],
+                "retained_by": record["retained_by"],
+                "spans": len(record["spans"]),
+            }
+            for record in tracer.recent()[:limit]
+        ],
+        "stats": tracer.stats()
+    }
+
+# **單一 trace（JSON 或文字瀑布圖）**
+@router.get("/admin/traces/{trace_id}")
+def get_trace(trace_id: str, view: str = Query("json", pattern="^(json|waterfall)$")):
+    record = tracer.get(trace_id)
+    if record is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="找不到對應的 trace（可能已不在最近的紀錄中，請查看 TRACE_FILE）"
+        )
+    if view == "waterfall":
+        return PlainTextResponse(render_waterfall(record))
+    return {"status": "success", "data": record}
+
+# **取樣式效能分析**
+@router.get("/admin/profile")
+def profile_worker(
+    seconds: float = Query(10, gt=0, le=60, description="取樣秒數"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="取樣間隔（毫秒）"),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$", description="collapsed 或 speedscope"),
+    include_idle: bool = Query(False, description="是否計入閒置中的執行緒")
+):
+    """
+    在處理此請求的 worker 中取樣所有執行緒的呼叫堆疊 seconds 秒，回傳 flame graph 資料
+    
+    collapsed 可交給 flamegraph.pl，speedscope 可直接拖進 https://www.speedscope.app
+    """
+    profiler = SamplingProfiler(interval=interval_ms / 1000, include_idle=include_idle)
+    try:
+        profiler.run(seconds)
+    except ProfilerBusy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="已有另一個效能分析正在執行"
+        )
+    
+    headers = {"X-Profile-Samples": str(profiler.sample_count)}
+    if format == "speedscope":
+        headers["Content-Disposition"] = 'attachment; filename="profile.speedscope.json"'
+        return Response(content=dumps(profiler.speedscope()), media_type="application/json", headers=headers)
+    return PlainTextResponse(profiler.collapsed(), headers=headers)
+
+# **記憶體概況**
+@router.get("/admin/memory", response_model=dict)
+def get_memory_overview():
+    """行程記憶體、tracemalloc 狀態、session identity map 大小與最大的回應"""
+    return {
+        "status": "success",
+        "data": {
+            "process": process_memory(),
+            "tracemalloc": snapshot_store.status(),
+            "live_sessions": session_tracker.live_sessions(),
+            "identity_map_peaks": session_tracker.route_peaks(),
+            "largest_responses": largest_responses.top(),
+        }
+    }
+
+# **開始 / 停止 tracemalloc**
+@router.post("/admin/memory/tracemalloc", response_model=dict)
+def start_tracemalloc(frames: int = Query(25, ge=1, le=100, description="每個配置保存的堆疊深度")):
+    snapshot_store.start(frames)
+    return {"status": "success", "data": snapshot_store.status()}
+
+@router.delete("/admin/memory/tracemalloc", response_model=dict)
+def stop_tracemalloc():
+    snapshot_store.stop()
+    return {"status": "success", "message": "已停止 tracemalloc 並清除快照"}
+
+# **tracemalloc 快照**
+@router.post("/admin/memory/snapshots", response_model=dict, status_code=status.HTTP_201_CREATED)
+def take_memory_snapshot():
+    try:
+        snapshot_id = snapshot_store.take()
+    except RuntimeError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="尚未開始 tracemalloc"
+        )
+    return {"status": "success", "data": {"id": snapshot_id, **snapshot_store.status()}}
+
+@router.get("/admin/memory/snapshots/diff", response_model=dict)
+def diff_memory_snapshots(
+    base: int,
+    target: int,
+    limit: int = Query(20, ge=1, le=200),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$")
+):
+    """target 相對於 base 增加最多的配置位置"""
+    try:
+        data = snapshot_store.diff(base, target, limit, group_by)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"找不到快照 {e.args[0]}"
+        )
+    return {"status": "success", "data": data}
+
+@router.get("/admin/memory/snapshots/{snapshot_id}", response_model=dict)
+def get_memory_snapshot_top(
+    snapshot_id: int,
+    limit: int = Query(20, ge=1, le=200),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$")
+):
+    """快照中配置最多的位置"""
+    try:
+        data = snapshot_store.top(snapshot_id, limit, group_by)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"找不到快照 {snapshot_id}"
+        )
+    return {"status": "success", "data": data}
+
+# **背景定期工作**
+@router.get("/admin/scheduler", response_model=dict)
+def get_scheduler_jobs():
+    """各背景工作的間隔、執行次數、失敗與略過次數、最近一次耗時與錯誤"""
+    return {"status": "success", "data": {"started": scheduler.started, "jobs": scheduler.stats()}}
+
+# **立即執行一次背景工作**
+@router.post("/admin/scheduler/{job_name}/run", response_model=dict)
+async def run_scheduler_job(job_name: str):
+    job = scheduler.jobs.get(job_name)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到背景工作")
+    if job.running is not None and not job.running.done():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="背景工作執行中")
+    job.running = asyncio.create_task(scheduler.run_job(job), name=f"job:{job.name}")
+    await job.running
+    return {"status": "success", "data": scheduler.stats()[job_name]}
+
+# **共用唯讀快照**
+@router.get("/admin/read-model", response_model=dict)
+def get_read_model():
+    """快照版本、大小、各資料表列數、是否過期，以及命中與重建次數"""
+    return {"status": "success", "data": read_model.status()}
+
+# **立即重建共用唯讀快照**
+@router.post("/admin/read-model/rebuild", response_model=dict)
+def rebuild_read_model():
+    if not read_model.enabled:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="未設定 READ_MODEL_PATH")
+    if not refresh_read_model(force=True):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="另一個 worker 正在重建快照")
+    return {"status": "success", "data": read_model.status()}
+
+# **查詢快取**
+@router.get("/admin/cache", response_model=dict)
+def get_cache():
+    """快取後端、序列化格式，以及各 namespace 依賴的資料表、命中、未命中、錯誤次數與後端耗時"""
+    return {"status": "success", "data": query_cache.status()}
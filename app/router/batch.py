@@ -0,0 +1,165 @@
+# Purpose: 批次查詢 API，將多個唯讀查詢合併為一次請求、一個資料庫連線
+
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from sqlalchemy.orm import Session
+
+from ..database import get_read_db
+from .. import schemas
+from ..utils.fast_json import loads
+from ..utils.instrumentation import TimedRoute
+from . import locations, record, villagers
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Batch"], route_class=TimedRoute)
+
+
+# **各操作的參數（與對應 GET 端點的查詢參數相同）**
+class _Params(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+class _LocationsParams(_Params):
+    include_invalid: bool = False
+    fields: Optional[str] = None
+
+class _LocationDetailParams(_Params):
+    location_id: int
+    record_limit: int = Field(10, ge=1, le=100)
+
+class _VillagersParams(_Params):
+    limit: int = Field(100, ge=1, le=1000)
+    cursor: Optional[str] = None
+    skip: int = Field(0, ge=0)
+    location_id: Optional[int] = None
+    gender: Optional[str] = None
+    job: Optional[str] = None
+    sort: str = Field("id", pattern="^(id|least_recently_visited)$")
+    fields: Optional[str] = None
+
+class _VillagerParams(_Params):
+    villager_id: int
+
+class _VillagerVisitsParams(_Params):
+    villager_id: int
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = None
+
+class _LocationParams(_Params):
+    location_id: int
+
+class _RecordsParams(_Params):
+    skip: int = Field(0, ge=0)
+    limit: int = Field(100, ge=1, le=1000)
+    fields: Optional[str] = None
+
+class _RecordsByLocationParams(_Params):
+    location_id: int
+    fields: Optional[str] = None
+
+class _RecordParams(_Params):
+    record_id: int
+
+
+# 操作名稱 → (對應的路由函式, 參數模型)
+BATCH_OPERATIONS = {
+    "locations": (locations.get_locations, _LocationsParams),
+    "location_detail": (locations.get_location_detail, _LocationDetailParams),
+    "villagers": (villagers.get_villagers, _VillagersParams),
+    "villager": (villagers.get_villager_by_id, _VillagerParams),
+    "villager_visits": (villagers.get_villager_visits, _VillagerVisitsParams),
+    "villagers_by_location": (villagers.get_villagers_by_location, _LocationParams),
+    "records": (record.get_all_records, _RecordsParams),
+    "record": (record.get_record_by_id, _RecordParams),
+    "records_by_location": (record.get_records_by_location_get, _RecordsByLocationParams),
+}
+
+
+def _begin_snapshot(db: Session):
+    """開始交易（get_read_db 已是唯讀）；PostgreSQL 上使用 REPEATABLE READ 讓所有操作看到同一份快照"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+
+def _run_operation(db: Session, operation: schemas.BatchOperation):
+    """執行單一操作，回傳 (HTTP 狀態碼, 回應內容)"""
+    if operation.op not in BATCH_OPERATIONS:
+        return status.HTTP_400_BAD_REQUEST, {"detail": f"不支援的操作: {operation.op}"}
+
+    handler, params_model = BATCH_OPERATIONS[operation.op]
+    try:
+        params = params_model(**operation.params)
+    except ValidationError as e:
+        return status.HTTP_422_UNPROCESSABLE_ENTITY, {"detail": e.errors(include_url=False, include_context=False)}
+
+    # 每個操作在自己的 SAVEPOINT 中執行：失敗的 SQL 只回滾這個操作，交易（與快照）仍可供後續操作使用
+    savepoint = db.begin_nested()
+    try:
+        result = handler(db=db, **params.model_dump())
+    except HTTPException as e:
+        status_code, body = e.status_code, {"detail": e.detail}
+    except Exception as e:
+        logger.exception(f"批次操作 {operation.op} 失敗: {str(e)}")
+        status_code, body = status.HTTP_500_INTERNAL_SERVER_ERROR, {"detail": f"操作失敗: {str(e)}"}
+    else:
+        savepoint.commit()
+        # 已編碼為 JSON 的回應（例如地點列表的快速路徑）
+        if isinstance(result, Response):
+            return result.status_code, loads(result.body)
+        return status.HTTP_200_OK, result
+
+    if status_code >= 500:
+        savepoint.rollback()
+    else:
+        savepoint.commit()
+    return status_code, body
+
+
+# **批次查詢**
+@router.post("/batch", response_model=dict, status_code=status.HTTP_200_OK)
+def run_batch(payload: schemas.BatchRequest, db: Session = Depends(get_read_db)):
+    """
+    在同一個資料庫連線、同一個唯讀交易中依序執行多個查詢
+
+    可用的操作與參數:
+        locations(include_invalid, fields), location_detail(location_id, record_limit),
+        villagers(limit, cursor, skip, location_id, gender, job, sort, fields), villager(villager_id),
+        villager_visits(villager_id, limit, cursor), villagers_by_location(location_id),
+        records(skip, limit, fields), record(record_id), records_by_location(location_id, fields)
+
+    Args:
+        payload: 操作列表（最多 20 個）
+        db: 資料庫連線
+
+    Returns:
+        dict: 依請求順序排列的各操作結果，個別操作失敗不影響其他操作
+    """
+    results = []
+    try:
+        _begin_snapshot(db)
+        for operation in payload.operations:
+            status_code, body = _run_operation(db, operation)
+            results.append({
+                "id": operation.id,
+                "op": operation.op,
+                "status": status_code,
+                "body": body
+            })
+    except Exception as e:
+        logger.exception(f"批次查詢時發生錯誤: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"批次查詢失敗: {str(e)}"
+        )
+    finally:
+        # 唯讀交易不需提交
+        db.rollback()
+
+    return {
+        "status": "success",
+        "results": results
+    }
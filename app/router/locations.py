@@ -1,35 +1,102 @@
 # Purpose: 處理 locations API
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import Optional
 
 from ..crud import Location
-from ..database import get_db
+from ..services import location as location_service
+from ..database import get_db, get_read_db, use_db_json_aggregation
 from .. import schemas
+from ..utils.fields import parse_fields, load_columns
+from ..utils.fast_json import FastJSONResponse, RawJSON, compose_json
+from ..utils.instrumentation import TimedRoute
+from ..utils.read_model import read_model
 
-router = APIRouter(tags=["Location"])
+router = APIRouter(tags=["Location"], route_class=TimedRoute)
+
+def _get_locations_db_json(db: Session, include_invalid: bool):
+    """由 PostgreSQL 組出地點列表，回應內容與一般路徑相同"""
+    valid_count, invalid_count, data = Location.get_locations_json(db, include_invalid)
+
+    if valid_count + invalid_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="沒有找到任何地點資料"
+        )
+    if include_invalid:
+        summary = {
+            "total": valid_count + invalid_count,
+            "valid": valid_count,
+            "invalid": invalid_count
+        }
+    else:
+        if not valid_count:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="沒有找到具有有效座標的地點"
+            )
+        summary = {
+            "total": valid_count,
+            "filtered_out": invalid_count
+        }
+
+    return Response(
+        content=compose_json({"status": "success", "data": RawJSON(data), "summary": summary}),
+        media_type="application/json"
+    )
 
 # **取得所有地點 - 修復版本**
 @router.get("/locations", response_model=dict, status_code=status.HTTP_200_OK)
 def get_locations(
     include_invalid: bool = Query(False, description="包含座標無效的地點"),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="只回傳指定欄位，以逗號分隔，例如 id,name"),
+    db: Session = Depends(get_read_db)
 ):
     """
     獲取所有地點
     
     Args:
         include_invalid: 是否包含座標為空的地點
+        fields: 只回傳（與載入）的欄位，未提供時回傳全部欄位
         db: 資料庫連線
     
     Returns:
         dict: 地點列表
     """
+    selected = None
+    if fields is not None:
+        try:
+            selected = parse_fields(fields, Location.LOCATION_FIELDS)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
     try:
-        location_list = Location.get_locations(db)
+        # 由資料庫組出 JSON，應用程式不建立任何逐列物件
+        if selected is None and use_db_json_aggregation(db):
+            return _get_locations_db_json(db, include_invalid)
 
-        if not location_list:
+        # 座標一律載入，用於過濾無效地點
+        names = selected or list(Location.LOCATION_FIELDS)
+        columns = load_columns(
+            Location.LOCATION_FIELDS, names,
+            Location.LOCATION_FIELDS["latitude"], Location.LOCATION_FIELDS["longitude"]
+        )
+        keys = [column.key for column in columns]
+        lat_index, lon_index = keys.index("Latitude"), keys.index("Longitude")
+
+        # 共用快照未過期時直接讀取（不向連接池借連線），否則讀取查詢快取或以 Core select 取得資料列，
+        # 都不建立 ORM 物件與 Pydantic 模型
+        snapshot = read_model.table("locations")
+        if snapshot is not None:
+            location_rows = snapshot.rows(names + [
+                name for name in ("latitude", "longitude") if name not in names
+            ])
+        else:
+            location_rows = Location.get_cached_location_rows(db, columns=columns)
+
+        if not location_rows:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="沒有找到任何地點資料"
@@ -39,41 +106,28 @@ def get_locations(
         valid_locations = []
         invalid_locations = []
         
-        for loc in location_list:
-            try:
-                # 檢查座標是否有效
-                has_valid_coords = (
-                    loc.Latitude is not None and 
-                    loc.Longitude is not None and
-                    str(loc.Latitude).strip() != '' and 
-                    str(loc.Longitude).strip() != ''
-                )
-                
-                location_data = schemas.LocationResponse(
-                    id=loc.LocationID,
-                    name=loc.name,
-                    latitude=str(loc.Latitude) if loc.Latitude is not None else None,
-                    longitude=str(loc.Longitude) if loc.Longitude is not None else None,
-                    address=loc.Address,
-                    brief_description=loc.BriefDescription,
-                    photo=loc.Photo,
-                    tag=loc.Tag
-                )
-                
-                if has_valid_coords:
-                    valid_locations.append(location_data)
-                else:
-                    invalid_locations.append(location_data)
-                    
-            except Exception as e:
-                print(f"Error processing location {loc.LocationID}: {e}")
-                # 跳過有問題的記錄
-                continue
+        for row in location_rows:
+            # 檢查座標是否有效
+            latitude, longitude = row[lat_index], row[lon_index]
+            has_valid_coords = (
+                latitude is not None and 
+                longitude is not None and
+                str(latitude).strip() != '' and 
+                str(longitude).strip() != ''
+            )
+            
+            # zip 會略過只為過濾而載入的座標欄位
+            location_data = dict(zip(names, row))
+            
+            if has_valid_coords:
+                valid_locations.append(location_data)
+            else:
+                invalid_locations.append(location_data)
         
         # 根據參數決定返回哪些地點
         if include_invalid:
             all_locations = valid_locations + invalid_locations
-            return {
+            return FastJSONResponse({
                 "status": "success",
                 "data": all_locations,
                 "summary": {
@@ -81,7 +135,7 @@ def get_locations(
                     "valid": len(valid_locations),
                     "invalid": len(invalid_locations)
                 }
-            }
+            })
         else:
             # 只返回有效座標的地點
             if not valid_locations:
@@ -90,14 +144,14 @@ def get_locations(
                     detail="沒有找到具有有效座標的地點"
                 )
             
-            return {
+            return FastJSONResponse({
                 "status": "success",
                 "data": valid_locations,
                 "summary": {
                     "total": len(valid_locations),
                     "filtered_out": len(invalid_locations)
                 }
-            }
+            })
             
     except HTTPException:
         # 重新拋出 HTTP 異常
@@ -111,7 +165,7 @@ def get_locations(
 
 # **診斷端點 - 檢查資料問題**
 @router.get("/locations/diagnostics", response_model=dict)
-def diagnose_locations(db: Session = Depends(get_db)):
+def diagnose_locations(db: Session = Depends(get_read_db)):
     """診斷地點資料問題"""
     try:
         location_list = Location.get_locations(db)
@@ -163,6 +217,32 @@ def diagnose_locations(db: Session = Depends(get_db)):
             detail=f"診斷失敗: {str(e)}"
         )
 
+# **地點完整資訊（地點、村民與親屬關係、最近家訪紀錄）**
+@router.get("/location/{location_id}/detail", response_model=dict)
+def get_location_detail(
+    location_id: int,
+    record_limit: int = Query(10, ge=1, le=100, description="最多回傳的家訪紀錄筆數"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    一次取得地圖上開啟住戶所需的所有資料，查詢數固定不隨資料量增加
+    
+    Args:
+        location_id: 地點 ID
+        record_limit: 最多回傳的家訪紀錄筆數
+        db: 資料庫連線
+    
+    Returns:
+        dict: 地點、村民（含親屬關係）與最近家訪紀錄（含學生與村民）
+    """
+    detail = location_service.get_location_detail(db, location_id, record_limit=record_limit)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="找不到該地點")
+    return {
+        "status": "success",
+        "data": detail
+    }
+
 # 其他路由保持不變...
 
 # 新增地點
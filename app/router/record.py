@@ -1,26 +1,48 @@
 # app/router/record.py - 修復版本（兼容現有代碼）
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import logging
 
 from ..crud import Record
-from ..database import get_db
+from ..database import get_db, get_read_db, use_db_json_aggregation
 from .. import schemas
+from ..utils.fields import parse_fields, load_columns, pick_fields
+from ..utils.fast_json import RawJSON, compose_json
+from ..utils.cache import query_cache
+from ..utils.instrumentation import TimedRoute
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-router = APIRouter(tags=["Record"])
+router = APIRouter(tags=["Record"], route_class=TimedRoute)
+
+FIELDS_QUERY_DESCRIPTION = "只回傳指定欄位，以逗號分隔，例如 record_id,date"
+
+def _parse_record_fields(fields: Optional[str]):
+    """解析 fields 參數，未提供時回傳 None（回傳完整欄位）"""
+    if fields is None:
+        return None
+    try:
+        return parse_fields(fields, Record.RECORD_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def _serialize_records(records, selected):
+    """將家訪紀錄轉換為回應格式，selected 不為 None 時只輸出指定欄位"""
+    if selected is None:
+        return [schemas.RecordResponse.from_orm_record(record) for record in records]
+    return [pick_fields(record, Record.RECORD_FIELDS, selected) for record in records]
 
 # ===== 修復後的原有接口 =====
 
 @router.post("/records", response_model=dict)
 def get_record_by_location(
     location: schemas.LocationID,  # 使用原有的 LocationID schema
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     根據地點 ID 獲取所有相關的家訪記錄（修復版本）
@@ -68,36 +90,54 @@ def get_record_by_location(
 @router.get("/records/location/{location_id}", response_model=dict)
 def get_records_by_location_get(
     location_id: int = Path(..., description="地點 ID"),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
+    db: Session = Depends(get_read_db)
 ):
     """
     使用 GET 方法根據地點 ID 獲取家訪記錄（新增的替代方案）
     
     Args:
         location_id: 地點 ID
+        fields: 只回傳（與載入）的欄位，未提供時回傳全部欄位
         db: 資料庫連線
     
     Returns:
         dict: 包含狀態和家訪記錄列表的回應
     """
+    selected = _parse_record_fields(fields)
     try:
         logger.info(f"GET 方法查詢地點 ID: {location_id} 的家訪記錄")
         
-        records = Record.get_records_by_location(db, location_id)
+        # 由資料庫組出 JSON，應用程式不建立任何逐列物件
+        if selected is None and use_db_json_aggregation(db):
+            record_count, data = Record.get_records_by_location_json(db, location_id)
+            if record_count:
+                return Response(
+                    content=compose_json({"status": "success", "data": RawJSON(data), "total": record_count}),
+                    media_type="application/json"
+                )
+        
+        def load():
+            records = Record.get_records_by_location(
+                db, location_id,
+                columns=load_columns(Record.RECORD_FIELDS, selected) if selected else None
+            )
+            # 轉換為回應格式
+            return _serialize_records(records, selected)
         
-        if not records:
+        record_responses = query_cache.get_or_set(
+            Record.RECORDS_BY_LOCATION_CACHE,
+            (location_id, tuple(selected) if selected else None),
+            load
+        )
+        
+        if not record_responses:
             return {
                 "status": "success", 
                 "data": [],
                 "message": f"地點 ID {location_id} 沒有家訪記錄"
             }
         
-        # 轉換為回應格式
-        record_responses = [
-            schemas.RecordResponse.from_orm_record(record) 
-            for record in records
-        ]
-        
         logger.info(f"找到 {len(record_responses)} 筆記錄")
         
         return {
@@ -116,7 +156,7 @@ def get_records_by_location_get(
 @router.post("/records/by-location", response_model=dict)
 def get_records_by_location_post(
     location_param: schemas.LocationIdParam,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     根據地點 ID 獲取該地點的所有家訪記錄（新版 POST 方法）
@@ -167,11 +207,15 @@ def get_records_by_location_post(
 def get_all_records(
     skip: int = Query(0, ge=0, description="跳過的記錄數"),
     limit: int = Query(100, ge=1, le=1000, description="返回的記錄數限制"),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description=FIELDS_QUERY_DESCRIPTION),
+    db: Session = Depends(get_read_db)
 ):
-    """獲取所有家訪記錄"""
+    """獲取所有家訪記錄，可用 fields 指定只回傳（與載入）的欄位"""
+    selected = _parse_record_fields(fields)
     try:
-        all_records = Record.get_all_records(db)
+        all_records = Record.get_all_records(
+            db, columns=load_columns(Record.RECORD_FIELDS, selected) if selected else None
+        )
         total = len(all_records)
         records = all_records[skip:skip + limit]
         
@@ -184,10 +228,7 @@ def get_all_records(
                 "limit": limit
             }
         
-        record_responses = [
-            schemas.RecordResponse.from_orm_record(record) 
-            for record in records
-        ]
+        record_responses = _serialize_records(records, selected)
         
         return {
             "status": "success",
@@ -208,7 +249,7 @@ def get_all_records(
 @router.get("/records/{record_id}", response_model=dict)
 def get_record_by_id(
     record_id: int = Path(..., description="記錄 ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """根據 ID 獲取單筆家訪記錄"""
     try:
@@ -249,6 +290,12 @@ def create_new_record(
             "data": schemas.RecordResponse.from_orm_record(new_record)
         }
         
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.exception(f"創建記錄時發生錯誤: {str(e)}")
         db.rollback()
@@ -319,10 +366,62 @@ def delete_existing_record(
             detail=f"刪除記錄時發生錯誤: {str(e)}"
         )
 
+# ===== 家訪村民關聯 =====
+
+@router.post("/records/{record_id}/villagers", response_model=dict, status_code=status.HTTP_201_CREATED)
+def add_record_villagers(
+    record_id: int,
+    payload: schemas.RecordVillagersAdd,
+    db: Session = Depends(get_db)
+):
+    """將村民加入家訪記錄（同時更新村民的家訪統計）"""
+    try:
+        added = Record.add_villagers_to_record(db, record_id, payload.villager_ids)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if added is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"找不到ID為 {record_id} 的家訪記錄"
+        )
+    
+    return {
+        "status": "success",
+        "message": f"已將 {len(added)} 位村民加入家訪記錄",
+        "data": {
+            "record_id": record_id,
+            "added_villager_ids": added
+        }
+    }
+
+@router.delete("/records/{record_id}/villagers/{villager_id}", response_model=dict)
+def remove_record_villager(
+    record_id: int,
+    villager_id: int,
+    db: Session = Depends(get_db)
+):
+    """將村民從家訪記錄移除（同時更新村民的家訪統計）"""
+    success = Record.remove_villager_from_record(db, record_id, villager_id)
+    
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"家訪記錄 {record_id} 中沒有村民 {villager_id}"
+        )
+    
+    return {
+        "status": "success",
+        "message": f"已將村民 (ID={villager_id}) 從家訪記錄 (ID={record_id}) 移除"
+    }
+
 # ===== 調試接口 =====
 
 @router.get("/records/debug/all", response_model=dict)
-def debug_all_records(db: Session = Depends(get_db)):
+def debug_all_records(db: Session = Depends(get_read_db)):
     """調試用：獲取所有家訪記錄的基本信息"""
     try:
         all_records = Record.get_all_records(db)
@@ -363,7 +462,7 @@ def debug_all_records(db: Session = Depends(get_db)):
         )
 
 @router.get("/records/debug/location/{location_id}", response_model=dict)
-def debug_records_by_location(location_id: int, db: Session = Depends(get_db)):
+def debug_records_by_location(location_id: int, db: Session = Depends(get_read_db)):
     """調試用：檢查特定地點的記錄查詢"""
     try:
         # 原始查詢，檢查資料品質
@@ -1,54 +1,100 @@
 # Purpose: 處理 Villager 相關 API
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import Optional, List
+from datetime import date
 
-from ..crud import Villager
-from ..database import get_db
+from ..crud import Villager, Record
+from ..database import get_db, get_read_db, use_db_json_aggregation
 from .. import schemas
+from ..utils.pagination import encode_cursor, decode_cursor
+from ..utils.fields import parse_fields, load_columns, pick_fields
+from ..utils.fast_json import RawJSON, compose_json
+from ..utils.cache import query_cache
+from ..utils.instrumentation import TimedRoute
 
 # Import FastAPI router with tags
-router = APIRouter(tags=["Villager"])
+router = APIRouter(tags=["Villager"], route_class=TimedRoute)
 
 # **取得所有村民**
 @router.get("/villager", response_model=dict, status_code=status.HTTP_200_OK)
-def get_villagers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """獲取一組村民
+def get_villagers(
+    limit: int = Query(100, ge=1, le=1000, description="每頁筆數"),
+    cursor: Optional[str] = Query(None, description="上一頁回傳的 next_cursor"),
+    skip: int = Query(0, ge=0, description="（舊版）跳過記錄數，深分頁請改用 cursor"),
+    location_id: Optional[int] = Query(None, description="篩選地點ID"),
+    gender: Optional[str] = Query(None, description="篩選性別"),
+    job: Optional[str] = Query(None, description="篩選職業"),
+    sort: str = Query("id", pattern="^(id|least_recently_visited)$", description="排序方式"),
+    fields: Optional[str] = Query(None, description="只回傳指定欄位，以逗號分隔，例如 villagerid,name"),
+    db: Session = Depends(get_read_db)
+):
+    """獲取一組村民，依村民ID（或最後家訪日期）排序並以 cursor 分頁
     
     Args:
-        skip (int): 跳過記錄數，用於分頁
-        limit (int): 限制記錄數，用於分頁
+        limit (int): 每頁筆數
+        cursor (str): 上一頁回傳的 next_cursor，未提供時為第一頁
+        skip (int): 跳過記錄數（舊版 offset 分頁）
+        location_id (int): 篩選地點ID
+        gender (str): 篩選性別
+        job (str): 篩選職業
+        sort (str): "id" 或 "least_recently_visited"（從未家訪者優先）
+        fields (str): 只回傳（與載入）的欄位，未提供時回傳全部列表欄位
         db (Session): 資料庫連線
     
     Returns:
-        dict: 包含村民列表的回應
+        dict: 包含村民列表與分頁資訊的回應
     """
-    villager_list = Villager.get_villagers(db, skip=skip, limit=limit)
+    after = None
+    try:
+        selected = parse_fields(fields, Villager.VILLAGER_LIST_FIELDS)
+        if cursor is not None:
+            if sort == "least_recently_visited":
+                last_visited, last_id = decode_cursor(cursor, 2)
+                after = [date.fromisoformat(last_visited) if last_visited else None, int(last_id)]
+            else:
+                after = [int(decode_cursor(cursor, 1)[0])]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
 
-    if not villager_list:
+    # 只載入回傳與分頁鍵需要的欄位（主鍵一律載入），不讀取 URL、Photo 等大欄位
+    sort_columns = [Villager.VILLAGER_LIST_FIELDS["last_visited"]] if sort == "least_recently_visited" else []
+    columns = load_columns(Villager.VILLAGER_LIST_FIELDS, selected, *sort_columns)
+
+    # 多取一筆判斷是否還有下一頁
+    villager_list = Villager.get_villagers(
+        db, skip=skip, limit=limit + 1, after=after, sort=sort,
+        location_id=location_id, gender=gender, job=job, columns=columns
+    )
+
+    if not villager_list and cursor is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="沒有找到任何村民資料"
         )
 
+    has_more = len(villager_list) > limit
+    villager_list = villager_list[:limit]
+
     return {
         "status": "success",
-        "data": [
-            {
-                "villagerid": villager.VillagerID,
-                "name": villager.Name,
-                "gender": villager.Gender,
-                "job": villager.Job,
-                "locationid": villager.Location
-            }
-            for villager in villager_list
-        ]
+        "data": [pick_fields(villager, Villager.VILLAGER_LIST_FIELDS, selected) for villager in villager_list],
+        "pagination": {
+            "limit": limit,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(*Villager.villager_sort_key(villager_list[-1], sort)) if has_more else None,
+            "total": Villager.count_villagers(db, location_id=location_id, gender=gender, job=job)
+        }
     }
 
 # **根據ID取得村民**
 @router.get("/villager/{villager_id}", response_model=dict, status_code=status.HTTP_200_OK)
-def get_villager_by_id(villager_id: int, db: Session = Depends(get_db)):
+def get_villager_by_id(villager_id: int, db: Session = Depends(get_read_db)):
     """根據村民ID獲取村民詳細資訊，包含親屬關係
     
     Args:
@@ -79,10 +125,69 @@ def get_villager_by_id(villager_id: int, db: Session = Depends(get_db)):
             url=villager.URL,
             photo=villager.Photo,
             locationid=villager.Location,
+            visit_count=villager.VisitCount,
+            last_visited=villager.LastVisited,
             relationships=relationships
         )
     }
 
+# **取得村民的家訪紀錄**
+@router.get("/villager/{villager_id}/visits", response_model=dict, status_code=status.HTTP_200_OK)
+def get_villager_visits(
+    villager_id: int,
+    limit: int = Query(20, ge=1, le=100, description="每頁筆數"),
+    cursor: Optional[str] = Query(None, description="上一頁回傳的 next_cursor"),
+    db: Session = Depends(get_read_db)
+):
+    """獲取村民的家訪紀錄（依日期由新到舊）與家訪統計
+    
+    Args:
+        villager_id (int): 村民ID
+        limit (int): 每頁筆數
+        cursor (str): 上一頁回傳的 next_cursor，未提供時為第一頁
+        db (Session): 資料庫連線
+    
+    Returns:
+        dict: 包含家訪統計、家訪紀錄列表與分頁資訊的回應
+    """
+    before = None
+    if cursor is not None:
+        try:
+            last_date, last_id = decode_cursor(cursor, 2)
+            before = [date.fromisoformat(last_date), int(last_id)]
+        except (ValueError, TypeError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
+    villager = Villager.get_villager_by_id(db, villager_id)
+    
+    if not villager:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="找不到對應的村民資料"
+        )
+    
+    records = Record.get_records_by_villager(db, villager_id, limit=limit + 1, before=before)
+    has_more = len(records) > limit
+    records = records[:limit]
+    
+    return {
+        "status": "success",
+        "data": {
+            "villagerid": villager.VillagerID,
+            "visit_count": villager.VisitCount,
+            "last_visited": villager.LastVisited,
+            "visits": [schemas.RecordResponse.from_orm_record(record) for record in records]
+        },
+        "pagination": {
+            "limit": limit,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(records[-1].Date, records[-1].RecordID) if has_more else None
+        }
+    }
+
 # **新增村民**
 @router.post("/villager", response_model=dict, status_code=status.HTTP_201_CREATED)
 def create_villager(villager: schemas.VillagerCreate, db: Session = Depends(get_db)):
@@ -110,10 +215,48 @@ def create_villager(villager: schemas.VillagerCreate, db: Session = Depends(get_
             url=new_villager.URL,
             photo=new_villager.Photo,
             locationid=new_villager.Location,
+            visit_count=new_villager.VisitCount,
+            last_visited=new_villager.LastVisited,
             relationships=relationships
         )
     }
 
+# **批次新增村民**
+@router.post("/villager/bulk", response_model=dict, status_code=status.HTTP_201_CREATED)
+def bulk_create_villagers(payload: schemas.VillagerBulkCreate, dry_run: bool = False, db: Session = Depends(get_db)):
+    """批次新增村民，寫入前標記可能重複的資料
+    
+    Args:
+        payload (schemas.VillagerBulkCreate): 村民資料列表與比對設定
+        dry_run (bool): 只偵測不寫入
+        db (Session): 資料庫連線
+    
+    Returns:
+        dict: 寫入的村民、疑似重複與無效的資料
+    """
+    result = Villager.bulk_create_villagers(
+        db,
+        payload.villagers,
+        similarity_threshold=payload.similarity_threshold,
+        force_indexes=payload.force_indexes,
+        dry_run=dry_run
+    )
+    
+    return {
+        "status": "success",
+        "message": "村民批次檢查完成" if dry_run else "村民批次新增完成",
+        "summary": {
+            "total": len(payload.villagers),
+            "created": len(result["created"]),
+            "duplicates": len(result["duplicates"]),
+            "failed": len(result["errors"]),
+            "skipped_blocks": result["skipped_blocks"]
+        },
+        "data": result["created"],
+        "duplicates": result["duplicates"],
+        "errors": result["errors"]
+    }
+
 # **更新村民**
 @router.put("/villager/{villager_id}", response_model=dict)
 def update_villager(villager_id: int, villager: schemas.VillagerUpdate, db: Session = Depends(get_db)):
@@ -148,6 +291,8 @@ def update_villager(villager_id: int, villager: schemas.VillagerUpdate, db: Sess
             url=updated.URL,
             photo=updated.Photo,
             locationid=updated.Location,
+            visit_count=updated.VisitCount,
+            last_visited=updated.LastVisited,
             relationships=relationships
         )
     }
@@ -177,9 +322,40 @@ def delete_villager(villager_id: int, db: Session = Depends(get_db)):
         "message": f"村民 (ID={villager_id}) 已成功刪除"
     }
 
+# **批次刪除村民**
+@router.post("/villager/batch-delete", response_model=dict)
+def batch_delete_villagers(payload: schemas.VillagerBatchDelete, db: Session = Depends(get_db)):
+    """在同一個交易中刪除多位村民（或某地點的所有村民）
+    
+    Args:
+        payload (schemas.VillagerBatchDelete): 村民ID列表或地點ID
+        db (Session): 資料庫連線
+    
+    Returns:
+        dict: 已刪除與找不到的村民ID
+    """
+    deleted_ids = Villager.delete_villagers(db, villager_ids=payload.villager_ids, location_id=payload.location_id)
+    
+    if not deleted_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="找不到符合條件的村民"
+        )
+    
+    not_found = sorted(set(payload.villager_ids) - set(deleted_ids)) if payload.villager_ids is not None else []
+    
+    return {
+        "status": "success",
+        "message": f"已成功刪除 {len(deleted_ids)} 位村民",
+        "data": {
+            "deleted_ids": sorted(deleted_ids),
+            "not_found_ids": not_found
+        }
+    }
+
 # **根據地點ID取得村民**
 @router.get("/villagers/location/{location_id}", response_model=dict, status_code=status.HTTP_200_OK)
-def get_villagers_by_location(location_id: int, db: Session = Depends(get_db)):
+def get_villagers_by_location(location_id: int, db: Session = Depends(get_read_db)):
     """獲取特定地點的村民
     
     Args:
@@ -189,31 +365,55 @@ def get_villagers_by_location(location_id: int, db: Session = Depends(get_db)):
     Returns:
         dict: 包含村民列表的回應
     """
-    villager_list = Villager.get_villagers_by_location(db, location_id)
+    # 由資料庫組出 JSON，應用程式不建立任何逐列物件
+    if use_db_json_aggregation(db):
+        villager_count, data = Villager.get_villagers_by_location_json(db, location_id)
+        if not villager_count:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"沒有找到地點ID={location_id}的村民資料"
+            )
+        return Response(
+            content=compose_json({"status": "success", "data": RawJSON(data)}),
+            media_type="application/json"
+        )
+
+    def load():
+        villager_list = Villager.get_villagers_by_location(db, location_id)
+
+        # 一次取得所有村民的親屬關係
+        relationships_by_villager = Villager.get_relationships_for_villagers(
+            db, [villager.VillagerID for villager in villager_list]
+        )
+        
+        result = []
+        for villager in villager_list:
+            relationships = relationships_by_villager[villager.VillagerID]
+            
+            villager_data = {
+                "villagerid": villager.VillagerID,
+                "name": villager.Name,
+                "gender": villager.Gender,
+                "job": villager.Job,
+                "url": villager.URL,
+                "photo": villager.Photo,
+                "locationid": villager.Location,
+                "visit_count": villager.VisitCount,
+                "last_visited": villager.LastVisited,
+                "relationships": relationships
+            }
+            result.append(villager_data)
+        return result
+
+    # 寫入村民或親屬關係後失效
+    result = query_cache.get_or_set(Villager.VILLAGERS_BY_LOCATION_CACHE, location_id, load)
 
-    if not villager_list:
+    if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"沒有找到地點ID={location_id}的村民資料"
         )
 
-    result = []
-    for villager in villager_list:
-        # 獲取親屬關係
-        relationships = Villager.get_villager_relationships(db, villager.VillagerID)
-        
-        villager_data = {
-            "villagerid": villager.VillagerID,
-            "name": villager.Name,
-            "gender": villager.Gender,
-            "job": villager.Job,
-            "url": villager.URL,
-            "photo": villager.Photo,
-            "locationid": villager.Location,
-            "relationships": relationships
-        }
-        result.append(villager_data)
-
     return {
         "status": "success",
         "data": result
@@ -244,6 +444,39 @@ def add_relationship(relationship: schemas.RelationshipCreate, db: Session = Dep
         }
     }
 
+# **批次添加村民親屬關係**
+@router.post("/villager/relationship/bulk", response_model=dict, status_code=status.HTTP_201_CREATED)
+def bulk_add_relationships(payload: schemas.RelationshipBulkCreate, dry_run: bool = False, db: Session = Depends(get_db)):
+    """批次添加村民親屬關係，有效的關係在同一個交易中寫入
+    
+    Args:
+        payload (schemas.RelationshipBulkCreate): 親屬關係列表
+        dry_run (bool): 只驗證不寫入
+        db (Session): 資料庫連線
+    
+    Returns:
+        dict: 成功建立的關係與每筆失敗的原因
+    """
+    try:
+        result = Villager.bulk_create_relationships(db, payload.relationships, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    
+    return {
+        "status": "success",
+        "message": "親屬關係批次驗證完成" if dry_run else "親屬關係批次添加完成",
+        "summary": {
+            "total": len(payload.relationships),
+            "created": len(result["created"]),
+            "failed": len(result["errors"])
+        },
+        "data": result["created"],
+        "errors": result["errors"]
+    }
+
 # **刪除村民親屬關係**
 @router.delete("/villager/relationship/{relationship_id}", response_model=dict)
 def delete_relationship(relationship_id: int, db: Session = Depends(get_db)):
@@ -1,10 +1,12 @@
 # app/schemas.py - 完整修復版本
 # Purpose:　用於設定 API 請求和回應
 
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, model_validator
 from typing import Optional, List
 from datetime import date
 
+from .services.villager_import import DEFAULT_SIMILARITY_THRESHOLD
+
 # ===== Location 相關 Schemas =====
 class LocationBase(BaseModel):
     name: str
@@ -49,6 +51,20 @@ class LocationResponse(BaseModel):
     class Config:
         from_attributes = True  # 允許 SQLAlchemy ORM 自動轉換為 Pydantic 模型
 
+    @classmethod
+    def from_orm_location(cls, loc):
+        """從 ORM Location 物件創建回應模型"""
+        return cls(
+            id=loc.LocationID,
+            name=loc.name,
+            latitude=str(loc.Latitude) if loc.Latitude is not None else None,
+            longitude=str(loc.Longitude) if loc.Longitude is not None else None,
+            address=loc.Address,
+            brief_description=loc.BriefDescription,
+            photo=loc.Photo,
+            tag=loc.Tag
+        )
+
 # ===== Record 相關 Schemas - 新增 =====
 
 class RecordBase(BaseModel):
@@ -62,7 +78,11 @@ class RecordBase(BaseModel):
 
 class RecordCreate(RecordBase):
     """創建 Record 請求模型"""
-    pass
+    villager_ids: List[int] = Field(default_factory=list)  # 受訪村民
+
+class RecordVillagersAdd(BaseModel):
+    """將村民加入 Record 請求模型"""
+    villager_ids: List[int] = Field(..., min_length=1)
 
 class RecordUpdate(BaseModel):
     """更新 Record 請求模型 - 所有欄位都是可選的"""
@@ -157,6 +177,8 @@ class VillagerDetailResponse(BaseModel):
     url: Optional[str] = None
     photo: Optional[str] = None
     locationid: int
+    visit_count: int = 0
+    last_visited: Optional[date] = None
     relationships: List[dict] = Field(default_factory=list)
 
     model_config = ConfigDict(from_attributes=True)
@@ -170,6 +192,12 @@ class VillagerCreate(BaseModel):
     photo: Optional[str] = None
     location_id: int
 
+# 批次新增村民請求
+class VillagerBulkCreate(BaseModel):
+    villagers: List[VillagerCreate] = Field(..., min_length=1)
+    similarity_threshold: float = Field(DEFAULT_SIMILARITY_THRESHOLD, ge=0, le=1)  # 姓名相似度門檻
+    force_indexes: List[int] = Field(default_factory=list)  # 即使疑似重複仍要寫入的列號
+
 # 更新村民請求
 class VillagerUpdate(BaseModel):
     name: str
@@ -179,8 +207,33 @@ class VillagerUpdate(BaseModel):
     photo: Optional[str] = None
     location_id: int
 
+# 批次刪除村民請求（指定村民ID或地點ID，兩者皆指定時取交集）
+class VillagerBatchDelete(BaseModel):
+    villager_ids: Optional[List[int]] = Field(None, min_length=1)
+    location_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if self.villager_ids is None and self.location_id is None:
+            raise ValueError("必須指定 villager_ids 或 location_id")
+        return self
+
 # 新增村民親屬關係請求
 class RelationshipCreate(BaseModel):
     source_villager_id: int
     target_villager_id: int
-    relationship_type_id: int
\ No newline at end of file
+    relationship_type_id: int
+
+# 批次新增村民親屬關係請求
+class RelationshipBulkCreate(BaseModel):
+    relationships: List[RelationshipCreate] = Field(..., min_length=1)
+
+# 批次查詢中的單一唯讀操作
+class BatchOperation(BaseModel):
+    id: Optional[str] = None  # 呼叫端自訂的識別字，原樣回傳
+    op: str  # 操作名稱，例如 "locations"、"villagers_by_location"
+    params: dict = Field(default_factory=dict)
+
+# 批次查詢請求
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=20)
@@ -1 +1,59 @@
-# 負責 locations 的邏輯
\ No newline at end of file
+# 負責 locations 的邏輯
+
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..crud import Record, Villager
+
+
+def get_location_detail(db: Session, location_id: int, record_limit: int = 10):
+    """
+    取得地點的完整資訊：地點本身、村民（含親屬關係）與最近的家訪紀錄（含學生與村民）
+
+    查詢數固定，不隨村民或紀錄數量增加：
+    地點 1 次、村民 1 次、親屬關係 2 次、家訪紀錄 1 次、學生與受訪村民 2 次。
+
+    Args:
+        db (Session): 資料庫連線
+        location_id (int): 地點 ID
+        record_limit (int): 最多回傳的家訪紀錄筆數
+
+    Returns:
+        dict: 地點詳細資料，若未找到地點則回傳 None
+    """
+    location = db.query(models.Location).filter(models.Location.LocationID == location_id).first()
+    if not location:
+        return None
+
+    villagers = Villager.get_villagers_by_location(db, location_id)
+    relationships = Villager.get_relationships_for_villagers(db, [v.VillagerID for v in villagers])
+
+    records = Record.get_recent_records_by_location(db, location_id, limit=record_limit)
+    participants = Record.get_record_participants(db, [r.RecordID for r in records])
+
+    return {
+        "location": schemas.LocationResponse.from_orm_location(location),
+        "villagers": [
+            {
+                "villagerid": villager.VillagerID,
+                "name": villager.Name,
+                "gender": villager.Gender,
+                "job": villager.Job,
+                "url": villager.URL,
+                "photo": villager.Photo,
+                "locationid": villager.Location,
+                "visit_count": villager.VisitCount,
+                "last_visited": villager.LastVisited,
+                "relationships": relationships[villager.VillagerID]
+            }
+            for villager in villagers
+        ],
+        "records": [
+            {
+                **schemas.RecordResponse.from_orm_record(record).model_dump(),
+                "students": participants[record.RecordID]["students"],
+                "villagers": participants[record.RecordID]["villagers"]
+            }
+            for record in records
+        ]
+    }
@@ -0,0 +1,48 @@
+# 負責共用唯讀快照（app/utils/read_model.py）的內容：哪些資料表、哪些欄位
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..crud.Location import LOCATION_FIELDS
+from ..database import ReadSessionLocal
+from ..utils.read_model import read_model
+
+# 快照資料表名稱 -> API 欄位名稱 → ORM 欄位（第一個欄位為主鍵）
+# 只放有讀取端使用的資料表（GET /api/locations）
+SNAPSHOT_TABLES = {
+    "locations": LOCATION_FIELDS,
+}
+
+# 快照資料表名稱 -> 寫入後讓該資料表過期的來源資料表
+SNAPSHOT_SOURCES = {
+    "locations": {models.Location.__tablename__},
+}
+
+
+def load_snapshot_tables(db: Session):
+    """
+    在同一個交易中讀取所有快照資料表
+
+    Returns:
+        dict: 快照資料表名稱 -> (欄位名稱列表, 資料列列表)
+    """
+    return {
+        name: (list(fields), [tuple(row) for row in db.execute(select(*fields.values()))])
+        for name, fields in SNAPSHOT_TABLES.items()
+    }
+
+
+def refresh_read_model(force: bool = False):
+    """快照過期時重建（由排程與暖機呼叫），回傳是否重建"""
+    if not read_model.is_stale() and not force:
+        return False
+
+    def load():
+        db = ReadSessionLocal()
+        try:
+            return load_snapshot_tables(db)
+        finally:
+            db.close()
+
+    return read_model.refresh(load, force=force)
@@ -0,0 +1,93 @@
+# 負責村民批次匯入的重複偵測邏輯
+#
+# 以 (性別, 地點, 姓名 n-gram) 作為 blocking key 建立倒排索引，
+# 每筆新資料只和共用至少一個 block 的村民比對相似度，避免 O(n²) 全量比對。
+# 另以 (性別, 地點, 正規化姓名) 建立完全相同姓名的索引，過大的 block 被略過時仍能找到完全重複的資料。
+
+import difflib
+import re
+import unicodedata
+from collections import defaultdict
+
+# 預設相似度門檻（difflib ratio）
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+
+# 單一 block 超過此大小時視為過於常見（例如同地點同性別的常見姓氏），不再用來產生候選
+DEFAULT_MAX_BLOCK_SIZE = 200
+
+_IGNORED_CHARS = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_name(name: str) -> str:
+    """正規化姓名：全半形統一、轉小寫、移除空白與標點"""
+    if not name:
+        return ""
+    return _IGNORED_CHARS.sub("", unicodedata.normalize("NFKC", name).lower())
+
+
+def name_grams(normalized: str, n: int = 2) -> set:
+    """取得姓名的 n-gram，前後加上邊界符號讓相同的首尾字也能形成共用 gram"""
+    padded = f"^{normalized}$"
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def name_similarity(a: str, b: str) -> float:
+    """兩個正規化姓名的相似度 (0 ~ 1)"""
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+class DuplicateIndex:
+    """以 blocking 倒排索引尋找可能重複的村民"""
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD, max_block_size: int = DEFAULT_MAX_BLOCK_SIZE):
+        self.threshold = threshold
+        self.max_block_size = max_block_size
+        self._entries = {}
+        self._blocks = defaultdict(list)
+        self._exact = defaultdict(list)
+        self.skipped_blocks = 0  # find_matches 因超過 max_block_size 而略過的 block 數
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, name: str, gender: str, location_id):
+        """加入一筆村民；key 用於回報比對結果（例如村民ID或匯入列號）"""
+        normalized = normalize_name(name)
+        self._entries[key] = (name, normalized)
+        self._exact[(gender, location_id, normalized)].append(key)
+        for gram in name_grams(normalized):
+            self._blocks[(gender, location_id, gram)].append(key)
+
+    def find_matches(self, name: str, gender: str, location_id):
+        """
+        找出與指定村民可能重複的資料
+
+        正規化姓名完全相同的資料一定是候選；超過 max_block_size 的 n-gram block 不產生候選，並計入 skipped_blocks
+
+        Returns:
+            List[tuple]: (key, 原始姓名, 相似度)，依相似度由高到低排序
+        """
+        normalized = normalize_name(name)
+        candidates = set(self._exact.get((gender, location_id, normalized), ()))
+        for gram in name_grams(normalized):
+            block = self._blocks.get((gender, location_id, gram))
+            if not block:
+                continue
+            if len(block) > self.max_block_size:
+                self.skipped_blocks += 1
+                continue
+            candidates.update(block)
+
+        matches = []
+        for key in candidates:
+            candidate_name, candidate_normalized = self._entries[key]
+            score = name_similarity(normalized, candidate_normalized)
+            if score >= self.threshold:
+                matches.append((key, candidate_name, round(score, 3)))
+
+        matches.sort(key=lambda match: match[2], reverse=True)
+        return matches
@@ -0,0 +1,221 @@
+# app/utils/admission.py - 連接池前的准入控制與公平佇列
+#
+# 同時進入資料庫路由的請求數以連接池容量（pool_size + max_overflow）為上限。
+# 超出時請求在事件迴圈上排隊等待（不佔用執行緒與連線），依優先順序放行：
+#   HIGH   - 寫入與單筆詳細資料
+#   NORMAL - 一般列表查詢
+#   LOW    - 除錯、診斷與匯出，最多只能使用一小部分容量
+# 佇列已滿或等待逾時時立即回傳 503 與 Retry-After，而不是讓執行緒卡在 pool_timeout 後回傳 500。
+
+import asyncio
+import math
+import re
+import time
+from collections import deque
+
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+HIGH = "high"
+NORMAL = "normal"
+LOW = "low"
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+# 不使用資料庫的路徑，不經過准入控制
+EXEMPT_PATHS = re.compile(r"^/(docs|redoc|openapi\.json|metrics|ready)?$|^/api/pool-status")
+
+# (HTTP 方法, 路徑) 規則，依序比對，第一個符合的決定優先順序
+PRIORITY_RULES = [
+    (None, re.compile(r"^/api/(records/debug|locations/diagnostics|admin)(/|$)"), LOW),
+    (None, re.compile(r"/export(/|$)"), LOW),
+    # 以 POST 傳參數的唯讀查詢
+    ("POST", re.compile(r"^/api/(batch|records|records/by-location)$"), NORMAL),
+    ("GET", re.compile(r"^/api/(villager/\d+|location/\d+/detail|records/\d+)$"), HIGH),
+    ("GET", re.compile(r".*"), NORMAL),
+    (None, re.compile(r".*"), HIGH),
+]
+
+
+def classify_request(method: str, path: str):
+    """回傳請求的優先順序，不需准入控制時回傳 None"""
+    if EXEMPT_PATHS.match(path):
+        return None
+    for rule_method, pattern, priority in PRIORITY_RULES:
+        if (rule_method is None or rule_method == method) and pattern.search(path):
+            return priority
+    return NORMAL
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, priority, reason, retry_after):
+        super().__init__(f"{priority} request rejected: {reason}")
+        self.priority = priority
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    以事件迴圈上的 future 實作的優先順序號誌，只能在同一個事件迴圈中使用
+
+    Args:
+        capacity (int): 同時執行的請求上限（連接池容量）
+        limits (dict): 各優先順序同時執行的上限，預設保留部分容量給 HIGH、限制 LOW
+        queue_limits (dict): 各優先順序的佇列長度上限
+        max_wait (dict): 各優先順序的最長等待秒數
+    """
+
+    def __init__(self, capacity, limits=None, queue_limits=None, max_wait=None):
+        self.capacity = capacity
+        self.limits = limits or {
+            HIGH: capacity,
+            NORMAL: max(1, capacity - 2),
+            LOW: max(1, capacity // 5),
+        }
+        self.queue_limits = queue_limits or {HIGH: 4 * capacity, NORMAL: 2 * capacity, LOW: 2}
+        self.max_wait = max_wait or {HIGH: 10.0, NORMAL: 5.0, LOW: 1.0}
+        self.active = 0
+        self._active_by_priority = {priority: 0 for priority in PRIORITIES}
+        self._waiters = {priority: deque() for priority in PRIORITIES}
+        # 請求佔用時間的指數移動平均，用於估計 Retry-After
+        self._hold_ewma = 0.1
+        self._stats = {
+            priority: {
+                "admitted": 0,
+                "queued": 0,
+                "rejected_queue_full": 0,
+                "rejected_timeout": 0,
+                "wait_seconds_total": 0.0,
+                "wait_seconds_max": 0.0,
+            }
+            for priority in PRIORITIES
+        }
+
+    def _can_run(self, priority):
+        return self.active < self.capacity and self._active_by_priority[priority] < self.limits[priority]
+
+    def _grant(self, priority):
+        self.active += 1
+        self._active_by_priority[priority] += 1
+        self._stats[priority]["admitted"] += 1
+
+    def _retry_after(self):
+        """依排隊人數與平均佔用時間估計的重試秒數"""
+        waiting = sum(len(queue) for queue in self._waiters.values())
+        return max(1, min(30, math.ceil((waiting + 1) * self._hold_ewma / self.capacity)))
+
+    def _reject(self, priority, reason):
+        self._stats[priority][f"rejected_{reason}"] += 1
+        raise AdmissionRejected(priority, reason, self._retry_after())
+
+    def _record_wait(self, priority, waited):
+        stats = self._stats[priority]
+        stats["wait_seconds_total"] += waited
+        stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
+    async def acquire(self, priority):
+        """
+        取得執行資格，回傳等待秒數
+
+        Raises:
+            AdmissionRejected: 佇列已滿或等待逾時
+        """
+        # 每次歸還都會先喚醒等待者，因此此時還能執行代表沒有人因容量不足而排在前面
+        if self._can_run(priority):
+            self._grant(priority)
+            return 0.0
+
+        queue = self._waiters[priority]
+        if len(queue) >= self.queue_limits[priority]:
+            self._reject(priority, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._stats[priority]["queued"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.max_wait[priority])
+        except asyncio.TimeoutError:
+            # 逾時與放行同時發生時，以放行為準
+            if not (waiter.done() and not waiter.cancelled()):
+                self._record_wait(priority, time.monotonic() - started)
+                self._reject(priority, "timeout")
+        except BaseException:
+            # 用戶端斷線等取消：已取得的資格要歸還
+            if waiter.done() and not waiter.cancelled():
+                self.release(priority)
+            raise
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+
+        waited = time.monotonic() - started
+        self._record_wait(priority, waited)
+        return waited
+
+    def release(self, priority, held_seconds=None):
+        """歸還執行資格並依優先順序喚醒等待者"""
+        self.active -= 1
+        self._active_by_priority[priority] -= 1
+        if held_seconds is not None:
+            self._hold_ewma = 0.9 * self._hold_ewma + 0.1 * held_seconds
+        self._wake()
+
+    def _wake(self):
+        for priority in PRIORITIES:
+            queue = self._waiters[priority]
+            while queue and self._can_run(priority):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self._grant(priority)
+                waiter.set_result(None)
+
+    def stats(self):
+        """准入控制統計（佇列長度、等待時間、拒絕次數）"""
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "avg_hold_seconds": round(self._hold_ewma, 4),
+            "priorities": {
+                priority: {
+                    **self._stats[priority],
+                    "limit": self.limits[priority],
+                    "active": self._active_by_priority[priority],
+                    "queue_depth": sum(1 for waiter in self._waiters[priority] if not waiter.done()),
+                    "queue_limit": self.queue_limits[priority],
+                    "avg_wait_seconds": round(
+                        self._stats[priority]["wait_seconds_total"] / self._stats[priority]["queued"], 4
+                    ) if self._stats[priority]["queued"] else 0.0,
+                }
+                for priority in PRIORITIES
+            },
+        }
+
+
+class AdmissionMiddleware(BaseHTTPMiddleware):
+    """依 classify_request 的優先順序對請求做准入控制，超載時回傳 503"""
+
+    def __init__(self, app, controller: AdmissionController):
+        super().__init__(app)
+        self.controller = controller
+
+    async def dispatch(self, request, call_next):
+        priority = classify_request(request.method, request.url.path)
+        if priority is None:
+            return await call_next(request)
+
+        try:
+            await self.controller.acquire(priority)
+        except AdmissionRejected as e:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "伺服器忙碌中，請稍後再試"},
+                headers={"Retry-After": str(e.retry_after)}
+            )
+
+        started = time.monotonic()
+        try:
+            return await call_next(request)
+        finally:
+            self.controller.release(priority, time.monotonic() - started)
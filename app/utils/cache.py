@@ -0,0 +1,575 @@
+# app/utils/cache.py - 查詢快取（可替換後端）
+#
+# 用於成本高但允許短暫過期的查詢結果（列表總數、地點列表、地點的村民與家訪紀錄）。
+# 後端（CACHE_BACKEND）：
+#   memory  行程內 LRU（預設），值直接保存為 Python 物件
+#   redis   Redis 協定伺服器（CACHE_URL，RESP2，不需額外套件），所有 worker 與機器共用，重新啟動後仍保留
+#   local   在行程內啟動的 Redis 協定伺服器（LocalRedisServer），測試與本機開發時走與 redis 相同的路徑
+# 失效：
+#   - memory 後端的資料表版本只在寫入的 worker 內遞增，其他 worker 最多在 TTL 後才看到新資料；
+#     以 register(..., shared_only=True) 宣告的 namespace（使用者會立即重新讀取的列表）只在共用後端時快取
+#   - 每個 namespace 以 register() 宣告依賴的資料表；寫入這些資料表的交易提交後遞增資料表版本
+#     （redis 後端時版本為共用的計數器，等同廣播給所有 worker），
+#     快取鍵包含依賴資料表與 namespace 的版本，舊版本的項目不再被讀取，由 TTL 清除
+#   - invalidate(namespace) 遞增 namespace 版本
+# 序列化（CACHE_SERIALIZER）：orjson（預設）或 msgpack，只有 redis / local 後端需要；
+# 值須為 JSON 相容的型別（日期、Pydantic 模型會轉為 JSON 表示）。
+# 後端錯誤（例如 Redis 無法連線）視為未命中並計入 errors，不影響請求。
+
+import logging
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
+from urllib.parse import unquote, urlparse
+
+from pydantic import BaseModel
+
+from app import config
+from app.utils import fast_json
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack 為選用相依套件
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackendError(Exception):
+    """後端無法使用（連線失敗、逾時、協定錯誤）"""
+
+
+# ===== 序列化 =====
+
+class OrjsonSerializer:
+    name = "orjson"
+
+    def dumps(self, value):
+        return fast_json.dumps(value)
+
+    def loads(self, data):
+        return fast_json.loads(data)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+class MsgpackSerializer:
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("CACHE_SERIALIZER=msgpack requires the msgpack package")
+
+    def dumps(self, value):
+        return msgpack.packb(value, default=_msgpack_default)
+
+    def loads(self, data):
+        return msgpack.unpackb(data)
+
+
+SERIALIZERS = {"orjson": OrjsonSerializer, "msgpack": MsgpackSerializer}
+
+
+# ===== 後端 =====
+
+class LRUBackend:
+    """
+    行程內 LRU（值不序列化）
+
+    Args:
+        max_entries (int): 最多保存的項目數，超過時淘汰最久未使用的項目
+    """
+
+    serializes = False
+    # 只在目前行程內有效（其他 worker 看不到寫入後遞增的版本）
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # 鍵 -> (到期時間, 值)
+        self._counters = {}  # 版本計數器（不受淘汰影響）
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def counters(self, keys):
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _encode_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise CacheBackendError("Connection closed")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode("utf-8")
+    if kind == b"-":
+        raise CacheBackendError(payload.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise CacheBackendError("Connection closed")
+        return data[:-2]
+    if kind == b"*":
+        count = int(payload)
+        return None if count < 0 else [_read_reply(reader) for _ in range(count)]
+    raise CacheBackendError(f"Unexpected reply {line[:20]!r}")
+
+
+class _Connection:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def execute(self, *args):
+        self.sock.sendall(_encode_command(args))
+        return _read_reply(self.reader)
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    """
+    Redis 協定（RESP2）用戶端，只使用 GET / SET PX / MGET / INCR / SCAN / DEL
+
+    Args:
+        url (str): redis://[:密碼@]主機:埠/資料庫編號
+        prefix (str): 所有鍵的前綴（clear 只刪除此前綴的鍵）
+        timeout (float): 連線與讀寫逾時秒數（逾時視為未命中，不拖慢請求）
+        pool_size (int): 保留的閒置連線數
+        shared (bool): 伺服器是否由所有 worker 共用（行程內的 LocalRedisServer 不是）
+    """
+
+    serializes = True
+
+    def __init__(self, url, prefix="kanahcian:", timeout=0.25, pool_size=8, shared=True):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.shared = shared
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        conn = _Connection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                conn.execute("AUTH", self.password)
+            if self.db:
+                conn.execute("SELECT", self.db)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except OSError as e:
+                raise CacheBackendError(str(e)) from e
+        try:
+            yield conn
+        except (OSError, CacheBackendError) as e:
+            # 連線狀態不明，不放回連線池
+            conn.close()
+            if isinstance(e, CacheBackendError):
+                raise
+            raise CacheBackendError(str(e)) from e
+        else:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def execute(self, *args):
+        with self._connection() as conn:
+            return conn.execute(*args)
+
+    def get(self, key):
+        return self.execute("GET", self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.execute("SET", self.prefix + key, value, "PX", int(ttl * 1000))
+
+    def counters(self, keys):
+        if not keys:
+            return []
+        values = self.execute("MGET", *(self.prefix + key for key in keys))
+        return [int(value) if value is not None else 0 for value in values]
+
+    def incr(self, key):
+        return self.execute("INCR", self.prefix + key)
+
+    def clear(self):
+        cursor = "0"
+        while True:
+            cursor, keys = self.execute("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500)
+            if keys:
+                self.execute("DEL", *keys)
+            cursor = cursor.decode("utf-8") if isinstance(cursor, bytes) else str(cursor)
+            if cursor == "0":
+                return
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class LocalRedisServer:
+    """
+    純 Python 的 Redis 協定伺服器（只支援 RedisBackend 使用的指令），供測試與本機開發使用
+
+    Args:
+        host (str): 監聽位址
+        port (int): 監聽埠，0 表示自動選擇
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._data = {}  # 鍵 -> (到期時間或 None, bytes)
+        self._lock = threading.Lock()
+        store = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        args = _read_reply(self.rfile)
+                    except CacheBackendError:
+                        return
+                    self.wfile.write(store._dispatch(args))
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=True)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="local-redis")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] < now:
+            del self._data[key]
+            return None
+        return entry[1]
+
+    @staticmethod
+    def _bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _dispatch(self, args):
+        if not args:
+            return b"-ERR empty command\r\n"
+        command = args[0].upper()
+        now = time.monotonic()
+        with self._lock:
+            if command == b"GET":
+                return self._bulk(self._live(args[1], now))
+            if command == b"SET":
+                expires = None
+                options = [arg.upper() for arg in args[3:]]
+                if b"PX" in options:
+                    expires = now + int(args[3 + options.index(b"PX") + 1]) / 1000
+                elif b"EX" in options:
+                    expires = now + int(args[3 + options.index(b"EX") + 1])
+                self._data[args[1]] = (expires, args[2])
+                return b"+OK\r\n"
+            if command == b"MGET":
+                return b"*%d\r\n" % (len(args) - 1) + b"".join(self._bulk(self._live(key, now)) for key in args[1:])
+            if command == b"INCR":
+                value = int(self._live(args[1], now) or 0) + 1
+                self._data[args[1]] = (None, str(value).encode())
+                return b":%d\r\n" % value
+            if command == b"DEL":
+                removed = sum(self._data.pop(key, None) is not None for key in args[1:])
+                return b":%d\r\n" % removed
+            if command == b"SCAN":
+                options = [arg.upper() for arg in args[2:]]
+                pattern = args[2 + options.index(b"MATCH") + 1] if b"MATCH" in options else b"*"
+                prefix = pattern[:-1] if pattern.endswith(b"*") else pattern
+                keys = [key for key in self._data if key.startswith(prefix)]
+                return b"*2\r\n$1\r\n0\r\n" + b"*%d\r\n" % len(keys) + b"".join(self._bulk(key) for key in keys)
+            if command in (b"PING", b"SELECT", b"AUTH"):
+                return b"+PONG\r\n" if command == b"PING" else b"+OK\r\n"
+            if command == b"FLUSHDB":
+                self._data.clear()
+                return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % command
+
+
+# ===== 快取 =====
+
+class QueryCache:
+    """
+    Args:
+        backend: LRUBackend / RedisBackend
+        serializer: 後端需要序列化時使用（OrjsonSerializer / MsgpackSerializer）
+        ttl_seconds (float): 預設存活秒數
+    """
+
+    def __init__(self, backend, serializer=None, ttl_seconds=30):
+        self.backend = backend
+        self.serializer = serializer if backend.serializes else None
+        if backend.serializes and self.serializer is None:
+            self.serializer = OrjsonSerializer()
+        self.ttl_seconds = ttl_seconds
+        self._tables = {}  # namespace -> 依賴的資料表
+        self._shared_only = set()  # 只在共用後端時快取的 namespace
+        self._stats = {}  # namespace -> {"hits", "misses", "errors", "get_seconds", "set_seconds"}
+        self._lock = threading.Lock()
+
+    @property
+    def backend_name(self):
+        return type(self.backend).__name__
+
+    def register(self, namespace, tables=(), shared_only=False):
+        """
+        宣告 namespace 依賴的資料表（寫入這些資料表後 namespace 的項目失效）
+
+        Args:
+            shared_only (bool): 只在後端由所有 worker 共用時快取（否則其他 worker 可能在 TTL 內回傳寫入前的資料）
+        """
+        self._tables[namespace] = tuple(tables)
+        if shared_only:
+            self._shared_only.add(namespace)
+        else:
+            self._shared_only.discard(namespace)
+
+    def enabled(self, namespace):
+        """namespace 在目前的後端是否快取"""
+        return self.backend.shared or namespace not in self._shared_only
+
+    def _record(self, namespace, outcome=None, **seconds):
+        with self._lock:
+            stats = self._stats.get(namespace)
+            if stats is None:
+                stats = self._stats[namespace] = {
+                    "hits": 0, "misses": 0, "errors": 0, "get_seconds": 0.0, "set_seconds": 0.0
+                }
+            if outcome is not None:
+                stats[outcome] += 1
+            for name, value in seconds.items():
+                stats[name] += value
+
+    def _versioned_key(self, namespace, key):
+        """快取鍵：namespace、namespace 版本、依賴資料表的版本與 key"""
+        counters = [f"ns:{namespace}"] + [f"table:{table}" for table in self._tables.get(namespace, ())]
+        versions = self.backend.counters(counters)
+        return f"{namespace}:{'.'.join(map(str, versions))}:{key!r}"
+
+    def _lookup(self, namespace, key):
+        """回傳 (版本化的鍵, 值)，未命中時值為 None；後端錯誤時鍵為 None"""
+        started = time.perf_counter()
+        try:
+            versioned = self._versioned_key(namespace, key)
+            value = self.backend.get(versioned)
+            if value is not None and self.serializer is not None:
+                value = self.serializer.loads(value)
+        except Exception as e:
+            self._record(namespace, "errors", get_seconds=time.perf_counter() - started)
+            logger.warning(f"Cache get error ({namespace}): {e}")
+            return None, None
+        self._record(
+            namespace, "hits" if value is not None else "misses", get_seconds=time.perf_counter() - started
+        )
+        return versioned, value
+
+    def _store(self, namespace, versioned, value, ttl):
+        started = time.perf_counter()
+        try:
+            if self.serializer is not None:
+                value = self.serializer.dumps(value)
+            self.backend.set(versioned, value, ttl or self.ttl_seconds)
+        except Exception as e:
+            self._record(namespace, "errors")
+            logger.warning(f"Cache set error ({namespace}): {e}")
+            return
+        self._record(namespace, set_seconds=time.perf_counter() - started)
+
+    def get(self, namespace, key, default=None):
+        """取得快取值，過期、失效、不存在或 namespace 不快取時回傳 default"""
+        if not self.enabled(namespace):
+            return default
+        _, value = self._lookup(namespace, key)
+        return default if value is None else value
+
+    def set(self, namespace, key, value, ttl=None):
+        """寫入快取值（以目前的版本）"""
+        if not self.enabled(namespace):
+            return
+        try:
+            versioned = self._versioned_key(namespace, key)
+        except Exception as e:
+            self._record(namespace, "errors")
+            logger.warning(f"Cache set error ({namespace}): {e}")
+            return
+        self._store(namespace, versioned, value, ttl)
+
+    def get_or_set(self, namespace, key, loader, ttl=None):
+        """
+        取得快取值，不存在時呼叫 loader() 載入並寫入
+
+        版本在載入前取得：載入期間發生的寫入會遞增版本，載入的結果不會被之後的讀取使用
+        """
+        if not self.enabled(namespace):
+            return loader()
+        versioned, value = self._lookup(namespace, key)
+        if value is None:
+            value = loader()
+            if versioned is not None and value is not None:
+                self._store(namespace, versioned, value, ttl)
+        return value
+
+    def invalidate(self, namespace):
+        """讓 namespace 的所有快取失效"""
+        try:
+            self.backend.incr(f"ns:{namespace}")
+        except Exception as e:
+            logger.error(f"Cache invalidate error ({namespace}): {e}")
+
+    def bump_tables(self, tables):
+        """資料表寫入後遞增版本（write_tracker 的訂閱者），只處理有 namespace 依賴的資料表"""
+        watched = {table for dependencies in self._tables.values() for table in dependencies}
+        for table in sorted(set(tables) & watched):
+            try:
+                self.backend.incr(f"table:{table}")
+            except Exception as e:
+                logger.error(f"Cache table version error ({table}): {e}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """各 namespace 的命中、未命中、錯誤次數與累計耗時"""
+        with self._lock:
+            return {namespace: dict(stats) for namespace, stats in self._stats.items()}
+
+    def status(self):
+        """後端、序列化格式、存活秒數與各 namespace 的依賴資料表及統計（/api/admin/cache）"""
+        stats = self.stats()
+        return {
+            "backend": self.backend_name,
+            "shared": self.backend.shared,
+            "serializer": self.serializer.name if self.serializer is not None else None,
+            "ttl_seconds": self.ttl_seconds,
+            "namespaces": {
+                namespace: {
+                    "tables": list(self._tables.get(namespace, ())),
+                    "enabled": self.enabled(namespace),
+                    **stats.get(namespace, {}),
+                }
+                for namespace in sorted(set(self._tables) | set(stats))
+            },
+        }
+
+
+def build_cache(backend=None, url=None, serializer=None, ttl_seconds=30, max_entries=1024):
+    """
+    依設定建立快取
+
+    Args:
+        backend (str): memory / redis / local
+        url (str): redis 後端的網址
+        serializer (str): orjson / msgpack
+    """
+    backend = backend or "memory"
+    serializer = SERIALIZERS[serializer or "orjson"]()
+    if backend == "memory":
+        return QueryCache(LRUBackend(max_entries), ttl_seconds=ttl_seconds)
+    if backend == "redis":
+        if not url:
+            raise ValueError("CACHE_BACKEND=redis requires CACHE_URL")
+        return QueryCache(RedisBackend(url), serializer, ttl_seconds)
+    if backend == "local":
+        # 伺服器在目前行程內，不由其他 worker 共用
+        server = LocalRedisServer().start()
+        return QueryCache(RedisBackend(server.url, shared=False), serializer, ttl_seconds)
+    raise ValueError(f"Unknown CACHE_BACKEND {backend}")
+
+
+# 全局查詢快取實例
+query_cache = build_cache(
+    config.CACHE_BACKEND, config.CACHE_URL, config.CACHE_SERIALIZER,
+    ttl_seconds=config.CACHE_TTL, max_entries=config.CACHE_MAX_ENTRIES
+)
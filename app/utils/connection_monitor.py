@@ -1,99 +1,276 @@
-# app/utils/connection_monitor.py - 連接監控和自動修復
+# app/utils/connection_monitor.py - 事件驅動的連接池管理
+#
+# 以 SQLAlchemy 連接池的 checkout / checkin 事件追蹤每條連線：
+#   - 記錄取得連線的路由與呼叫堆疊、持有時間，找出洩漏的連線
+#   - 只處理持有超過門檻的連線（不再 dispose 整個連接池，避免對 Neon 的重連風暴）
+#   - 依觀察到的同時使用量（EWMA）決定閒置連線保留數量，超出的連線在歸還時關閉
+#     （record.invalidate()，不改變連接池的大小與計數，下次借出時重新連線）
+# 定期工作（tick，由 app/utils/scheduler.py 排程）只讀取記憶體中的統計，不會向資料庫取得連線。
 
 import logging
+import os
+import sys
 import threading
 import time
-from sqlalchemy import text
-from app.database import engine, SessionLocal
+
+from sqlalchemy import event
+
+from app.database import engine, POOL_SIZE
+from app.utils.request_context import current_request
 
 logger = logging.getLogger(__name__)
 
+# 擷取堆疊時只保留 app 套件內的程式碼
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PROJECT_DIR_LENGTH = len(os.path.dirname(_APP_DIR)) + 1
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def capture_app_stack(limit: int = 8):
+    """擷取目前呼叫堆疊中屬於 app 套件的 frame（由內而外），成本遠低於 traceback.extract_stack"""
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < limit:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            frames.append(f"{filename[_PROJECT_DIR_LENGTH:]}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return frames
+
+
+class CheckoutInfo:
+    __slots__ = ("record", "started", "route", "path", "stack", "thread", "soft_invalidated")
+
+    def __init__(self, record, request, stack):
+        self.record = record
+        self.started = time.monotonic()
+        # 請求以外（背景工作、CLI）借出的連線標記為 background
+        self.route = request.label if request is not None else "background"
+        self.path = request.path if request is not None else None
+        self.stack = stack
+        self.thread = threading.current_thread().name
+        self.soft_invalidated = False
+
+    def held_seconds(self, now=None):
+        return (now or time.monotonic()) - self.started
+
+
 class ConnectionMonitor:
-    def __init__(self, check_interval=60, max_connections=20):
+    """
+    Args:
+        check_interval (int): 定期檢查的秒數
+        max_connections (int): 同時借出的連線數超過此值時發出警告
+        leak_threshold (float): 持有超過此秒數的連線標記為軟性失效，歸還後不再重用
+        kill_threshold (float): 持有超過此秒數的連線直接關閉
+        min_idle (int): 閒置連線保留數量的下限
+        capture_stacks (bool): 是否記錄取得連線時的呼叫堆疊
+    """
+
+    def __init__(self, check_interval=60, max_connections=20, leak_threshold=120.0,
+                 kill_threshold=600.0, min_idle=2, capture_stacks=False):
         self.check_interval = check_interval
         self.max_connections = max_connections
-        self.stop_event = threading.Event()
-        self.monitor_thread = None
-        
-    def start_monitoring(self):
-        """開始監控連接池"""
-        if self.monitor_thread is None or not self.monitor_thread.is_alive():
-            self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-            self.monitor_thread.start()
-            logger.info("Connection monitor started")
-    
-    def stop_monitoring(self):
-        """停止監控"""
-        self.stop_event.set()
-        if self.monitor_thread and self.monitor_thread.is_alive():
-            self.monitor_thread.join(timeout=5)
-        logger.info("Connection monitor stopped")
-    
-    def _monitor_loop(self):
-        """監控循環"""
-        while not self.stop_event.is_set():
-            try:
-                self._check_connections()
-                time.sleep(self.check_interval)
-            except Exception as e:
-                logger.error(f"Connection monitor error: {e}")
-                time.sleep(30)  # 錯誤時等待30秒後重試
-    
-    def _check_connections(self):
-        """檢查連接狀態"""
-        try:
-            # 獲取連接池統計
-            pool = engine.pool
-            checked_out = pool.checkedout()
-            pool_size = pool.size()
-            overflow = pool.overflow()
-            
-            logger.info(f"Connection pool status - Size: {pool_size}, Checked out: {checked_out}, Overflow: {overflow}")
-            
-            # 如果連接數過高，執行清理
-            if checked_out > self.max_connections:
-                logger.warning(f"High connection count detected: {checked_out}/{self.max_connections}")
-                self._force_cleanup()
-            
-            # 測試連接有效性
-            self._test_connection()
-            
-        except Exception as e:
-            logger.error(f"Error checking connections: {e}")
-    
-    def _force_cleanup(self):
-        """強制清理連接池"""
-        try:
-            logger.info("Forcing connection pool cleanup...")
-            
-            # 回收所有閒置連接
-            engine.pool.dispose()
-            
-            # 等待一段時間讓連接重新建立
-            time.sleep(5)
-            
-            logger.info("Connection pool cleanup completed")
-            
-        except Exception as e:
-            logger.error(f"Error during connection cleanup: {e}")
-    
-    def _test_connection(self):
-        """測試資料庫連接"""
-        db = None
-        try:
-            db = SessionLocal()
-            result = db.execute(text("SELECT 1")).scalar()
-            if result != 1:
-                logger.warning("Database connection test failed - unexpected result")
-        except Exception as e:
-            logger.error(f"Database connection test failed: {e}")
-        finally:
-            if db:
-                try:
-                    db.close()
-                except Exception as close_error:
-                    logger.error(f"Error closing test connection: {close_error}")
+        self.leak_threshold = leak_threshold
+        self.kill_threshold = kill_threshold
+        self.min_idle = min(min_idle, POOL_SIZE)
+        self.capture_stacks = capture_stacks
+
+        self._lock = threading.Lock()
+        self._checkouts = {}  # id(connection_record) -> CheckoutInfo
+        self._idle_open = set()  # 閒置且連線仍開啟的 id(connection_record)
+        self._attached_pool = None
+        self._listeners = []  # 其他模組（例如洩漏追蹤）的 (on_checkout, on_checkin)
+        self._demand_ewma = 0.0
+        self._peak_since_tick = 0
+        self._idle_target = POOL_SIZE
+        self._stats = {
+            "checkouts": 0,
+            "soft_invalidated": 0,
+            "closed": 0,
+            "idle_closed": 0,
+            "max_held_seconds": 0.0,
+        }
+
+    # ===== 連接池事件 =====
+
+    def attach(self, target=engine):
+        """註冊連接池事件（重複呼叫不會重複註冊）"""
+        if self._attached_pool is target.pool:
+            return
+        event.listen(target, "checkout", self._on_checkout)
+        event.listen(target, "checkin", self._on_checkin)
+        event.listen(target, "close", self._on_close)
+        event.listen(target, "invalidate", self._on_invalidate)
+        self._attached_pool = target.pool
+
+    def detach(self, target=engine):
+        """移除連接池事件"""
+        if self._attached_pool is not target.pool:
+            return
+        event.remove(target, "checkout", self._on_checkout)
+        event.remove(target, "checkin", self._on_checkin)
+        event.remove(target, "close", self._on_close)
+        event.remove(target, "invalidate", self._on_invalidate)
+        self._attached_pool = None
+        with self._lock:
+            self._checkouts.clear()
+            self._idle_open.clear()
+
+    def add_listener(self, on_checkout, on_checkin):
+        """
+        訂閱連線借出與歸還
+
+        Args:
+            on_checkout: callable(CheckoutInfo)
+            on_checkin: callable(CheckoutInfo, held_seconds)
+        """
+        self._listeners.append((on_checkout, on_checkin))
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        info = CheckoutInfo(
+            connection_record,
+            current_request(),
+            capture_app_stack() if self.capture_stacks else None
+        )
+        with self._lock:
+            self._checkouts[id(connection_record)] = info
+            self._idle_open.discard(id(connection_record))
+            self._stats["checkouts"] += 1
+            self._peak_since_tick = max(self._peak_since_tick, len(self._checkouts))
+        for on_checkout, _ in self._listeners:
+            on_checkout(info)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self._release(connection_record)
+        with self._lock:
+            # 閒置的開啟連線已達保留數量時關閉這條連線（紀錄仍回到連接池，下次借出時重新連線）
+            close_idle = dbapi_connection is not None and len(self._idle_open) >= self._idle_target
+            if dbapi_connection is not None and not close_idle:
+                self._idle_open.add(id(connection_record))
+        if close_idle:
+            connection_record.invalidate()
+            self._stats["idle_closed"] += 1
+
+    def _release(self, connection_record):
+        """結束一次借出（歸還或被強制關閉）：更新統計並通知訂閱者，同一次借出只處理一次"""
+        with self._lock:
+            info = self._checkouts.pop(id(connection_record), None)
+        if info is None:
+            return None
+        held = info.held_seconds()
+        if held > self._stats["max_held_seconds"]:
+            self._stats["max_held_seconds"] = held
+        for _, on_checkin in self._listeners:
+            on_checkin(info, held)
+        return info
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self._idle_open.discard(id(connection_record))
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self._idle_open.discard(id(connection_record))
+
+    # ===== 定期檢查 =====
+
+    def tick(self):
+        """一次定期檢查：處理長時間持有的連線、調整閒置連線數量"""
+        self._check_long_held()
+        self._adjust_idle_pool()
+
+        pool = self._attached_pool or engine.pool
+        checked_out = pool.checkedout()
+        logger.info(
+            f"Connection pool status - Idle target: {self._idle_target}, Checked out: {checked_out}, "
+            f"Overflow: {pool.overflow()}, Demand EWMA: {self._demand_ewma:.2f}"
+        )
+        if checked_out > self.max_connections:
+            logger.warning(f"High connection count detected: {checked_out}/{self.max_connections}")
+
+    def _check_long_held(self):
+        """
+        持有超過 leak_threshold 的連線標記為軟性失效（不影響目前的使用者，歸還後下次借出時重新連線），
+        超過 kill_threshold 的連線直接關閉
+        """
+        now = time.monotonic()
+        with self._lock:
+            held = list(self._checkouts.values())
+
+        for info in held:
+            held_seconds = info.held_seconds(now)
+            if held_seconds > self.kill_threshold:
+                logger.error(
+                    f"Closing connection held for {held_seconds:.0f}s by {info.route} "
+                    f"(thread {info.thread}): {info.stack}"
+                )
+                # 先結束這次借出（與歸還相同的路徑），之後使用者歸還時不會重複處理
+                if self._release(info.record) is not None:
+                    info.record.invalidate()
+                    self._stats["closed"] += 1
+            elif held_seconds > self.leak_threshold and not info.soft_invalidated:
+                logger.warning(
+                    f"Possible connection leak: held for {held_seconds:.0f}s by {info.route} "
+                    f"(thread {info.thread}): {info.stack}"
+                )
+                info.record.invalidate(soft=True)
+                info.soft_invalidated = True
+                self._stats["soft_invalidated"] += 1
+
+    def _adjust_idle_pool(self):
+        """
+        依同時使用量的 EWMA 決定閒置連線保留數（介於 min_idle 與 POOL_SIZE）
+
+        只改變保留數量，超出的閒置連線在下次歸還時關閉（_on_checkin）；
+        完全沒有流量時保留的連線由 pool_recycle 處理。
+        """
+        with self._lock:
+            demand = max(self._peak_since_tick, len(self._checkouts))
+            self._peak_since_tick = len(self._checkouts)
+        # 需求上升時立即跟上，下降時緩慢減少
+        if demand > self._demand_ewma:
+            self._demand_ewma = float(demand)
+        else:
+            self._demand_ewma = 0.8 * self._demand_ewma + 0.2 * demand
+
+        self._idle_target = max(self.min_idle, min(POOL_SIZE, round(self._demand_ewma) + 1))
+
+    # ===== 狀態 =====
+
+    def held_connections(self, min_seconds=0.0):
+        """目前借出中的連線（持有時間由長到短）"""
+        now = time.monotonic()
+        with self._lock:
+            held = list(self._checkouts.values())
+        return sorted(
+            (
+                {
+                    "route": info.route,
+                    "path": info.path,
+                    "held_seconds": round(info.held_seconds(now), 3),
+                    "thread": info.thread,
+                    "stack": info.stack,
+                    "soft_invalidated": info.soft_invalidated,
+                }
+                for info in held
+                if info.held_seconds(now) >= min_seconds
+            ),
+            key=lambda item: item["held_seconds"],
+            reverse=True
+        )
+
+    def stats(self):
+        """連接池管理統計"""
+        return {
+            **self._stats,
+            "max_held_seconds": round(self._stats["max_held_seconds"], 3),
+            "checked_out": len(self._checkouts),
+            "idle_open": len(self._idle_open),
+            "demand_ewma": round(self._demand_ewma, 2),
+            "idle_target": self._idle_target,
+            "leak_threshold": self.leak_threshold,
+            "long_held": self.held_connections(min_seconds=self.leak_threshold),
+        }
 
 # 全局監控實例
 connection_monitor = ConnectionMonitor(check_interval=60, max_connections=15)
-
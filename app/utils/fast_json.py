@@ -0,0 +1,66 @@
+# app/utils/fast_json.py - 快速 JSON 編碼
+#
+# 熱門列表端點直接把 Core 查詢結果（dict / tuple）編碼為 JSON bytes，
+# 不經過 Pydantic 模型與 jsonable_encoder。
+# 有安裝 orjson 時使用 orjson（原生支援 date/datetime），否則退回標準函式庫 json。
+
+import json
+from datetime import date, datetime
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 為選用相依套件
+    orjson = None
+
+
+def _default(obj):
+    """編碼 JSON 原生不支援的型別"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    """將物件編碼為 UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """解碼 JSON bytes 或字串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """以 dumps 編碼內容的 JSON 回應"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class RawJSON:
+    """已編碼的 JSON 片段（例如由資料庫組出的陣列），compose_json 會原樣嵌入"""
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data.encode("utf-8") if isinstance(data, str) else data
+
+
+def compose_json(document: dict) -> bytes:
+    """編碼最外層為 dict 的文件，值為 RawJSON 時原樣嵌入，不解析也不重新編碼"""
+    parts = []
+    for key, value in document.items():
+        encoded = value.data if isinstance(value, RawJSON) else dumps(value)
+        parts.append(dumps(str(key)) + b":" + encoded)
+    return b"{" + b",".join(parts) + b"}"
@@ -0,0 +1,47 @@
+# app/utils/fields.py - 稀疏欄位（fields= 查詢參數）工具
+#
+# field map 以有序 dict 表示：API 欄位名稱 → ORM 欄位屬性，順序即預設回傳順序。
+# 只載入呼叫端要求的欄位（load_only），序列化時也只輸出這些欄位。
+
+from typing import List, Optional
+
+
+def parse_fields(fields: Optional[str], field_map: dict) -> List[str]:
+    """
+    解析逗號分隔的 fields 參數
+
+    Args:
+        fields (str): 例如 "id,name"，未提供時代表全部欄位
+        field_map (dict): API 欄位名稱 → ORM 欄位屬性
+
+    Returns:
+        List[str]: 依 field_map 順序排列、不重複的欄位名稱
+
+    Raises:
+        ValueError: 包含不存在的欄位或沒有任何欄位
+    """
+    if fields is None:
+        return list(field_map)
+
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - field_map.keys()
+    if unknown:
+        raise ValueError(
+            f"不支援的欄位: {', '.join(sorted(unknown))}（可用欄位: {', '.join(field_map)}）"
+        )
+    if not requested:
+        raise ValueError("fields 至少需要一個欄位")
+    return [name for name in field_map if name in requested]
+
+
+def load_columns(field_map: dict, selected: List[str], *required) -> list:
+    """回傳需要載入的 ORM 欄位屬性（selected 對應的欄位加上 required）"""
+    columns = [field_map[name] for name in selected]
+    keys = {column.key for column in columns}
+    columns.extend(column for column in required if column.key not in keys)
+    return columns
+
+
+def pick_fields(obj, field_map: dict, selected: List[str]) -> dict:
+    """將 ORM 物件序列化為只包含 selected 欄位的 dict"""
+    return {name: getattr(obj, field_map[name].key) for name in selected}
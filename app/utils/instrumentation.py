@@ -0,0 +1,206 @@
+# app/utils/instrumentation.py - Server-Timing：每個請求各階段的耗時
+#
+# 回應帶有瀏覽器開發者工具可顯示的 Server-Timing 標頭：
+#   db        SQL 執行時間（來自查詢計數）
+#   orm       crud 函式內扣除 SQL 的時間（建立 ORM 物件、組資料）
+#   crud      crud 函式的總時間（以 instrument_crud 標記，巢狀呼叫只計最外層）
+#   handler   路由函式的總時間（含 crud）
+#   serialize 路由函式回傳後的回應模型驗證與 JSON 編碼（另含參數解析與依賴注入）
+#   session   get_db / get_read_db 關閉 session（回滾並歸還連線）的時間
+#   total     從進入 middleware 到送出回應標頭
+# 依 SERVER_TIMING_SAMPLE_RATE 抽樣，未抽中的請求只多一次 ContextVar 讀取；
+# 請求帶有 X-Server-Timing: 1 標頭時一定量測。
+# 同一組掛勾在追蹤（app/utils/tracing.py）開啟時也會建立 handler / crud / serialize span。
+
+import functools
+import inspect
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+
+from app.utils.query_counter import current_query_stats
+from app.utils.tracing import current_span_id, current_trace, span
+
+
+class Timings:
+    __slots__ = ("phases", "crud_depth")
+
+    def __init__(self):
+        self.phases = {}
+        self.crud_depth = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+_current_timings: ContextVar[Optional[Timings]] = ContextVar("server_timings", default=None)
+
+
+def current_timings() -> Optional[Timings]:
+    """目前請求的階段耗時，未抽樣或不在請求中時回傳 None"""
+    return _current_timings.get()
+
+
+def _db_time():
+    stats = current_query_stats()
+    return stats.db_time if stats is not None else 0.0
+
+
+def _call_timed_crud(func, args, kwargs):
+    timings = _current_timings.get()
+    if timings is None or timings.crud_depth:
+        return func(*args, **kwargs)
+    timings.crud_depth += 1
+    started, db_started = time.perf_counter(), _db_time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings.crud_depth -= 1
+        timings.add("crud", time.perf_counter() - started)
+        timings.add("crud_db", _db_time() - db_started)
+
+
+def instrument_crud(func):
+    """標記 crud 函式，記錄其總時間與其中的 SQL 時間，追蹤開啟時建立 crud span"""
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if current_trace() is None:
+            return _call_timed_crud(func, args, kwargs)
+        with span(name, "crud"):
+            return _call_timed_crud(func, args, kwargs)
+    return wrapper
+
+
+@contextmanager
+def timed(phase):
+    """量測一段程式碼的耗時並計入指定階段"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - started)
+
+
+def _timed_endpoint(endpoint):
+    """包裝路由函式以記錄 handler 階段（保留原函式簽章供 FastAPI 解析參數）"""
+    if not callable(endpoint) or getattr(endpoint, "_server_timing", False):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        trace = current_trace()
+        if trace is None:
+            with timed("handler"):
+                return endpoint(*args, **kwargs)
+        try:
+            with timed("handler"), span(endpoint.__name__, "handler"):
+                return endpoint(*args, **kwargs)
+        finally:
+            trace.handler_end = time.perf_counter()
+
+    wrapper._server_timing = True
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """記錄 handler 與 serialize 階段的路由類別（APIRouter(route_class=TimedRoute)）"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        # 非同步路由需要保持 coroutine function，只包裝同步路由
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _timed_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = _current_timings.get()
+            trace = current_trace()
+            if timings is None and trace is None:
+                return await handler(request)
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                ended = time.perf_counter()
+                if timings is not None:
+                    timings.add("route", ended - started)
+                if trace is not None and trace.handler_end is not None:
+                    # 路由函式回傳後到回應產生完成：回應模型驗證與 JSON 編碼
+                    trace.close(trace.open("serialize", "serialize", current_span_id(), started=trace.handler_end), ended)
+
+        return timed_handler
+
+
+def format_server_timing(timings, total, query_count=0):
+    """組出 Server-Timing 標頭值（毫秒）"""
+    phases = timings.phases
+    db = _db_time()
+    entries = [("db", db, f"{query_count} queries")]
+    if "crud" in phases:
+        entries.append(("orm", max(0.0, phases["crud"] - phases.get("crud_db", 0.0)), None))
+        entries.append(("crud", phases["crud"], None))
+    if "handler" in phases:
+        entries.append(("handler", phases["handler"], None))
+        if "route" in phases:
+            entries.append(("serialize", max(0.0, phases["route"] - phases["handler"]), None))
+    if "session" in phases:
+        entries.append(("session", phases["session"], None))
+    entries.append(("total", total, None))
+    return ", ".join(
+        f'{name};dur={seconds * 1000:.1f}' + (f';desc="{desc}"' if desc else "")
+        for name, seconds, desc in entries
+    )
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware：抽樣量測請求各階段耗時並加上 Server-Timing 標頭
+
+    Args:
+        sample_rate (float): 量測的請求比例（0 到 1）
+    """
+
+    def __init__(self, app, sample_rate=1.0):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    def _sampled(self, scope):
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            return True
+        return any(name == b"x-server-timing" and value == b"1" for name, value in scope["headers"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = _current_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                stats = current_query_stats()
+                headers = MutableHeaders(scope=message)
+                headers["Server-Timing"] = format_server_timing(
+                    timings, time.perf_counter() - started, stats.count if stats is not None else 0
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
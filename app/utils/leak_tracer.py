@@ -0,0 +1,88 @@
+# app/utils/leak_tracer.py - 連線洩漏追蹤（選用，POOL_LEAK_TRACER=1 開啟）
+#
+# 建立在 ConnectionMonitor 的 checkout / checkin 事件上：
+#   - 借出連線時記錄請求路徑與呼叫堆疊（只走訪 frame，不格式化完整 traceback）
+#   - 依路由統計連線持有時間的直方圖，找出哪個路由長時間佔用或洩漏連線
+# 每次借出/歸還只有一次堆疊走訪與幾次 dict 操作，可在正式環境常駐開啟。
+
+import bisect
+import threading
+
+# 持有時間直方圖的上界（秒），最後一格為 +Inf
+HOLD_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(HOLD_TIME_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(HOLD_TIME_BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(HOLD_TIME_BUCKETS + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "avg_seconds": round(self.total / self.count, 4) if self.count else 0.0,
+            "max_seconds": round(self.max, 4),
+            "buckets": buckets,
+        }
+
+
+class LeakTracer:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}  # 路由 -> _Histogram
+        self._active = {}  # 路由 -> 目前借出數
+
+    def enable(self, monitor):
+        """開啟追蹤：要求 monitor 記錄呼叫堆疊並訂閱其連線事件"""
+        if self.enabled:
+            return
+        monitor.capture_stacks = True
+        monitor.add_listener(self._on_checkout, self._on_checkin)
+        self.enabled = True
+
+    def _on_checkout(self, info):
+        with self._lock:
+            self._active[info.route] = self._active.get(info.route, 0) + 1
+
+    def _on_checkin(self, info, held_seconds):
+        with self._lock:
+            self._active[info.route] = self._active.get(info.route, 1) - 1
+            histogram = self._histograms.get(info.route)
+            if histogram is None:
+                histogram = self._histograms[info.route] = _Histogram()
+            histogram.observe(held_seconds)
+
+    def route_histograms(self):
+        """各路由的連線持有時間直方圖（依總持有時間排序）"""
+        with self._lock:
+            items = [
+                (route, histogram.total, {**histogram.snapshot(), "active": self._active.get(route, 0)})
+                for route, histogram in self._histograms.items()
+            ]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return {route: snapshot for route, _, snapshot in items}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._active.clear()
+
+# 全局追蹤實例
+leak_tracer = LeakTracer()
@@ -0,0 +1,242 @@
+# app/utils/memory.py - 記憶體分析
+#
+# 找出造成記憶體尖峰（例如一次載入含照片的所有紀錄與地點）的端點：
+#   - tracemalloc 快照：開始追蹤、拍攝快照、列出配置最多的位置、比較兩個快照的差異
+#   - session：目前存活的 session 持有多少 ORM 物件，各路由單一 session 載入的最大物件數
+#   - 最大的回應：建立過的最大回應 body 與其路由（由 MetricsMiddleware 記錄）
+# tracemalloc 會讓配置變慢，只在需要時由管理端點開啟。
+
+import heapq
+import itertools
+import os
+import resource
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.utils.request_context import current_route_label
+
+# 快照中不需要的配置來源
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def process_memory():
+    """目前行程的 RSS 與最大 RSS（bytes）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Linux 以 KiB 回報
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    return {"rss_bytes": current, "max_rss_bytes": peak}
+
+
+class SnapshotStore:
+    """
+    tracemalloc 快照（只保留最近幾個，快照本身也佔記憶體）
+
+    Args:
+        keep (int): 保留的快照數量
+    """
+
+    def __init__(self, keep=5):
+        self.keep = keep
+        self._snapshots = OrderedDict()  # id -> (時間, 快照)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, frames=25):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    def status(self):
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            snapshots = [{"id": snapshot_id, "taken_at": taken_at} for snapshot_id, (taken_at, _) in self._snapshots.items()]
+        return {
+            "tracing": True,
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "snapshots": snapshots,
+        }
+
+    def take(self):
+        """
+        拍攝快照並回傳 ID
+
+        Raises:
+            RuntimeError: 尚未開始追蹤
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            snapshot_id = next(self._ids)
+            self._snapshots[snapshot_id] = (time.time(), snapshot)
+            while len(self._snapshots) > self.keep:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(snapshot_id)
+        return entry[1]
+
+    @staticmethod
+    def _format_traceback(traceback):
+        return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+
+    def top(self, snapshot_id, limit=20, group_by="lineno"):
+        """配置最多的位置"""
+        stats = self.get(snapshot_id).statistics(group_by)
+        return [
+            {
+                "size_bytes": stat.size,
+                "count": stat.count,
+                "traceback": self._format_traceback(stat.traceback),
+            }
+            for stat in stats[:limit]
+        ]
+
+    def diff(self, base_id, target_id, limit=20, group_by="lineno"):
+        """兩個快照之間增加最多的位置"""
+        stats = self.get(target_id).compare_to(self.get(base_id), group_by)
+        return [
+            {
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "traceback": self._format_traceback(stat.traceback),
+            }
+            for stat in stats[:limit]
+        ]
+
+
+class SessionTracker:
+    """
+    記錄 session 載入的 ORM 物件數（session 以 WeakSet 保存，不影響回收）
+
+    identity map 以弱參照保存物件，路由回傳後物件多半已被回收，
+    因此另外以 loaded_as_persistent 事件累計每個 session 載入過的物件數。
+    """
+
+    def __init__(self):
+        self._sessions = weakref.WeakSet()
+        self._peaks = {}  # 路由 -> {"max_loaded", "closes"}
+        self._lock = threading.Lock()
+
+    def install(self):
+        """註冊 ORM 物件載入事件（重複呼叫不會重複註冊）"""
+        if not event.contains(Session, "loaded_as_persistent", _on_loaded):
+            event.listen(Session, "loaded_as_persistent", _on_loaded)
+
+    def track(self, session):
+        session.info[_LOADED_KEY] = 0
+        session.info[_ROUTE_KEY] = current_route_label(default="background")
+        with self._lock:
+            self._sessions.add(session)
+
+    def closing(self, session):
+        """session 關閉前呼叫，記錄載入過的物件數"""
+        loaded = session.info.get(_LOADED_KEY, 0)
+        route = session.info.get(_ROUTE_KEY, "background")
+        with self._lock:
+            peak = self._peaks.setdefault(route, {"max_loaded": 0, "closes": 0})
+            peak["closes"] += 1
+            if loaded > peak["max_loaded"]:
+                peak["max_loaded"] = loaded
+
+    def live_sessions(self):
+        """目前存活的 session：identity map 中的物件數與載入過的物件數（多的在前）"""
+        with self._lock:
+            sessions = list(self._sessions)
+        return sorted(
+            (
+                {
+                    "route": session.info.get(_ROUTE_KEY),
+                    "identity_map": len(session.identity_map),
+                    "loaded": session.info.get(_LOADED_KEY, 0),
+                }
+                for session in sessions
+            ),
+            key=lambda item: item["loaded"],
+            reverse=True
+        )
+
+    def route_peaks(self):
+        """各路由單一 session 載入的最大物件數"""
+        with self._lock:
+            return dict(sorted(self._peaks.items(), key=lambda item: item[1]["max_loaded"], reverse=True))
+
+
+_LOADED_KEY = "memory_loaded_objects"
+_ROUTE_KEY = "memory_route"
+
+
+def _on_loaded(session, instance):
+    info = session.info
+    if _LOADED_KEY in info:
+        info[_LOADED_KEY] += 1
+
+
+class LargestResponses:
+    """
+    建立過的最大回應 body（只保留前 keep 名）
+
+    Args:
+        keep (int): 保留的筆數
+    """
+
+    def __init__(self, keep=20):
+        self.keep = keep
+        self._heap = []  # (size, 序號, 內容)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, size, method, route, path):
+        # 大部分回應小於目前第 keep 名，不需取得鎖
+        if len(self._heap) >= self.keep and size <= self._heap[0][0]:
+            return
+        entry = (size, next(self._counter), {
+            "size_bytes": size,
+            "route": f"{method} {route}",
+            "path": path,
+            "timestamp": time.time(),
+        })
+        with self._lock:
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, entry)
+            elif size > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def top(self):
+        with self._lock:
+            entries = sorted(self._heap, reverse=True)
+        return [entry[2] for entry in entries]
+
+
+# 全局實例
+snapshot_store = SnapshotStore()
+session_tracker = SessionTracker()
+largest_responses = LargestResponses()
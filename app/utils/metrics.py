@@ -0,0 +1,412 @@
+# app/utils/metrics.py - Prometheus 文字格式的 /metrics
+#
+# 每個 worker 在記憶體中累計（每個指標一個鎖，只在更新 dict 時持有），抓取時才輸出：
+#   - 各路由的請求數、延遲與回應大小直方圖、處理中的請求數
+#   - 連接池借出連線的等待時間直方圖與連線數
+#   - 快取命中與未命中次數（命中率）、各路由送出的 SQL 數量與資料庫時間
+# 多個 uvicorn worker 時設定 PROMETHEUS_MULTIPROC_DIR：各 worker 定期把快照寫到該目錄
+# （metrics-<pid>.json，以 os.replace 原子替換），被抓取的 worker 合併所有快照後輸出。
+# counter 與 histogram 加總所有快照（包含已結束的 worker），gauge 只加總仍在執行的 worker。
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+from app.utils.fast_json import dumps, loads
+from app.utils.memory import largest_responses
+from app.utils.query_counter import current_query_stats
+from app.utils.request_context import current_request, UNMATCHED_ROUTE
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 標籤值 tuple -> 數值
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(labels), self._copy(value)] for labels, value in self._values.items()]
+        return {"kind": self.kind, "help": self.documentation, "labelnames": list(self.labelnames), "values": values}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, *labels, value):
+        """以外部累計的數值更新（例如快取本身記錄的命中次數）"""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [各區間次數（非累計，最後一格為 +Inf）, 總和]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            state[1] += value
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+    def snapshot(self):
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+# ===== 輸出 =====
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def render(snapshot):
+    """將快照輸出為 Prometheus 文字格式"""
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for labels, value in sorted(metric["values"], key=lambda item: item[0]):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {value}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], counts):
+                cumulative += count
+                le = f'le="{_format_bound(bound)}"'
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {total}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def merge(snapshots):
+    """合併多個 worker 的快照：[(快照, worker 是否仍在執行)]"""
+    merged = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                current = target["values"].get(key)
+                if current is None:
+                    target["values"][key] = value
+                elif metric["kind"] == "histogram":
+                    target["values"][key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+                else:
+                    target["values"][key] = current + value
+    for metric in merged.values():
+        metric["values"] = [[list(labels), value] for labels, value in metric["values"].items()]
+    return merged
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """
+    Args:
+        multiprocess_dir (str): 多 worker 時存放各 worker 快照的目錄，None 表示單一行程
+    """
+
+    def __init__(self, multiprocess_dir=None):
+        self.multiprocess_dir = multiprocess_dir
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """抓取前呼叫的函式，用於更新由其他模組累計的數值"""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector error: {e}")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    # ===== 多 worker =====
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.multiprocess_dir, f"metrics-{pid}.json")
+
+    def write_snapshot(self):
+        """將本 worker 的快照原子寫入 multiprocess_dir"""
+        path = self._snapshot_path(os.getpid())
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+    def _read_snapshots(self):
+        snapshots = []
+        for filename in os.listdir(self.multiprocess_dir):
+            if not (filename.startswith("metrics-") and filename.endswith(".json")):
+                continue
+            try:
+                pid = int(filename[len("metrics-"):-len(".json")])
+                with open(os.path.join(self.multiprocess_dir, filename), "rb") as f:
+                    snapshots.append((loads(f.read()), _pid_alive(pid)))
+            except (ValueError, OSError) as e:
+                logger.warning(f"Skipping metrics snapshot {filename}: {e}")
+        return snapshots
+
+    def flush(self):
+        """寫入本 worker 的快照（由排程定期呼叫，多 worker 時其他 worker 的數值最多延遲一個間隔）"""
+        if self.multiprocess_dir is None:
+            return
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        self.write_snapshot()
+
+    def collect(self):
+        """輸出目前的指標（多 worker 時合併所有 worker 的快照）"""
+        if self.multiprocess_dir is None:
+            return render(self.snapshot())
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        self.write_snapshot()
+        return render(merge(self._read_snapshots()))
+
+
+registry = MetricsRegistry(os.getenv("PROMETHEUS_MULTIPROC_DIR") or None)
+
+# ===== 指標 =====
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "HTTP requests being processed", ("method", "route"))
+HTTP_RESPONSE_SIZE = registry.histogram(
+    "http_response_size_bytes", "HTTP response body size", ("method", "route"), buckets=SIZE_BUCKETS)
+DB_STATEMENTS = registry.counter(
+    "db_statements_total", "SQL statements executed by requests", ("method", "route"))
+DB_TIME = registry.counter(
+    "db_statement_seconds_total", "Time spent in SQL statements by requests", ("method", "route"))
+POOL_CHECKOUT_WAIT = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time to check out a connection from the pool (includes pre-ping)")
+POOL_CONNECTIONS = registry.gauge(
+    "db_pool_connections", "Pool connections by state", ("state",))
+# 命中率以 rate(cache_requests_total{result="hit"}) / rate(cache_requests_total) 計算，多 worker 時才能正確加總
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total", "Cache lookups by result", ("namespace", "result"))
+CACHE_SECONDS = registry.counter(
+    "cache_operation_seconds_total", "Time spent in cache backend calls", ("namespace", "operation"))
+SCHEDULER_JOB_DURATION = registry.histogram(
+    "scheduler_job_duration_seconds", "Background job run time", ("job",))
+SCHEDULER_JOB_RUNS = registry.counter(
+    "scheduler_job_runs_total", "Background job runs by outcome", ("job", "outcome"))
+
+
+class MetricsMiddleware:
+    """ASGI middleware：記錄每個請求的延遲、回應大小、狀態碼與 SQL 數量"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        info = current_request()
+        route = info.route if info is not None else UNMATCHED_ROUTE
+        response = {"status": 500, "size": 0}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            HTTP_IN_FLIGHT.dec(method, route)
+            HTTP_LATENCY.observe(time.perf_counter() - started, method, route)
+            HTTP_RESPONSE_SIZE.observe(response["size"], method, route)
+            largest_responses.record(response["size"], method, route, scope["path"])
+            HTTP_REQUESTS.inc(method, route, str(response["status"]))
+            stats = current_query_stats()
+            if stats is not None and stats.count:
+                DB_STATEMENTS.inc(method, route, amount=stats.count)
+                DB_TIME.inc(method, route, amount=stats.db_time)
+
+
+class _PoolState:
+    """以連接池事件追蹤每條連線紀錄的狀態（不讀取連接池內部的計數）"""
+
+    def __init__(self):
+        self.checked_out = set()  # id(connection_record)
+        self.idle = set()  # 閒置且連線仍開啟的 id(connection_record)
+        self._lock = threading.Lock()
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.idle.discard(id(connection_record))
+            self.checked_out.add(id(connection_record))
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out.discard(id(connection_record))
+            # 借出期間被關閉（invalidate）的連線歸還後不算閒置連線
+            if dbapi_connection is not None:
+                self.idle.add(id(connection_record))
+
+    def on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.idle.discard(id(connection_record))
+
+    def on_detach(self, dbapi_connection, connection_record):
+        # 脫離連接池的連線不再歸還，也不再由連接池關閉
+        with self._lock:
+            self.checked_out.discard(id(connection_record))
+            self.idle.discard(id(connection_record))
+
+    def counts(self):
+        with self._lock:
+            return len(self.checked_out), len(self.idle)
+
+
+def instrument_engine(target):
+    """
+    記錄 engine 連接池的借出等待時間與連線數
+
+    連線數由 checkout / checkin / close / detach 事件追蹤；事件註冊在 engine 上，
+    engine.dispose() 或 pool.recreate() 建立的新連接池會沿用。
+    SQLAlchemy 沒有「開始借出」的事件，等待時間由 engine.raw_connection()（Connection 取得連線的入口）量測。
+    """
+    if getattr(target, "_metrics_instrumented", False):
+        return None
+    state = _PoolState()
+    event.listen(target, "checkout", state.on_checkout)
+    event.listen(target, "checkin", state.on_checkin)
+    event.listen(target, "close", state.on_close)
+    event.listen(target, "detach", state.on_detach)
+
+    raw_connection = target.raw_connection
+
+    def timed_raw_connection():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+    target.raw_connection = timed_raw_connection
+    target._metrics_instrumented = True
+
+    def collect_pool():
+        checked_out, idle = state.counts()
+        size = target.pool.size() if hasattr(target.pool, "size") else checked_out + idle
+        POOL_CONNECTIONS.set("checked_out", value=checked_out)
+        POOL_CONNECTIONS.set("idle", value=idle)
+        # 超過 pool_size 的連線數（max_overflow 額度的使用量）
+        POOL_CONNECTIONS.set("overflow", value=max(0, checked_out + idle - size))
+
+    registry.add_collector(collect_pool)
+    return state
+
+
+def track_cache(cache):
+    """抓取時讀取快取各 namespace 的命中統計與後端耗時"""
+    def collect_cache():
+        for namespace, stats in cache.stats().items():
+            CACHE_REQUESTS.set_total(namespace, "hit", value=stats["hits"])
+            CACHE_REQUESTS.set_total(namespace, "miss", value=stats["misses"])
+            CACHE_REQUESTS.set_total(namespace, "error", value=stats["errors"])
+            CACHE_SECONDS.set_total(namespace, "get", value=stats["get_seconds"])
+            CACHE_SECONDS.set_total(namespace, "set", value=stats["set_seconds"])
+
+    registry.add_collector(collect_cache)
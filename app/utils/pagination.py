@@ -0,0 +1,34 @@
+# app/utils/pagination.py - Keyset (cursor) 分頁工具
+#
+# cursor 是排序鍵值的不透明字串（URL-safe base64 編碼的 JSON 陣列），
+# 下一頁以 "排序鍵 > 上一頁最後一筆" 查詢，深分頁與第一頁成本相同。
+
+import base64
+import json
+
+
+def encode_cursor(*values) -> str:
+    """將排序鍵值編碼為 cursor 字串"""
+    raw = json.dumps(list(values), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    解碼 cursor 字串
+
+    Args:
+        cursor (str): encode_cursor 產生的字串
+        size (int): 預期的排序鍵數量
+
+    Raises:
+        ValueError: cursor 格式錯誤
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"無效的 cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError(f"無效的 cursor: {cursor}")
+    return values
@@ -0,0 +1,161 @@
+# app/utils/profiler.py - 隨選的取樣式效能分析（flame graph）
+#
+# 在呼叫的執行緒中以固定間隔讀取 sys._current_frames()，記錄同一個 worker 行程內
+# 其他執行緒（事件迴圈、threadpool 中的同步路由、背景工作）的呼叫堆疊。
+# 不需要重新啟動或安裝任何 profiler，每次取樣只走訪 frame，對請求的影響很小。
+# 輸出格式：
+#   collapsed   每行「執行緒;外層函式;...;內層函式 次數」，可給 flamegraph.pl 或 speedscope
+#   speedscope  https://www.speedscope.app 的 JSON 檔案格式
+# 多個 uvicorn worker 時只會分析處理該請求的 worker。
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# 閒置中的執行緒（等待工作、等待 I/O）的最內層 frame，預設不計入
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_thread.py", "_worker"),
+}
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PROJECT_DIR = os.path.dirname(_APP_DIR) + os.sep
+
+
+class ProfilerBusy(Exception):
+    """已有另一個分析正在執行"""
+
+
+def _short_filename(filename):
+    if filename.startswith(_PROJECT_DIR):
+        return filename[len(_PROJECT_DIR):]
+    marker = filename.rfind("site-packages" + os.sep)
+    if marker != -1:
+        return filename[marker + len("site-packages") + 1:]
+    return os.path.basename(filename)
+
+
+class SamplingProfiler:
+    """
+    Args:
+        interval (float): 取樣間隔秒數
+        include_idle (bool): 是否計入閒置中的執行緒
+    """
+
+    _lock = threading.Lock()  # 同一行程同時只執行一個分析
+
+    def __init__(self, interval=0.01, include_idle=False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = Counter()  # (執行緒名稱, (code, ...) 由外而內) -> 次數
+        self.duration = 0.0
+        self.sample_count = 0
+
+    def _is_idle(self, frame):
+        return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+    def _sample(self, own_ident):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if not self.include_idle and self._is_idle(frame):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[(names.get(ident, str(ident)), tuple(stack))] += 1
+
+    def run(self, seconds):
+        """
+        在目前的執行緒中取樣 seconds 秒（會阻塞）
+
+        Raises:
+            ProfilerBusy: 已有另一個分析正在執行
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            own_ident = threading.get_ident()
+            started = time.perf_counter()
+            deadline = started + seconds
+            next_sample = started
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if now < next_sample:
+                    time.sleep(next_sample - now)
+                self._sample(own_ident)
+                self.sample_count += 1
+                # 取樣落後時不補取，避免連續取樣造成額外負擔
+                next_sample = max(next_sample + self.interval, time.perf_counter())
+            self.duration = time.perf_counter() - started
+        finally:
+            self._lock.release()
+        return self
+
+    # ===== 輸出 =====
+
+    @staticmethod
+    def _frame_name(code):
+        return f"{code.co_name} ({_short_filename(code.co_filename)}:{code.co_firstlineno})"
+
+    def collapsed(self):
+        """collapsed stacks 格式（次數多的在前）"""
+        lines = []
+        for (thread_name, stack), count in self.samples.most_common():
+            frames = ";".join(self._frame_name(code) for code in stack)
+            lines.append(f"{thread_name};{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name="kanahcian-backend"):
+        """speedscope 檔案格式（每個執行緒一個 sampled profile）"""
+        frames = []
+        frame_index = {}
+        profiles = {}
+        weight = round(self.interval * 1000, 3)
+        for (thread_name, stack), count in self.samples.items():
+            indexes = []
+            for code in stack:
+                index = frame_index.get(code)
+                if index is None:
+                    index = frame_index[code] = len(frames)
+                    frames.append({
+                        "name": code.co_name,
+                        "file": _short_filename(code.co_filename),
+                        "line": code.co_firstlineno,
+                    })
+                indexes.append(index)
+            profile = profiles.setdefault(thread_name, {"samples": [], "weights": []})
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * weight)
+
+        end_value = round(self.duration * 1000, 3)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "kanahcian-backend profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": end_value,
+                    "samples": profile["samples"],
+                    "weights": profile["weights"],
+                }
+                for thread_name, profile in sorted(profiles.items())
+            ],
+        }
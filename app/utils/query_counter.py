@@ -0,0 +1,136 @@
+# app/utils/query_counter.py - 每個請求的查詢數與資料庫時間、N+1 偵測
+#
+# 以 engine 的 before/after_cursor_execute 事件計算目前請求送出的 SQL 數量與耗時，
+# 同一個語句形狀（參數化後的 SQL）在一個請求中重複多次時標記為可能的 N+1。
+# 結果以回應標頭回傳：
+#   X-DB-Query-Count  查詢數
+#   X-DB-Time-Ms      資料庫耗時（毫秒，含驅動程式取回結果的時間）
+#   X-DB-N-Plus-One   重複次數達門檻的語句形狀數量（沒有時不送出）
+# 不在請求中（背景工作、CLI）的查詢不計算。
+
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from app.utils.request_context import current_route_label
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w%$])\d+(?:\.\d+)?\b")
+# IN (?, ?, ?) 等展開後的參數列表，長度不同仍視為同一形狀
+_PLACEHOLDER = r"(?:\?|%\(\w+\)s|%s|:\w+|\$\d+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(statement: str) -> str:
+    """將 SQL 正規化為語句形狀：合併空白、以 ? 取代常值、合併參數列表"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    return _PLACEHOLDER_LIST.sub("(?...)", shape)
+
+
+class QueryStats:
+    __slots__ = ("count", "db_time", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.db_time += elapsed
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        """重複次數達門檻的語句形狀 [(形狀, 次數)]，次數多的在前"""
+        # 原始 SQL 不同但形狀相同（常值寫在 SQL 中、IN 列表長度不同）也合併計算
+        merged = Counter()
+        for statement, count in self.statements.items():
+            merged[statement_shape(statement)] += count
+        return [(shape, count) for shape, count in merged.most_common() if count >= threshold]
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    """目前請求的查詢統計，不在請求中時回傳 None"""
+    return _current_stats.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None and context is not None:
+        context._query_counter_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    started = getattr(context, "_query_counter_started", None)
+    if stats is None or started is None:
+        return
+    stats.record(statement, time.perf_counter() - started)
+
+
+def install(target):
+    """在 engine 上註冊查詢計數事件（重複呼叫不會重複註冊）"""
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryCounterMiddleware:
+    """
+    ASGI middleware：統計每個請求的查詢數與資料庫時間，寫入回應標頭與日誌
+
+    Args:
+        n_plus_one_threshold (int): 同一語句形狀在一個請求中執行達此次數時標記為 N+1
+    """
+
+    def __init__(self, app, n_plus_one_threshold=5):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        repeated = []
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                repeated[:] = stats.repeated(self.n_plus_one_threshold)
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Query-Count"] = str(stats.count)
+                headers["X-DB-Time-Ms"] = f"{stats.db_time * 1000:.1f}"
+                if repeated:
+                    headers["X-DB-N-Plus-One"] = str(len(repeated))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current_stats.reset(token)
+            self._log(stats, repeated)
+
+    def _log(self, stats, repeated):
+        if not stats.count:
+            return
+        label = current_route_label(default="")
+        logger.debug(f"{label}: {stats.count} queries, {stats.db_time * 1000:.1f}ms in database")
+        for shape, count in repeated:
+            logger.warning(f"Possible N+1 in {label}: {count} executions of {shape[:300]}")
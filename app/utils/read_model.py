@@ -0,0 +1,422 @@
+# app/utils/read_model.py - 多 worker 共用的唯讀資料快照（mmap）
+#
+# 地點等常讀少寫的資料，寫成一個不可變、有版本號的二進位檔案，
+# 每個 worker 以 mmap 唯讀映射（同一台機器上共用 page cache，worker 增加時記憶體不會跟著倍增），
+# 讀取時才解碼需要的資料列。
+#
+# 檔案格式（little-endian，所有區段以 8 bytes 對齊）：
+#   檔頭      magic "KRM1"、格式版本、資料版本、來源時間（ns）、建立時間（ns）、資料表數
+#   目錄      每個資料表：名稱（32 bytes）、區段位移、列數、欄數
+#   資料表    欄位名稱；第一欄（主鍵）的 int64 陣列（已排序，供二分搜尋）；
+#             每列在資料區的 uint32 位移（列數 + 1 個）；資料區（每個值 = 型別 1 byte + 內容）
+#
+# 一致性：
+#   - 寫入來源資料表的交易提交後（app/utils/write_tracker.py）更新該快照資料表的 <path>.dirty.<資料表> 時間；
+#     快照的來源時間早於此時間時該資料表視為過期，讀取端改為查詢資料庫（不會讀到比自己剛寫入的資料更舊的內容），
+#     其他資料表不受影響
+#   - 超過 max_age 秒的快照也視為過期（其他機器上的 worker 寫入不會更新本機的 dirty 檔）
+#   - 重建時以 <path>.lock 的 flock 確保同一台機器只有一個 worker 執行，寫入暫存檔後 os.replace，
+#     讀取端發現檔案被替換時重新映射，所有 worker 看到同一個版本
+
+import bisect
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import date
+
+from app import config
+from app.utils.write_tracker import write_tracker
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"KRM1"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHQqqI4x")  # magic, 格式版本, 保留, 資料版本, 來源時間, 建立時間, 資料表數
+_DIRECTORY = struct.Struct("<32sQII")  # 名稱, 位移, 列數, 欄數
+
+# 值的型別標記
+_NONE, _INT, _STR, _DATE, _LIST, _BOOL, _FLOAT = range(7)
+_I64 = struct.Struct("<q")
+_U32 = struct.Struct("<I")
+_U16 = struct.Struct("<H")
+_I32 = struct.Struct("<i")
+_F64 = struct.Struct("<d")
+
+
+def _pad(buffer):
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def _encode_value(out, value):
+    if value is None:
+        out.append(_NONE)
+    elif isinstance(value, bool):
+        out.append(_BOOL)
+        out.append(1 if value else 0)
+    elif isinstance(value, int):
+        out.append(_INT)
+        out += _I64.pack(value)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _F64.pack(value)
+    elif isinstance(value, date):
+        out.append(_DATE)
+        out += _I32.pack(value.toordinal())
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        out += _U16.pack(len(value))
+        for item in value:
+            _encode_value(out, item)
+    else:
+        encoded = str(value).encode("utf-8")
+        out.append(_STR)
+        out += _U32.pack(len(encoded))
+        out += encoded
+
+
+def _decode_value(buf, pos):
+    """回傳 (值, 下一個位置)"""
+    tag = buf[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _INT:
+        return _I64.unpack_from(buf, pos)[0], pos + 8
+    if tag == _STR:
+        length = _U32.unpack_from(buf, pos)[0]
+        pos += 4
+        return str(buf[pos:pos + length], "utf-8"), pos + length
+    if tag == _DATE:
+        return date.fromordinal(_I32.unpack_from(buf, pos)[0]), pos + 4
+    if tag == _LIST:
+        count = _U16.unpack_from(buf, pos)[0]
+        pos += 2
+        items = []
+        for _ in range(count):
+            item, pos = _decode_value(buf, pos)
+            items.append(item)
+        return items, pos
+    if tag == _BOOL:
+        return bool(buf[pos]), pos + 1
+    if tag == _FLOAT:
+        return _F64.unpack_from(buf, pos)[0], pos + 8
+    raise ValueError(f"Unknown value tag {tag} at {pos - 1}")
+
+
+def _encode_table(columns, rows):
+    """rows 須依第一欄（整數主鍵）排序"""
+    out = bytearray()
+    for name in columns:
+        encoded = name.encode("utf-8")
+        out.append(len(encoded))
+        out += encoded
+    _pad(out)
+
+    data = bytearray()
+    offsets = []
+    for row in rows:
+        offsets.append(len(data))
+        for value in row:
+            _encode_value(data, value)
+    offsets.append(len(data))
+
+    for row in rows:
+        out += _I64.pack(row[0])
+    out += struct.pack(f"<{len(offsets)}I", *offsets)
+    _pad(out)
+    out += data
+    _pad(out)
+    return out
+
+
+def encode_snapshot(tables, version, source_time_ns):
+    """
+    將資料表編碼為快照檔案內容
+
+    Args:
+        tables (dict): 名稱 -> (欄位名稱列表, 資料列列表)，資料列第一欄為整數主鍵
+        version (int): 資料版本
+        source_time_ns (int): 開始讀取來源資料的時間（time.time_ns()）
+
+    Returns:
+        bytes: 檔案內容
+    """
+    directory_size = _DIRECTORY.size * len(tables)
+    offset = _HEADER.size + directory_size
+    directory = bytearray()
+    body = bytearray()
+    for name, (columns, rows) in tables.items():
+        if len(name.encode("utf-8")) > 32:
+            raise ValueError(f"Table name too long: {name}")
+        rows = sorted(rows, key=lambda row: row[0])
+        encoded = _encode_table(columns, rows)
+        directory += _DIRECTORY.pack(name.encode("utf-8"), offset + len(body), len(rows), len(columns))
+        body += encoded
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0, version, source_time_ns, time.time_ns(), len(tables))
+    return bytes(header + directory + body)
+
+
+class SnapshotTable:
+    """
+    快照中的一個資料表（直接讀取 mmap，不複製）
+
+    Args:
+        buf (memoryview): 整個快照
+        offset (int): 資料表區段位移
+        row_count (int): 列數
+        column_count (int): 欄數
+    """
+
+    def __init__(self, buf, offset, row_count, column_count):
+        self._buf = buf
+        pos = offset
+        columns = []
+        for _ in range(column_count):
+            length = buf[pos]
+            columns.append(str(buf[pos + 1:pos + 1 + length], "utf-8"))
+            pos += 1 + length
+        pos += -pos % 8
+        self.columns = columns
+        self._index = {name: i for i, name in enumerate(columns)}
+        self._ids = buf[pos:pos + 8 * row_count].cast("q")
+        pos += 8 * row_count
+        self._offsets = buf[pos:pos + 4 * (row_count + 1)].cast("I")
+        pos += 4 * (row_count + 1)
+        self._data = pos + (-pos % 8)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _decode_row(self, index, positions):
+        buf = self._buf
+        pos = self._data + self._offsets[index]
+        values = []
+        for _ in range(len(self.columns)):
+            value, pos = _decode_value(buf, pos)
+            values.append(value)
+        return tuple(values[i] for i in positions) if positions is not None else tuple(values)
+
+    def _positions(self, columns):
+        if columns is None:
+            return None
+        return [self._index[name] for name in columns]
+
+    def iter_rows(self, columns=None):
+        """
+        逐列解碼所有資料列（依主鍵排序）
+
+        Args:
+            columns (list): 要回傳的欄位名稱與順序，None 表示全部欄位
+        """
+        positions = self._positions(columns)
+        for i in range(len(self)):
+            yield self._decode_row(i, positions)
+
+    def rows(self, columns=None):
+        return list(self.iter_rows(columns))
+
+    def get(self, key, columns=None):
+        """依主鍵取得一列，不存在時回傳 None"""
+        index = bisect.bisect_left(self._ids, key)
+        if index == len(self) or self._ids[index] != key:
+            return None
+        return self._decode_row(index, self._positions(columns))
+
+
+class Snapshot:
+    """
+    以 mmap 映射的快照檔案
+
+    Raises:
+        ValueError: 不是快照檔案或格式版本不符
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+        self.size = stat.st_size
+        buf = memoryview(self._mmap)
+        magic, format_version, _, self.version, self.source_time_ns, self.built_at_ns, table_count = \
+            _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported read model file {path}")
+        self.tables = {}
+        for i in range(table_count):
+            name, offset, row_count, column_count = _DIRECTORY.unpack_from(buf, _HEADER.size + i * _DIRECTORY.size)
+            name = name.rstrip(b"\0").decode("utf-8")
+            self.tables[name] = SnapshotTable(buf, offset, row_count, column_count)
+
+    def age_seconds(self):
+        return (time.time_ns() - self.source_time_ns) / 1e9
+
+
+class SharedReadModel:
+    """
+    Args:
+        path (str): 快照檔案路徑，None 表示停用
+        max_age (float): 快照來源時間超過此秒數時視為過期
+    """
+
+    def __init__(self, path=None, max_age=300.0):
+        self.path = path
+        self.max_age = max_age
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._sources = {}  # 快照資料表名稱 -> 來源資料表名稱
+        self._stats = {"hits": 0, "stale": 0, "missing": 0, "rebuilds": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def marker_path(self, table):
+        return f"{self.path}.dirty.{table}"
+
+    # ===== 讀取 =====
+
+    def _mapped(self):
+        """目前的快照（檔案被替換時重新映射），不存在時回傳 None"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.identity != (stat.st_ino, stat.st_mtime_ns):
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.identity != (stat.st_ino, stat.st_mtime_ns):
+                    try:
+                        snapshot = self._snapshot = Snapshot(self.path)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Read model unavailable: {e}")
+                        return None
+        return snapshot
+
+    def _dirty_since_ns(self, table):
+        try:
+            return os.stat(self.marker_path(table)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _is_fresh(self, snapshot, table):
+        return (
+            snapshot is not None
+            and table in snapshot.tables
+            and snapshot.source_time_ns >= self._dirty_since_ns(table)
+            and snapshot.age_seconds() <= self.max_age
+        )
+
+    def table(self, name):
+        """未過期的快照資料表，停用、不存在或過期時回傳 None（呼叫端改查資料庫）"""
+        if not self.enabled:
+            return None
+        snapshot = self._mapped()
+        if snapshot is None:
+            self._stats["missing"] += 1
+            return None
+        if not self._is_fresh(snapshot, name):
+            self._stats["stale"] += 1
+            return None
+        self._stats["hits"] += 1
+        return snapshot.tables[name]
+
+    # ===== 寫入 =====
+
+    def mark_dirty(self, table):
+        """記錄快照資料表的來源已異動（該資料表在下次重建前不再使用）"""
+        if not self.enabled:
+            return
+        now = time.time_ns()
+        marker = self.marker_path(table)
+        try:
+            with open(marker, "a"):
+                pass
+            os.utime(marker, ns=(now, now))
+        except OSError as e:
+            logger.error(f"Read model dirty marker error: {e}")
+
+    def is_stale(self):
+        """任一快照資料表過期（或快照不存在）"""
+        if not self.enabled:
+            return False
+        snapshot = self._mapped()
+        return snapshot is None or not all(self._is_fresh(snapshot, table) for table in self._sources)
+
+    def refresh(self, loader, force=False):
+        """
+        快照過期時重建（同一台機器上同時只有一個 worker 執行，其他 worker 直接返回）
+
+        Args:
+            loader: callable()，回傳 encode_snapshot 的 tables
+            force (bool): 未過期也重建
+
+        Returns:
+            bool: 是否重建
+        """
+        if not self.enabled:
+            return False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                previous = self._mapped()
+                if not force and not self.is_stale():
+                    return False
+                source_time_ns = time.time_ns()
+                content = encode_snapshot(loader(), (previous.version if previous else 0) + 1, source_time_ns)
+                temporary = f"{self.path}.{os.getpid()}.tmp"
+                with open(temporary, "wb") as f:
+                    f.write(content)
+                os.replace(temporary, self.path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self._stats["rebuilds"] += 1
+        snapshot = self._mapped()
+        logger.info(f"Read model rebuilt: version {snapshot.version}, {snapshot.size} bytes")
+        return True
+
+    # ===== 寫入偵測 =====
+
+    def install(self, sources):
+        """
+        寫入來源資料表的交易提交後標記對應的快照資料表過期
+
+        Args:
+            sources (dict): 快照資料表名稱 -> 來源資料表名稱（Iterable[str]）
+        """
+        self._sources = {table: set(source_tables) for table, source_tables in sources.items()}
+        write_tracker.subscribe(self._on_commit)
+        write_tracker.install()
+
+    def _on_commit(self, written):
+        for table, source_tables in self._sources.items():
+            if written & source_tables:
+                self.mark_dirty(table)
+
+    def status(self):
+        snapshot = self._mapped() if self.enabled else None
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "fresh": {table: self._is_fresh(snapshot, table) for table in self._sources},
+            "version": snapshot.version if snapshot else None,
+            "size_bytes": snapshot.size if snapshot else None,
+            "age_seconds": round(snapshot.age_seconds(), 3) if snapshot else None,
+            "tables": {name: len(table) for name, table in snapshot.tables.items()} if snapshot else {},
+            "stats": dict(self._stats),
+        }
+
+
+# 全局實例
+read_model = SharedReadModel(config.READ_MODEL_PATH or None, config.READ_MODEL_MAX_AGE)
@@ -0,0 +1,66 @@
+# app/utils/request_context.py - 目前請求的資訊（以 ContextVar 傳遞）
+#
+# 連接池事件、查詢統計等在深層程式碼中需要知道「是哪個路由」時使用。
+# 同步路由在 threadpool 中執行，ContextVar 會隨 context 複製過去。
+
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+from starlette.routing import Match
+
+
+class RequestInfo(NamedTuple):
+    method: str
+    path: str
+    route: str  # 路由樣板，例如 /api/villager/{villager_id}
+
+    @property
+    def label(self):
+        return f"{self.method} {self.route}"
+
+
+_current_request: ContextVar[Optional[RequestInfo]] = ContextVar("current_request", default=None)
+
+
+def current_request() -> Optional[RequestInfo]:
+    """目前請求的資訊，不在請求中（背景工作、CLI）時回傳 None"""
+    return _current_request.get()
+
+
+def current_route_label(default: str = "-") -> str:
+    """目前請求的「方法 路由樣板」"""
+    info = _current_request.get()
+    return info.label if info is not None else default
+
+
+# 找不到路由時的樣板名稱（避免以原始路徑作為統計的鍵，原始路徑仍保存在 path）
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _resolve_route(app, scope) -> str:
+    """以應用程式的路由表找出路由樣板"""
+    router = getattr(app, "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class RequestContextMiddleware:
+    """ASGI middleware：為每個 HTTP 請求設定 current_request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        info = RequestInfo(scope["method"], scope["path"], _resolve_route(scope.get("app"), scope))
+        token = _current_request.set(info)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_request.reset(token)
@@ -0,0 +1,270 @@
+# app/utils/scheduler.py - 背景定期工作排程（asyncio，由 lifespan 啟動與停止）
+#
+# 取代各自以執行緒與 time.sleep 實作的背景迴圈（keep-alive、連接池監控、指標快照）：
+#   - 間隔加上隨機抖動（jitter），多個 worker 不會在同一時間執行同樣的工作
+#   - 上一次執行尚未結束時略過這一次（不會重疊執行）
+#   - 每次執行記錄耗時與結果（scheduler_job_duration_seconds / scheduler_job_runs_total）
+#   - 關閉時停止排程並等待執行中的工作結束（有逾時）
+# 同步函式在 threadpool 中執行，不會阻塞事件迴圈。
+# singleton 工作（keep-alive、統計重算）在多個 worker 中只由一個執行：
+# 以 PostgreSQL session 層級 advisory lock 選出 leader，leader 行程結束時連線中斷、鎖自動釋放，
+# 其他 worker 在下一次排程時取得。非 PostgreSQL 時視為單一行程，一律執行。
+
+import asyncio
+import inspect
+import logging
+import random
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from app import config
+from app.database import CONNECT_ARGS, engine
+from app.utils.metrics import SCHEDULER_JOB_DURATION, SCHEDULER_JOB_RUNS
+
+logger = logging.getLogger(__name__)
+
+# singleton 工作 leader 選舉用的 advisory lock 鍵值（遷移使用 727001）
+SCHEDULER_LOCK_KEY = 727002
+
+
+class AdvisoryLeaderLock:
+    """
+    以 PostgreSQL advisory lock 選出 leader（持有一條不在連接池中的專用連線）
+
+    Args:
+        target: SQLAlchemy engine（只使用其連線網址）
+        key (int): advisory lock 鍵值
+        connect_args (dict): 連線參數（預設與主連接池相同：SSL、連線逾時、查詢逾時）
+    """
+
+    def __init__(self, target, key=SCHEDULER_LOCK_KEY, connect_args=CONNECT_ARGS):
+        self.key = key
+        # 專用連線不佔用連接池，也不會被連線洩漏追蹤當成長時間借出的連線
+        self._engine = create_engine(target.url, poolclass=NullPool, connect_args=connect_args)
+        self._conn = None
+
+    def is_leader(self):
+        """目前是否為 leader，不是時嘗試取得（會阻塞，於 threadpool 中呼叫）"""
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT 1"))
+                self._conn.commit()
+                return True
+            except Exception as e:
+                logger.warning(f"Scheduler leader connection lost: {e}")
+                self._close()
+
+        conn = self._engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+            # session 層級的鎖在交易結束後仍然保留，提交以免連線停在 idle in transaction
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        logger.info(f"Acquired scheduler leader lock {self.key}")
+        return True
+
+    def release(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            self._conn.commit()
+        except Exception as e:
+            logger.warning(f"Scheduler leader unlock failed: {e}")
+        self._close()
+
+    def _close(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+class LocalLeaderLock:
+    """單一行程（非 PostgreSQL）時一律為 leader"""
+
+    def is_leader(self):
+        return True
+
+    def release(self):
+        pass
+
+
+def leader_lock(target, key=SCHEDULER_LOCK_KEY):
+    """依資料庫選擇 leader 選舉方式"""
+    if target.dialect.name == "postgresql":
+        return AdvisoryLeaderLock(target, key)
+    return LocalLeaderLock()
+
+
+class Job:
+    """
+    Args:
+        name (str): 工作名稱（指標標籤）
+        func: 同步函式（在 threadpool 中執行）或 coroutine function
+        interval (float): 執行間隔秒數
+        jitter (float): 間隔的隨機變動比例（0.1 表示 ±10%）
+        singleton (bool): 多個 worker 時只由 leader 執行
+        initial_delay (float): 第一次執行前等待的秒數，None 表示一個間隔
+    """
+
+    def __init__(self, name, func, interval, jitter=0.1, singleton=False, initial_delay=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.singleton = singleton
+        self.initial_delay = interval if initial_delay is None else initial_delay
+        self.running = None  # 執行中的 asyncio.Task
+        self.stats = {
+            "runs": 0,
+            "failures": 0,
+            "skipped_overlap": 0,
+            "skipped_not_leader": 0,
+            "last_started_at": None,
+            "last_duration_seconds": None,
+            "last_error": None,
+        }
+
+    def next_delay(self, delay=None):
+        delay = self.interval if delay is None else delay
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+
+class Scheduler:
+    """
+    Args:
+        leader: singleton 工作使用的 leader 選舉（AdvisoryLeaderLock / LocalLeaderLock）
+        jitter (float): 未指定時各工作的預設抖動比例
+    """
+
+    def __init__(self, leader=None, jitter=0.1):
+        self.leader = leader or LocalLeaderLock()
+        self.jitter = jitter
+        self.jobs = {}
+        self._loops = []
+        self._stopping = None
+
+    def add_job(self, name, func, interval, jitter=None, singleton=False, initial_delay=None):
+        """註冊定期工作（須在 start 之前）"""
+        if name in self.jobs:
+            raise ValueError(f"Job {name} already registered")
+        job = Job(name, func, interval, self.jitter if jitter is None else jitter, singleton, initial_delay)
+        self.jobs[name] = job
+        return job
+
+    @property
+    def started(self):
+        return bool(self._loops)
+
+    def start(self):
+        """在目前的事件迴圈中開始排程（於 lifespan 中呼叫）"""
+        if self._loops:
+            return
+        self._stopping = asyncio.Event()
+        self._loops = [
+            asyncio.create_task(self._schedule(job), name=f"scheduler:{job.name}")
+            for job in self.jobs.values()
+        ]
+        logger.info(f"Scheduler started: {', '.join(self.jobs) or 'no jobs'}")
+
+    async def _schedule(self, job):
+        delay = job.next_delay(job.initial_delay)
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if job.running is not None and not job.running.done():
+                job.stats["skipped_overlap"] += 1
+                SCHEDULER_JOB_RUNS.inc(job.name, "skipped_overlap")
+                logger.warning(f"Job {job.name} still running, skipping this run")
+            else:
+                job.running = asyncio.create_task(self.run_job(job), name=f"job:{job.name}")
+            delay = job.next_delay()
+
+    async def _call(self, func):
+        if inspect.iscoroutinefunction(func):
+            return await func()
+        return await asyncio.to_thread(func)
+
+    async def run_job(self, job):
+        """執行一次工作並記錄結果（例外不會中斷排程）"""
+        if isinstance(job, str):
+            job = self.jobs[job]
+        if job.singleton:
+            try:
+                leader = await self._call(self.leader.is_leader)
+            except Exception as e:
+                leader = False
+                logger.warning(f"Scheduler leader election failed: {e}")
+            if not leader:
+                job.stats["skipped_not_leader"] += 1
+                SCHEDULER_JOB_RUNS.inc(job.name, "skipped_not_leader")
+                return
+
+        job.stats["last_started_at"] = time.time()
+        started = time.perf_counter()
+        outcome = "success"
+        try:
+            await self._call(job.func)
+            job.stats["last_error"] = None
+        except Exception as e:
+            outcome = "error"
+            job.stats["failures"] += 1
+            job.stats["last_error"] = str(e)
+            logger.error(f"Job {job.name} failed: {e}")
+        finally:
+            duration = time.perf_counter() - started
+            job.stats["runs"] += 1
+            job.stats["last_duration_seconds"] = round(duration, 4)
+            SCHEDULER_JOB_DURATION.observe(duration, job.name)
+            SCHEDULER_JOB_RUNS.inc(job.name, outcome)
+
+    async def stop(self, timeout=10.0):
+        """停止排程並等待執行中的工作結束，最後釋放 leader 鎖"""
+        if not self._loops:
+            return
+        self._stopping.set()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+
+        running = [job.running for job in self.jobs.values() if job.running is not None and not job.running.done()]
+        if running:
+            done, pending = await asyncio.wait(running, timeout=timeout)
+            for task in pending:
+                # threadpool 中的同步函式無法中斷，只取消等待
+                task.cancel()
+                logger.warning(f"Job {task.get_name()} did not finish within {timeout}s")
+        try:
+            await self._call(self.leader.release)
+        except Exception as e:
+            logger.warning(f"Scheduler leader release failed: {e}")
+        logger.info("Scheduler stopped")
+
+    def stats(self):
+        return {
+            name: {
+                "interval_seconds": job.interval,
+                "singleton": job.singleton,
+                "running": job.running is not None and not job.running.done(),
+                **job.stats,
+            }
+            for name, job in self.jobs.items()
+        }
+
+
+# 全局實例（工作於 app.main 註冊，lifespan 開始時啟動）
+scheduler = Scheduler(leader=leader_lock(engine), jitter=config.SCHEDULER_JITTER)
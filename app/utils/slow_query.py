@@ -0,0 +1,203 @@
+# app/utils/slow_query.py - 慢查詢紀錄
+#
+# 執行時間超過門檻（SLOW_QUERY_MS）的 SQL 記錄下列資訊，保存在固定長度的環狀緩衝區
+# （依語句形狀彙整的統計最多保存 max_shapes 種，超過時淘汰最久沒有變慢的形狀）：
+#   - 正規化後的語句形狀與參數型別（不保存參數值）
+#   - 執行時間、呼叫的 crud 函式、所在路由
+# 開啟 SLOW_QUERY_EXPLAIN 時，每個語句形狀第一次變慢會在背景執行緒以獨立連線執行
+# EXPLAIN (ANALYZE, BUFFERS) 並保存執行計畫（只限 PostgreSQL 上的 SELECT，交易為 READ ONLY 並回滾）。
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from app import config
+from app.utils.query_counter import statement_shape
+from app.utils.request_context import current_route_label
+
+logger = logging.getLogger(__name__)
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CRUD_DIR = os.path.join(_APP_DIR, "crud")
+_PROJECT_DIR_LENGTH = len(os.path.dirname(_APP_DIR)) + 1
+_THIS_FILE = os.path.abspath(__file__)
+
+# 同時等待執行的 EXPLAIN 上限，避免慢查詢大量出現時再加重資料庫負擔
+_MAX_PENDING_EXPLAINS = 4
+
+
+def find_caller():
+    """呼叫堆疊中最內層的 crud 函式，沒有時回傳最內層的 app 函式"""
+    fallback = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            location = f"{filename[_PROJECT_DIR_LENGTH:]}:{frame.f_lineno} {frame.f_code.co_name}"
+            if filename.startswith(_CRUD_DIR):
+                return location
+            if fallback is None:
+                fallback = location
+        frame = frame.f_back
+    return fallback
+
+
+def bind_shape(parameters):
+    """參數的型別（不含值），executemany 時只描述第一列"""
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+        return {"rows": len(parameters), "row": bind_shape(parameters[0])}
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+class SlowQueryRecorder:
+    """
+    Args:
+        threshold_ms (float): 執行時間超過此毫秒數的查詢記為慢查詢
+        capacity (int): 環狀緩衝區保存的筆數
+        max_shapes (int): 依語句形狀彙整的統計最多保存幾種
+        explain (bool): 語句形狀第一次變慢時是否擷取 EXPLAIN (ANALYZE, BUFFERS)
+    """
+
+    def __init__(self, threshold_ms=500, capacity=200, max_shapes=100, explain=False):
+        self.threshold = threshold_ms / 1000
+        self.max_shapes = max_shapes
+        self.explain = explain
+        self._entries = deque(maxlen=capacity)
+        self._shapes = OrderedDict()  # 語句形狀 -> 統計與執行計畫（最近變慢的在後）
+        self._lock = threading.Lock()
+        self._engine = None
+        self._executor = None
+        self._pending_explains = 0
+
+    # ===== 引擎事件 =====
+
+    def install(self, target):
+        """在 engine 上註冊事件（重複呼叫不會重複註冊）"""
+        if not event.contains(target, "before_cursor_execute", self._before_cursor_execute):
+            event.listen(target, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(target, "after_cursor_execute", self._after_cursor_execute)
+        self._engine = target
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed >= self.threshold and not statement.lstrip().upper().startswith("EXPLAIN"):
+            self.record(statement, parameters, elapsed, conn.dialect.name)
+
+    # ===== 紀錄 =====
+
+    def record(self, statement, parameters, elapsed, dialect_name=None):
+        shape = statement_shape(statement)
+        entry = {
+            "shape": shape,
+            "binds": bind_shape(parameters),
+            "duration_ms": round(elapsed * 1000, 1),
+            "caller": find_caller(),
+            "route": current_route_label(default="background"),
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            self._entries.append(entry)
+            summary = self._shapes.get(shape)
+            first_occurrence = summary is None
+            if first_occurrence:
+                summary = self._shapes[shape] = {
+                    "shape": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "callers": [],
+                    "first_seen": entry["timestamp"],
+                    "plan": None,
+                }
+                while len(self._shapes) > self.max_shapes:
+                    self._shapes.popitem(last=False)
+            else:
+                self._shapes.move_to_end(shape)
+            summary["count"] += 1
+            summary["total_ms"] += entry["duration_ms"]
+            summary["max_ms"] = max(summary["max_ms"], entry["duration_ms"])
+            if entry["caller"] and entry["caller"] not in summary["callers"] and len(summary["callers"]) < 5:
+                summary["callers"].append(entry["caller"])
+
+        logger.warning(
+            f"Slow query ({entry['duration_ms']}ms) in {entry['route']} from {entry['caller']}: {shape[:300]}"
+        )
+        if first_occurrence and self.explain and dialect_name == "postgresql":
+            self._schedule_explain(shape, statement, parameters)
+
+    def _schedule_explain(self, shape, statement, parameters):
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            # EXPLAIN ANALYZE 會實際執行語句，只對唯讀查詢使用
+            return
+        with self._lock:
+            if self._engine is None or self._pending_explains >= _MAX_PENDING_EXPLAINS:
+                return
+            self._pending_explains += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._executor.submit(self._explain, shape, statement, parameters)
+
+    def _explain(self, shape, statement, parameters):
+        try:
+            with self._engine.connect() as conn:
+                conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                plan = conn.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters
+                ).scalar()
+                conn.rollback()
+            with self._lock:
+                if shape in self._shapes:
+                    self._shapes[shape]["plan"] = plan
+        except Exception as e:
+            logger.error(f"EXPLAIN failed for slow query: {e}")
+        finally:
+            with self._lock:
+                self._pending_explains -= 1
+
+    # ===== 查詢 =====
+
+    def entries(self, limit=None):
+        """最近的慢查詢（新的在前）"""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def shapes(self):
+        """各語句形狀的慢查詢統計與執行計畫（總時間長的在前）"""
+        with self._lock:
+            shapes = [
+                {**summary, "total_ms": round(summary["total_ms"], 1)}
+                for summary in self._shapes.values()
+            ]
+        return sorted(shapes, key=lambda summary: summary["total_ms"], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._shapes.clear()
+
+# 全局紀錄實例
+slow_query_recorder = SlowQueryRecorder(
+    threshold_ms=config.SLOW_QUERY_MS,
+    capacity=config.SLOW_QUERY_LOG_SIZE,
+    max_shapes=config.SLOW_QUERY_MAX_SHAPES,
+    explain=config.SLOW_QUERY_EXPLAIN
+)
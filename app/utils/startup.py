@@ -0,0 +1,117 @@
+# app/utils/startup.py - 啟動階段計時與背景暖機
+#
+# Render 冷啟動時，在能開始服務請求之前花費的時間分為：
+#   import  匯入 app.main 與其依賴的模組
+#   schema  create_all 與結構遷移（對 Neon 需要多次 catalog 查詢，可改為背景執行或略過）
+#   app     建立 FastAPI 應用程式、middleware 與路由
+# 開始服務後，背景執行緒依序執行暖機步驟（延後的結構初始化、建立連接池連線、預先載入快取），
+# 全部必要步驟完成前 /ready 回傳 503，讓負載平衡器等到暖機完成後再導入流量。
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+class StartupState:
+    """
+    記錄各啟動階段的耗時與暖機是否完成
+    """
+
+    def __init__(self):
+        self.created_at = time.time()
+        self.phases = {}  # 名稱 -> {"seconds", "ok", "error"}
+        self.error = None  # 必要步驟失敗時的訊息
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, error=None):
+        with self._lock:
+            self.phases[name] = {
+                "seconds": round(seconds, 4),
+                "ok": error is None,
+                "error": error,
+            }
+
+    @contextmanager
+    def phase(self, name):
+        """量測一個階段的耗時（發生例外時記錄錯誤後重新拋出）"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, time.perf_counter() - started, error=str(e))
+            raise
+        self.record(name, time.perf_counter() - started)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def run_warm_up(self, steps):
+        """
+        依序執行暖機步驟，全部必要步驟成功後標記為 ready
+
+        Args:
+            steps (list): (名稱, callable, 是否必要) 的列表；非必要步驟失敗只記錄警告
+        """
+        for name, func, required in steps:
+            try:
+                with self.phase(name):
+                    func()
+            except Exception as e:
+                if required:
+                    self.error = f"{name}: {e}"
+                    logger.error(f"Startup step {name} failed: {e}")
+                    return
+                logger.warning(f"Warm-up step {name} failed: {e}")
+        self._ready.set()
+        summary = ", ".join(f"{name}={phase['seconds']}s" for name, phase in self.phases.items())
+        logger.info(f"Application ready ({summary})")
+
+    def start_warm_up(self, steps):
+        """在背景執行緒中執行暖機步驟"""
+        thread = threading.Thread(target=self.run_warm_up, args=(steps,), daemon=True, name="warm-up")
+        thread.start()
+        return thread
+
+    def status(self):
+        with self._lock:
+            phases = {name: dict(phase) for name, phase in self.phases.items()}
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "phases": phases,
+            "uptime_seconds": round(time.time() - self.created_at, 3),
+        }
+
+
+def warm_pool(target, connections):
+    """
+    同時借出 connections 條連線並各執行一次 SELECT 1，讓連接池保有已建立的連線
+    （第一批請求不需等待 TCP / TLS / 認證）
+
+    Args:
+        target: SQLAlchemy engine
+        connections (int): 連線數量
+    """
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = target.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()
+
+
+# 全局實例（app.main 匯入時建立，created_at 接近行程啟動時間）
+startup_state = StartupState()
@@ -0,0 +1,312 @@
+# app/utils/tracing.py - 請求追蹤（span）與本機 JSONL 匯出
+#
+# 每個請求建立一個 trace，span 依呼叫關係巢狀：
+#   request -> handler（路由函式）-> crud（instrument_crud）-> sql（每個語句）
+#           -> serialize（回應模型驗證與 JSON 編碼）
+# 開啟 TRACING 時所有請求都會記錄 span（只在記憶體中），結束時決定是否保留：
+#   - head sampling: 請求開始時以 TRACE_SAMPLE_RATE 抽樣
+#   - tail retention: 未抽中但總時間超過 TRACE_SLOW_MS 的 trace 也會保留
+# 保留的 trace 以一行一個 JSON 寫入 TRACE_FILE（背景執行緒寫入，超過大小時輪替為 .1），
+# 可用 `python -m app.cli traces <檔案>` 或 /api/admin/traces/{trace_id}?view=waterfall 檢視瀑布圖。
+
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app import config
+from app.utils.fast_json import dumps
+from app.utils.query_counter import statement_shape
+from app.utils.request_context import current_request
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """
+    Args:
+        sampled (bool): 是否由 head sampling 抽中
+        max_spans (int): span 數量上限，超過的 span 只計數不保存
+    """
+
+    __slots__ = ("trace_id", "sampled", "started_at", "_origin", "spans", "dropped", "max_spans", "handler_end")
+
+    def __init__(self, sampled, max_spans=500):
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = sampled
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+        self.max_spans = max_spans
+        self.handler_end = None
+
+    def _offset_ms(self, moment):
+        return round((moment - self._origin) * 1000, 3)
+
+    def open(self, name, kind, parent_id, attributes=None, started=None):
+        """開始一個 span，超過上限時回傳 None"""
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return None
+        span = {
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent_id,
+            "name": name,
+            "kind": kind,
+            "start_ms": self._offset_ms(started if started is not None else time.perf_counter()),
+            "duration_ms": None,
+        }
+        if attributes:
+            span["attributes"] = attributes
+        self.spans.append(span)
+        return span
+
+    def close(self, span, ended=None):
+        if span is not None:
+            span["duration_ms"] = round(
+                self._offset_ms(ended if ended is not None else time.perf_counter()) - span["start_ms"], 3
+            )
+
+    def to_dict(self):
+        root = self.spans[0] if self.spans else {}
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "name": root.get("name"),
+            "duration_ms": root.get("duration_ms"),
+            "sampled": self.sampled,
+            "dropped_spans": self.dropped,
+            "spans": self.spans,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("current_span_id", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    """目前請求的 trace，未開啟追蹤或不在請求中時回傳 None"""
+    return _current_trace.get()
+
+
+def current_span_id() -> Optional[str]:
+    return _current_span_id.get()
+
+
+@contextmanager
+def span(name, kind, **attributes):
+    """在目前的 trace 中建立子 span，沒有 trace 時不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    record = trace.open(name, kind, _current_span_id.get(), attributes)
+    token = _current_span_id.set(record["span_id"]) if record is not None else None
+    try:
+        yield record
+    finally:
+        if token is not None:
+            _current_span_id.reset(token)
+        trace.close(record)
+
+
+# ===== SQL span =====
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is not None and context is not None:
+        context._trace_span = trace.open(
+            "sql", "sql", _current_span_id.get(), {"statement": statement_shape(statement)[:500]}
+        )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.close(getattr(context, "_trace_span", None))
+
+
+def install(target):
+    """在 engine 上註冊 SQL span 事件（重複呼叫不會重複註冊）"""
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+# ===== 匯出 =====
+
+class JSONLExporter:
+    """
+    背景執行緒將 trace 以 JSON Lines 附加到檔案，請求不會等待磁碟寫入
+
+    Args:
+        path (str): 輸出檔案
+        max_bytes (int): 超過此大小時將檔案改名為 <path>.1 並重新開始
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def export(self, record):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, daemon=True, name="trace-exporter")
+                    self._writer.start()
+        self._queue.put(record)
+
+    def _write_loop(self):
+        while True:
+            records = [self._queue.get()]
+            while not self._queue.empty() and len(records) < 100:
+                records.append(self._queue.get())
+            try:
+                self._write(records)
+            except Exception as e:
+                logger.error(f"Trace export error: {e}")
+
+    def _write(self, records):
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            os.replace(self.path, f"{self.path}.1")
+        with open(self.path, "ab") as f:
+            for record in records:
+                f.write(dumps(record) + b"\n")
+
+
+class Tracer:
+    """
+    Args:
+        exporter (JSONLExporter): 保留的 trace 的輸出目的地，None 表示只保存在記憶體
+        sample_rate (float): head sampling 比例
+        slow_ms (float): 總時間超過此毫秒數的 trace 一律保留
+        recent (int): 記憶體中保存的最近 trace 數量（供管理端點檢視）
+    """
+
+    def __init__(self, exporter=None, sample_rate=0.01, slow_ms=1000, recent=50):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self._recent = deque(maxlen=recent)
+        self._stats = {"traces": 0, "sampled": 0, "slow": 0}
+
+    def start_trace(self):
+        return Trace(sampled=random.random() < self.sample_rate)
+
+    def finish(self, trace):
+        """決定是否保留 trace（head 抽中或超過 slow_ms），保留時匯出"""
+        self._stats["traces"] += 1
+        record = trace.to_dict()
+        slow = (record["duration_ms"] or 0) >= self.slow_ms
+        if not (trace.sampled or slow):
+            return None
+        self._stats["sampled" if trace.sampled else "slow"] += 1
+        record["retained_by"] = "sampled" if trace.sampled else "slow"
+        self._recent.append(record)
+        if self.exporter is not None:
+            self.exporter.export(record)
+        return record
+
+    def recent(self):
+        """最近保留的 trace（新的在前）"""
+        return list(reversed(self._recent))
+
+    def get(self, trace_id):
+        for record in self._recent:
+            if record["trace_id"] == trace_id:
+                return record
+        return None
+
+    def stats(self):
+        return dict(self._stats)
+
+
+class TracingMiddleware:
+    """ASGI middleware：為每個 HTTP 請求建立 trace 與 request span"""
+
+    def __init__(self, app, tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        info = current_request()
+        trace = self.tracer.start_trace()
+        root = trace.open(
+            info.label if info is not None else f"{scope['method']} {scope['path']}",
+            "request",
+            None,
+            {"path": scope["path"]}
+        )
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span_id.set(root["span_id"])
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                root["attributes"]["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current_span_id.reset(span_token)
+            _current_trace.reset(trace_token)
+            trace.close(root)
+            self.tracer.finish(trace)
+
+
+# ===== 瀑布圖 =====
+
+def render_waterfall(record, width=40):
+    """以文字瀑布圖呈現 trace（依呼叫關係縮排）"""
+    spans = record["spans"]
+    total = max((span["start_ms"] + (span["duration_ms"] or 0) for span in spans), default=0) or 1
+    children = {}
+    for item in spans:
+        children.setdefault(item["parent_id"], []).append(item)
+
+    lines = [
+        f"trace {record['trace_id']}  {record['name']}  {record['duration_ms']}ms  "
+        f"({record.get('retained_by', 'sampled')}, {len(spans)} spans"
+        + (f", {record['dropped_spans']} dropped" if record.get("dropped_spans") else "") + ")"
+    ]
+
+    def walk(parent_id, depth):
+        for item in sorted(children.get(parent_id, ()), key=lambda span: span["start_ms"]):
+            duration = item["duration_ms"]
+            begin = int(item["start_ms"] / total * width)
+            length = max(1, int((duration or 0) / total * width))
+            bar = (" " * begin + "█" * length).ljust(width)[:width]
+            label = item["name"]
+            statement = item.get("attributes", {}).get("statement")
+            if statement:
+                label = f"sql {statement[:80]}"
+            duration_text = f"{duration:.1f}ms" if duration is not None else "unfinished"
+            lines.append(f"{item['start_ms']:>9.1f}ms |{bar}| {duration_text:>10}  {'  ' * depth}{label}")
+            walk(item["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+tracer = Tracer(
+    exporter=JSONLExporter(config.TRACE_FILE, config.TRACE_FILE_MAX_BYTES) if config.TRACE_FILE else None,
+    sample_rate=config.TRACE_SAMPLE_RATE,
+    slow_ms=config.TRACE_SLOW_MS
+)
@@ -0,0 +1,75 @@
+# app/utils/write_tracker.py - 偵測交易寫入了哪些資料表
+#
+# 以 Session 事件收集一個交易中寫入的資料表：
+#   after_flush     ORM 物件的新增、修改、刪除
+#   do_orm_execute  經由 session.execute 的 insert / update / delete（含 Core 語句與 ORM bulk）
+# 交易提交後通知訂閱者（共用唯讀快照、查詢快取），回滾時捨棄。
+# 以 text() 執行的 SQL 無法得知資料表，不會通知。
+
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_WRITTEN_KEY = "written_tables"
+
+
+class WriteTracker:
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """
+        訂閱交易提交
+
+        Args:
+            callback: callable(set)，參數為該交易寫入的資料表名稱
+        """
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def install(self):
+        """註冊 Session 事件（重複呼叫不會重複註冊）"""
+        for name, listener in (
+            ("after_flush", _on_flush),
+            ("do_orm_execute", _on_execute),
+            ("after_commit", self._on_commit),
+            ("after_rollback", _on_rollback),
+        ):
+            if not event.contains(Session, name, listener):
+                event.listen(Session, name, listener)
+
+    def _on_commit(self, session):
+        tables = session.info.pop(_WRITTEN_KEY, None)
+        if not tables:
+            return
+        for callback in self._subscribers:
+            try:
+                callback(tables)
+            except Exception as e:
+                logger.error(f"Write subscriber error: {e}")
+
+
+def _on_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            session.info.setdefault(_WRITTEN_KEY, set()).add(table.name)
+
+
+def _on_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        name = getattr(table, "name", None)
+        if name is not None:
+            orm_execute_state.session.info.setdefault(_WRITTEN_KEY, set()).add(name)
+
+
+def _on_rollback(session):
+    session.info.pop(_WRITTEN_KEY, None)
+
+
+# 全局實例
+write_tracker = WriteTracker()
@@ -0,0 +1,89 @@
+# Purpose: 查詢快取後端（app/utils/cache.py）的基準測試
+#
+# 以合成的村民列表（每個地點一份）比較各後端與序列化格式的讀取延遲：
+#   memory  行程內 LRU，不序列化
+#   local   本機 Redis 協定伺服器（LocalRedisServer），經過 TCP 與序列化；--url 可改為實際的 Redis
+# 使用方式: python -m benchmarks.bench_cache [--keys 200] [--villagers 20] [--reads 5000] [--url redis://localhost:6379/0]
+
+import argparse
+import random
+import statistics
+import time
+from datetime import date
+
+from app.utils.cache import (
+    QueryCache, LRUBackend, RedisBackend, LocalRedisServer, SERIALIZERS, msgpack
+)
+
+
+def make_value(villagers, rng):
+    return [
+        {
+            "villagerid": i,
+            "name": f"村民{i}",
+            "gender": rng.choice("MF"),
+            "job": "漁民",
+            "visit_count": rng.randint(0, 30),
+            "last_visited": date(2024, rng.randint(1, 12), rng.randint(1, 28)),
+            "relationships": [{"relationship_id": i, "relative_name": "家人", "role": "子女"}],
+        }
+        for i in range(villagers)
+    ]
+
+
+def measure(cache, keys, villagers, reads):
+    rng = random.Random(42)
+    cache.register("bench", ("Villager",))
+    for key in range(keys):
+        cache.set("bench", key, make_value(villagers, rng))
+    latencies = []
+    for _ in range(reads):
+        key = rng.randrange(keys)
+        started = time.perf_counter()
+        cache.get("bench", key)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    stats = cache.stats()["bench"]
+    return {
+        "p50": statistics.median(latencies) * 1e6,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+        "hit_rate": stats["hits"] / max(1, stats["hits"] + stats["misses"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢快取後端基準測試")
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--villagers", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--url", default="", help="Redis 網址，未提供時啟動本機 Redis 協定伺服器")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server = LocalRedisServer().start()
+        url = server.url
+
+    cases = [("memory", "-", QueryCache(LRUBackend(args.keys * 2)))]
+    for name, serializer in SERIALIZERS.items():
+        if name == "msgpack" and msgpack is None:
+            continue
+        backend = RedisBackend(url, prefix=f"bench-{time.time_ns()}:")
+        cases.append(("redis" if args.url else "local", name, QueryCache(backend, serializer())))
+
+    print(f"keys={args.keys}  villagers/key={args.villagers}  reads={args.reads}")
+    print(f"{'backend':>8} {'serializer':>10} {'p50(us)':>9} {'p99(us)':>9} {'hit rate':>9}")
+    try:
+        for backend_name, serializer_name, cache in cases:
+            result = measure(cache, args.keys, args.villagers, args.reads)
+            print(f"{backend_name:>8} {serializer_name:>10} {result['p50']:>9.1f} "
+                  f"{result['p99']:>9.1f} {result['hit_rate']:>9.2f}")
+            cache.clear()
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
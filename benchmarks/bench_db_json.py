@@ -0,0 +1,97 @@
+# Purpose: 資料庫端 JSON 組裝（DB_JSON_AGGREGATION）的效能基準測試
+#
+# 對同一個 PostgreSQL 資料庫，比較三個大型列表端點在一般路徑與 json_agg 路徑下的
+# 單次請求延遲（p50 / p99）與 CPU 時間，並確認兩種路徑回傳的內容相同。
+# 只讀取既有資料，不會寫入。
+# 使用方式: DATABASE_URL=postgresql://... python -m benchmarks.bench_db_json [--repeat 200] [--location-id N]
+
+import argparse
+import json
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy import func, select
+
+from app import config, models
+from app.database import SessionLocal, engine
+from app.router import locations, record, villagers
+
+
+def render(result):
+    """將路由函式的回傳值轉為回應 bytes（與 FastAPI 的處理方式相同）"""
+    if isinstance(result, Response):
+        return result.body
+    return json.dumps(jsonable_encoder(result), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def busiest_location(db):
+    """村民最多的地點"""
+    return db.execute(
+        select(models.Villager.Location)
+        .where(models.Villager.Location.isnot(None))
+        .group_by(models.Villager.Location)
+        .order_by(func.count().desc())
+        .limit(1)
+    ).scalar()
+
+
+def normalize(document):
+    """忽略列表順序（一般路徑未指定排序）以比較兩種路徑的回應內容"""
+    if isinstance(document.get("data"), list):
+        document["data"] = sorted(document["data"], key=lambda item: json.dumps(item, sort_keys=True))
+    return document
+
+
+def measure(db, call, repeat):
+    """回傳 (p50 ms, p99 ms, 平均 CPU ms, 回應大小 bytes, 解碼後的回應)"""
+    body = call()  # 暖機
+    wall, cpu = [], []
+    for _ in range(repeat):
+        # 每次請求使用新的 identity map，與實際請求相同
+        db.expunge_all()
+        started, cpu_started = time.perf_counter(), time.process_time()
+        call()
+        wall.append((time.perf_counter() - started) * 1000)
+        cpu.append((time.process_time() - cpu_started) * 1000)
+    wall.sort()
+    p99 = wall[min(len(wall) - 1, int(len(wall) * 0.99))]
+    return statistics.median(wall), p99, statistics.mean(cpu), len(body), normalize(json.loads(body))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="資料庫端 JSON 組裝基準測試")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--location-id", type=int, help="村民與家訪紀錄使用的地點（預設為村民最多的地點）")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        parser.error("DATABASE_URL 必須是 PostgreSQL")
+
+    db = SessionLocal()
+    try:
+        location_id = args.location_id or busiest_location(db)
+        endpoints = {
+            "locations": lambda: render(locations.get_locations(include_invalid=True, fields=None, db=db)),
+            "villagers_by_location": lambda: render(villagers.get_villagers_by_location(location_id, db=db)),
+            "records_by_location": lambda: render(record.get_records_by_location_get(location_id, fields=None, db=db)),
+        }
+
+        print(f"location_id={location_id}, repeat={args.repeat}")
+        print(f"{'endpoint':>22} {'mode':>5} {'p50 ms':>8} {'p99 ms':>8} {'cpu ms':>8} {'KiB':>7}")
+        for name, call in endpoints.items():
+            documents = {}
+            for mode, enabled in (("orm", False), ("db", True)):
+                config.DB_JSON_AGGREGATION = enabled
+                p50, p99, cpu, size, documents[mode] = measure(db, call, args.repeat)
+                db.rollback()
+                print(f"{name:>22} {mode:>5} {p50:>8.2f} {p99:>8.2f} {cpu:>8.2f} {size / 1024:>7.1f}")
+            if documents["orm"] != documents["db"]:
+                print(f"{name:>22} 警告: 兩種路徑的回應內容不同")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Purpose: 地點列表讀取路徑的效能基準測試
+#
+# 比較兩種 GET /api/locations 實作在相同資料量下的吞吐量與記憶體配置：
+#   orm  - 原本的路徑：ORM 物件 → LocationResponse → jsonable_encoder → JSONResponse
+#   core - 目前的路徑：Core select 的 tuple → dict → orjson bytes（router.locations.get_locations）
+# 使用 SQLite 記憶體資料庫，只量測 Python 端的成本（不含網路與資料庫伺服器）。
+# 使用方式: python -m benchmarks.bench_locations_read [--rows 10000] [--repeat 20]
+
+import argparse
+import os
+import random
+import time
+import tracemalloc
+
+# app.database 在匯入時建立引擎，基準測試不會使用它
+os.environ.setdefault("DATABASE_URL", "postgresql://benchmark@localhost/unused")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models, schemas
+from app.router import locations
+
+# SQLite 不支援 ARRAY，Tag 欄位保持 NULL
+DDL = '''CREATE TABLE "Location" (
+    "LocationID" INTEGER PRIMARY KEY,
+    "name" VARCHAR(20) NOT NULL,
+    "Latitude" VARCHAR(30) NOT NULL,
+    "Longitude" VARCHAR(30) NOT NULL,
+    "Address" VARCHAR(50),
+    "BriefDescription" VARCHAR(300),
+    "Photo" TEXT,
+    "Tag" TEXT
+)'''
+
+
+def make_session(rows, seed=42):
+    """建立含 rows 筆地點的 SQLite 記憶體資料庫"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    rng = random.Random(seed)
+    with engine.begin() as conn:
+        conn.execute(text(DDL))
+        conn.execute(
+            text('INSERT INTO "Location" ("LocationID", "name", "Latitude", "Longitude", "Address", "BriefDescription", "Photo") '
+                 'VALUES (:id, :name, :lat, :lon, :address, :brief, :photo)'),
+            [
+                {
+                    "id": i + 1,
+                    "name": f"住戶{i}",
+                    "lat": f"{22.5 + rng.random():.6f}",
+                    "lon": f"{120.5 + rng.random():.6f}",
+                    "address": f"台東縣某鄉某村{i}號",
+                    "brief": "住戶簡介" * 10,
+                    "photo": f"https://example.com/photos/{i}.jpg",
+                }
+                for i in range(rows)
+            ]
+        )
+    return sessionmaker(bind=engine)()
+
+
+def orm_path(db):
+    """原本的實作（保留於此作為比較基準）"""
+    data = [
+        schemas.LocationResponse(
+            id=loc.LocationID,
+            name=loc.name,
+            latitude=str(loc.Latitude) if loc.Latitude is not None else None,
+            longitude=str(loc.Longitude) if loc.Longitude is not None else None,
+            address=loc.Address,
+            brief_description=loc.BriefDescription,
+            photo=loc.Photo,
+            tag=loc.Tag
+        )
+        for loc in db.query(models.Location).all()
+    ]
+    content = {"status": "success", "data": data, "summary": {"total": len(data), "filtered_out": 0}}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def core_path(db):
+    return locations.get_locations(include_invalid=False, fields=None, db=db).body
+
+
+def measure(func, db, repeat):
+    """回傳 (單次請求秒數, 單次請求的記憶體配置峰值 bytes, 回應大小 bytes)"""
+    body = func(db)  # 暖機
+    db.expunge_all()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(db)
+        # 每次請求使用新的 identity map，與實際請求相同
+        db.expunge_all()
+    per_request = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    func(db)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.expunge_all()
+
+    return per_request, peak, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地點列表讀取路徑基準測試")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    db = make_session(args.rows)
+    try:
+        print(f"{'path':>6} {'ms/req':>8} {'rows/s':>10} {'peak KiB':>10} {'body KiB':>9}")
+        for name, func in (("orm", orm_path), ("core", core_path)):
+            per_request, peak, size = measure(func, db, args.repeat)
+            print(f"{name:>6} {per_request * 1000:>8.1f} {args.rows / per_request:>10.0f} "
+                  f"{peak / 1024:>10.0f} {size / 1024:>9.0f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
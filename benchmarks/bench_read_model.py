@@ -0,0 +1,104 @@
+# Purpose: 共用唯讀快照（app/utils/read_model.py）的基準測試
+#
+# 以合成的地點資料比較多個 worker 行程各自保存一份資料（list of tuple）與共同映射同一個快照檔案：
+#   private  每個 worker 的私有記憶體（/proc/self/smaps_rollup 的 Private_Clean + Private_Dirty 增加量）
+#   decode   由快照解碼全部資料列的時間
+# 使用方式: python -m benchmarks.bench_read_model [--rows 20000] [--workers 4]
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from app.utils.read_model import Snapshot, encode_snapshot
+
+COLUMNS = ["id", "name", "latitude", "longitude", "address", "brief_description", "photo", "tag"]
+
+
+def make_rows(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        (
+            i,
+            f"地點{i}",
+            f"{23 + rng.random():.6f}",
+            f"{121 + rng.random():.6f}",
+            f"花蓮縣豐濱鄉{i}號",
+            "描述" * rng.randint(5, 40),
+            None,
+            ["海岸", "漁業"][: rng.randint(0, 2)],
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def private_bytes():
+    total = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def worker(mode, path, rows_count, results):
+    before = private_bytes()
+    if mode == "copy":
+        data = make_rows(rows_count)
+        checksum = sum(len(row[5]) for row in data)
+    else:
+        table = Snapshot(path).tables["locations"]
+        # 讀取整個映射（模擬一段時間內所有資料列都被讀取過），保留映射但不保留解碼結果
+        checksum = sum(len(row[0]) for row in table.iter_rows(["brief_description"]))
+        data = table
+    results.put((mode, private_bytes() - before, checksum))
+    del data
+
+
+def run_workers(mode, path, rows_count, workers):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(mode, path, rows_count, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return [private for _, private, _ in measured]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共用唯讀快照基準測試")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    started = time.perf_counter()
+    content = encode_snapshot({"locations": (COLUMNS, rows)}, version=1, source_time_ns=time.time_ns())
+    encode_time = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "read-model.bin")
+        with open(path, "wb") as f:
+            f.write(content)
+
+        table = Snapshot(path).tables["locations"]
+        started = time.perf_counter()
+        table.rows()
+        decode_time = time.perf_counter() - started
+
+        print(f"rows={args.rows}  file={len(content) / 1024:.0f} KiB  "
+              f"encode={encode_time * 1000:.1f}ms  decode all={decode_time * 1000:.1f}ms")
+        print(f"{'mode':>8} {'workers':>8} {'private/worker(KiB)':>20} {'total private(KiB)':>19}")
+        for mode in ("copy", "mmap"):
+            private = run_workers(mode, path, args.rows, args.workers)
+            print(f"{mode:>8} {args.workers:>8} {sum(private) / len(private) / 1024:>20.0f} {sum(private) / 1024:>19.0f}")
+
+
+if __name__ == "__main__":
+    main()
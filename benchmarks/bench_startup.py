@@ -0,0 +1,111 @@
+# Purpose: 冷啟動時間的基準測試
+#
+# 每次以新的 Python 行程匯入 app.main（-X importtime），量測：
+#   interpreter  直譯器啟動（python -c pass）
+#   import       匯入 app.main（另依套件列出 -X importtime 的 self 時間合計）
+#   schema       create_all 與結構遷移（SCHEMA_INIT=startup 時）
+#   app          建立 FastAPI 應用程式、middleware 與路由
+#   warm-up      --warm-up 時執行 lifespan，直到 /ready 回傳 200 的各暖機步驟
+# SCHEMA_INIT=startup 與 --warm-up 需要可連線的 DATABASE_URL。
+# 使用方式: python -m benchmarks.bench_startup [--runs 5] [--schema skip] [--warm-up]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+CHILD = '''
+import json, time
+started = time.perf_counter()
+import app.main
+if {warm_up}:
+    from fastapi.testclient import TestClient
+    with TestClient(app.main.app):
+        app.main.startup_state.wait(60)
+status = app.main.startup_state.status()
+status["total_seconds"] = time.perf_counter() - started
+print("STARTUP " + json.dumps(status))
+'''
+
+
+def _child_env(schema):
+    env = dict(os.environ)
+    # app.database 在匯入時建立引擎，未設定時給一個不會連線的網址
+    env.setdefault("DATABASE_URL", "postgresql://benchmark@localhost/unused")
+    env["SCHEMA_INIT"] = schema
+    return env
+
+
+def interpreter_seconds(env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    return time.perf_counter() - started
+
+
+def parse_importtime(stderr):
+    """依最上層套件合計 -X importtime 的 self 時間（秒）"""
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return packages
+
+
+def run_once(schema, warm_up):
+    env = _child_env(schema)
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(warm_up=warm_up)],
+        env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    status_line = next((line for line in result.stdout.splitlines() if line.startswith("STARTUP ")), None)
+    if result.returncode != 0 or status_line is None:
+        raise RuntimeError(result.stderr[-2000:])
+    status = json.loads(status_line[len("STARTUP "):])
+    status["wall_seconds"] = wall
+    return status, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷啟動時間基準測試")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--schema", choices=["startup", "background", "skip"], default="skip",
+                        help="SCHEMA_INIT 設定（startup 需要資料庫）")
+    parser.add_argument("--warm-up", action="store_true", help="執行 lifespan 並等待暖機完成（需要資料庫）")
+    parser.add_argument("--top", type=int, default=10, help="列出 import 時間最多的套件數")
+    args = parser.parse_args()
+
+    interpreter = statistics.median(interpreter_seconds(_child_env(args.schema)) for _ in range(args.runs))
+    phases = defaultdict(list)
+    packages = defaultdict(list)
+    for _ in range(args.runs):
+        status, imports = run_once(args.schema, args.warm_up)
+        for name, phase in status["phases"].items():
+            phases[name].append(phase["seconds"])
+        phases["total (in process)"].append(status["total_seconds"])
+        phases["wall (incl. interpreter)"].append(status["wall_seconds"])
+        for name, seconds in imports.items():
+            packages[name].append(seconds)
+
+    print(f"SCHEMA_INIT={args.schema}  warm-up={'on' if args.warm_up else 'off'}  runs={args.runs}  (median)")
+    print(f"{'phase':<26} {'seconds':>9}")
+    print(f"{'interpreter':<26} {interpreter:>9.3f}")
+    for name, values in phases.items():
+        print(f"{name:<26} {statistics.median(values):>9.3f}")
+
+    print()
+    print(f"{'package (import self time)':<26} {'seconds':>9}")
+    ranked = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, values in ranked[:args.top]:
+        print(f"{name:<26} {statistics.median(values):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Purpose: 村民匯入重複偵測的效能基準測試
+#
+# 以合成資料量測 DuplicateIndex 建立索引與比對的時間，確認隨資料量近似線性成長。
+# 使用方式: python -m benchmarks.bench_villager_dedup [--sizes 1000 10000 100000]
+
+import argparse
+import random
+import time
+
+from app.services.villager_import import DuplicateIndex
+
+SURNAMES = "陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周徐蘇葉莊呂江何蕭羅高潘簡朱鍾彭游詹胡施沈余趙盧梁顏柯孫魏翁戴范宋方"
+GIVEN = "志明俊傑建宏家豪冠宇承恩宗翰美玲淑芬雅婷怡君佳穎欣怡文雄國華秀英麗華春嬌金龍阿美淑惠"
+
+# 平均每個地點（戶）的村民數
+VILLAGERS_PER_LOCATION = 8
+# 匯入資料中刻意加入的近似重複比例
+DUPLICATE_RATIO = 0.05
+
+
+def _random_name(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.choice((1, 2))))
+
+
+def _typo(rng, name):
+    """模擬人工輸入的差異：替換一個名字用字"""
+    pos = rng.randrange(1, len(name))
+    return name[:pos] + rng.choice(GIVEN) + name[pos + 1:]
+
+
+def make_dataset(size, seed=42):
+    """產生 size 筆既有村民與 size 筆待匯入資料"""
+    rng = random.Random(seed)
+    locations = max(1, size // VILLAGERS_PER_LOCATION)
+    existing = [
+        (i, _random_name(rng), rng.choice("MF"), rng.randrange(locations))
+        for i in range(size)
+    ]
+    incoming = []
+    for _ in range(size):
+        if rng.random() < DUPLICATE_RATIO:
+            _, name, gender, location = rng.choice(existing)
+            incoming.append((_typo(rng, name), gender, location))
+        else:
+            incoming.append((_random_name(rng), rng.choice("MF"), rng.randrange(locations)))
+    return existing, incoming
+
+
+def run(size):
+    existing, incoming = make_dataset(size)
+
+    start = time.perf_counter()
+    index = DuplicateIndex()
+    for key, name, gender, location in existing:
+        index.add(("villager", key), name, gender, location)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    flagged = 0
+    for row, (name, gender, location) in enumerate(incoming):
+        if index.find_matches(name, gender, location):
+            flagged += 1
+        else:
+            index.add(("row", row), name, gender, location)
+    match_time = time.perf_counter() - start
+
+    return build_time, match_time, flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="村民重複偵測基準測試")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'villagers':>10} {'build(s)':>10} {'match(s)':>10} {'us/row':>8} {'flagged':>8}")
+    for size in args.sizes:
+        build_time, match_time, flagged = run(size)
+        per_row = (build_time + match_time) / (2 * size) * 1e6
+        print(f"{size:>10} {build_time:>10.3f} {match_time:>10.3f} {per_row:>8.1f} {flagged:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# 測試共用的 fixture（資料庫、測試模型與客戶端在 helpers.py）
+import pytest
+from sqlalchemy import text
+
+from app import config
+from app.utils.cache import query_cache
+from .helpers import TestingSessionLocal, TestLocation, TestVillager, TestRelationshipType, TestVillagerRelationship
+
+# Pytest Fixture - 管理測試資料
+@pytest.fixture(scope="function")
+def test_db():
+    """提供測試用的資料庫會話"""
+    db = TestingSessionLocal()
+    yield db
+    
+    # 測試後清理所有資料
+    try:
+        db.execute(text("DELETE FROM public.Villagers_at_record"))
+        db.execute(text("DELETE FROM public.Students_at_record"))
+        db.execute(text("DELETE FROM Record"))
+        db.execute(text("DELETE FROM Account"))
+        db.execute(text("DELETE FROM VillagerRelationship"))
+        db.execute(text("DELETE FROM RelationshipType"))
+        db.execute(text("DELETE FROM Villager"))
+        db.execute(text("DELETE FROM Location"))
+        db.commit()
+    except Exception as e:
+        print(f"清理資料錯誤: {e}")
+        db.rollback()
+    finally:
+        db.close()
+        # 以 text() 刪除資料不會遞增資料表版本
+        query_cache.clear()
+
+@pytest.fixture
+def query_budget():
+    """檢查回應的查詢數不超過預算且沒有 N+1，回傳查詢數"""
+    def check(response, max_queries):
+        query_count = int(response.headers["X-DB-Query-Count"])
+        assert query_count <= max_queries, f"{response.request.url.path}: {query_count} queries (budget {max_queries})"
+        assert "X-DB-N-Plus-One" not in response.headers, f"{response.request.url.path}: possible N+1"
+        return query_count
+    return check
+
+@pytest.fixture
+def admin_headers(monkeypatch):
+    """設定管理權杖，回傳呼叫管理端點的標頭"""
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret")
+    return {"X-Admin-Token": "secret"}
+
+@pytest.fixture(scope="function")
+def test_villager_data(test_db):
+    """創建測試村民數據"""
+    # 首先添加地點
+    location = TestLocation(
+        name="測試地點",
+        Latitude="23.5",
+        Longitude="121.5",
+        Address="測試地址",
+        BriefDescription="測試描述"
+    )
+    test_db.add(location)
+    test_db.commit()
+    test_db.refresh(location)
+    
+    # 添加村民
+    villager1 = TestVillager(
+        Name="測試村民1",
+        Gender="M",
+        Job="務農",
+        Location=location.LocationID
+    )
+    
+    villager2 = TestVillager(
+        Name="測試村民2",
+        Gender="F",
+        Job="教師",
+        Location=location.LocationID
+    )
+    
+    test_db.add(villager1)
+    test_db.add(villager2)
+    test_db.commit()
+    test_db.refresh(villager1)
+    test_db.refresh(villager2)
+    
+    # 添加關係類型
+    relationship_type = TestRelationshipType(
+        Name="夫妻",
+        Source_Role="丈夫",
+        Target_Role="妻子",
+        Description="婚姻關係"
+    )
+    test_db.add(relationship_type)
+    test_db.commit()
+    test_db.refresh(relationship_type)
+    
+    # 建立親屬關係
+    relationship = TestVillagerRelationship(
+        SourceVillagerID=villager1.VillagerID,
+        TargetVillagerID=villager2.VillagerID,
+        RelationshipTypeID=relationship_type.RelationshipTypeID
+    )
+    test_db.add(relationship)
+    test_db.commit()
+    test_db.refresh(relationship)
+    
+    return {
+        "location": location,
+        "villager1": villager1,
+        "villager2": villager2,
+        "relationship_type": relationship_type,
+        "relationship": relationship
+    }
@@ -0,0 +1,151 @@
+# 測試共用的資料庫、測試模型與客戶端（fixture 在 conftest.py）
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, Date, CHAR
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.main import app
+from app.database import get_db, get_read_db
+from app.utils import query_counter
+
+# 創建測試用的臨時資料庫 - 使用SQLite內存數據庫
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 創建一個測試專用的Base類別，避免與應用程式的Base衝突
+TestBase = declarative_base()
+
+# 創建測試用的Location模型
+class TestLocation(TestBase):
+    __tablename__ = "Location"
+    
+    LocationID = Column("LocationID", Integer, primary_key=True, index=True, autoincrement=True)
+    name = Column("name", String(20), index=True, nullable=False)
+    Latitude = Column("Latitude", String(30), nullable=False)
+    Longitude = Column("Longitude", String(30), nullable=False)
+    Address = Column("Address", String(50))
+    BriefDescription = Column(String(300))
+    Photo = Column(Text)
+    # 用String代替ARRAY
+    Tag = Column("Tag", String(200))
+
+# 創建測試用的Villager模型
+class TestVillager(TestBase):
+    __tablename__ = "Villager"
+    
+    VillagerID = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    Name = Column(String(20), nullable=False)
+    Gender = Column(CHAR(1), nullable=False)
+    Job = Column(String(20))
+    URL = Column(Text)
+    Photo = Column(Text)
+    Location = Column(Integer, ForeignKey("Location.LocationID"))
+    ContactInfo = Column(Text)
+    VisitCount = Column(Integer, nullable=False, default=0)
+    LastVisited = Column(Date)
+
+# 創建測試用的RelationshipType模型
+class TestRelationshipType(TestBase):
+    __tablename__ = "RelationshipType"
+    
+    RelationshipTypeID = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    Name = Column(String(20), nullable=False, unique=True)
+    Source_Role = Column(String(20), nullable=False)
+    Target_Role = Column(String(20), nullable=False)
+    Description = Column(String(100))
+
+# 創建測試用的VillagerRelationship模型
+class TestVillagerRelationship(TestBase):
+    __tablename__ = "VillagerRelationship"
+    
+    RelationshipID = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    SourceVillagerID = Column(Integer, ForeignKey("Villager.VillagerID", ondelete="CASCADE"), nullable=False)
+    TargetVillagerID = Column(Integer, ForeignKey("Villager.VillagerID", ondelete="CASCADE"), nullable=False)
+    RelationshipTypeID = Column(Integer, ForeignKey("RelationshipType.RelationshipTypeID"), nullable=False)
+
+# 創建測試用的Account模型
+class TestAccount(TestBase):
+    __tablename__ = "Account"
+    
+    AccountID = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    Name = Column(String(20), nullable=False)
+    Password = Column(String(300), nullable=False)
+    EntrySemester = Column(CHAR(3), nullable=False)
+    Photo = Column(Text)
+
+# 創建測試用的Record模型（省略 Account 外鍵）
+class TestRecord(TestBase):
+    __tablename__ = "Record"
+    
+    RecordID = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    Semester = Column(CHAR(3), nullable=False)
+    Date = Column(Date, nullable=False)
+    Photo = Column(Text)
+    Description = Column(String(1000))
+    Location = Column(Integer, ForeignKey("Location.LocationID"), nullable=False)
+    Account = Column(Integer, nullable=False)
+
+# 創建測試用的家訪關聯模型（應用程式模型使用 public schema）
+class TestVillagersAtRecord(TestBase):
+    __tablename__ = "Villagers_at_record"
+    __table_args__ = {"schema": "public"}
+    
+    Villager = Column(Integer, primary_key=True)
+    Record = Column(Integer, primary_key=True)
+
+class TestStudentsAtRecord(TestBase):
+    __tablename__ = "Students_at_record"
+    __table_args__ = {"schema": "public"}
+    
+    Account = Column(Integer, primary_key=True)
+    Record = Column(Integer, primary_key=True)
+
+# SQLite 沒有 schema，以附加資料庫模擬 public schema（StaticPool 共用同一個連線）
+with engine.connect() as conn:
+    conn.exec_driver_sql("ATTACH DATABASE ':memory:' AS public")
+
+# 創建測試所需的表格
+TestBase.metadata.create_all(bind=engine)
+
+# 啟用外鍵約束（ON DELETE CASCADE）；SQLite 的外鍵不能跨附加資料庫，
+# Villagers_at_record 的 ON DELETE CASCADE 以 TEMP trigger 模擬
+with engine.connect() as conn:
+    conn.exec_driver_sql("PRAGMA foreign_keys = ON")
+    conn.exec_driver_sql(
+        'CREATE TEMP TRIGGER villagers_at_record_cascade AFTER DELETE ON main."Villager" '
+        'BEGIN DELETE FROM "Villagers_at_record" WHERE "Villager" = old."VillagerID"; END'
+    )
+
+# 建立測試客戶端
+client = TestClient(app)
+
+# 1. FastAPI 依賴覆蓋 - 替換資料庫連接
+def override_get_db():
+    """替換 FastAPI 的資料庫依賴，使用測試資料庫"""
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# 告訴 FastAPI 在測試中使用我們的測試資料庫
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+
+# 測試資料庫的查詢也計入 X-DB-Query-Count
+query_counter.install(engine)
+
+def find_middleware(middleware_class):
+    """取得應用程式 middleware 堆疊中的指定 middleware 實例"""
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+    middleware = app.middleware_stack
+    while not isinstance(middleware, middleware_class):
+        middleware = middleware.app
+    return middleware
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app.utils.admission import AdmissionController, AdmissionRejected, classify_request, HIGH, NORMAL, LOW
+
+
+def make_controller():
+    """容量 1、每個優先順序最多 1 個排隊的控制器（LOW 等待 0.05 秒逾時）"""
+    return AdmissionController(
+        capacity=1,
+        limits={HIGH: 1, NORMAL: 1, LOW: 1},
+        queue_limits={HIGH: 1, NORMAL: 1, LOW: 1},
+        max_wait={HIGH: 1.0, NORMAL: 1.0, LOW: 0.05}
+    )
+
+# 測試請求的優先順序分類
+@pytest.mark.parametrize("method, path, priority", [
+    ("GET", "/api/pool-status", None),
+    ("GET", "/api/villager", NORMAL),
+    ("GET", "/api/villager/3", HIGH),
+    ("POST", "/api/villager", HIGH),
+    ("POST", "/api/batch", NORMAL),
+    ("GET", "/api/records/debug/all", LOW),
+])
+def test_classify_request(method, path, priority):
+    """測試單筆讀取與寫入為高優先順序、列表與批次為一般、除錯端點為低，監控端點不受控制"""
+    assert classify_request(method, path) == priority
+
+# 測試歸還連線後依優先順序放行
+def test_admission_releases_by_priority():
+    """測試先排隊的一般請求在後到的高優先順序請求之後放行"""
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire(NORMAL)
+        order = []
+
+        async def wait_for_slot(priority):
+            await controller.acquire(priority)
+            order.append(priority)
+            controller.release(priority)
+
+        normal = asyncio.create_task(wait_for_slot(NORMAL))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(wait_for_slot(HIGH))
+        await asyncio.sleep(0)
+
+        controller.release(NORMAL)
+        await asyncio.gather(normal, high)
+        return order, controller.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == [HIGH, NORMAL]
+    assert stats["active"] == 0
+
+# 測試佇列已滿時立即拒絕
+def test_admission_rejects_when_queue_full():
+    """測試同一優先順序的佇列已滿時拒絕，並建議重試秒數"""
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire(NORMAL)
+        waiting = asyncio.create_task(controller.acquire(HIGH))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.acquire(HIGH)
+        finally:
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.reason == "queue_full"
+    assert rejected.retry_after >= 1
+    assert stats["priorities"][HIGH]["rejected_queue_full"] == 1
+
+# 測試等待超過上限時拒絕
+def test_admission_rejects_after_max_wait():
+    """測試低優先順序的請求等待超過 max_wait 後拒絕"""
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire(NORMAL)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(LOW)
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.reason == "timeout"
+    assert stats["priorities"][LOW]["rejected_timeout"] == 1
+
+# 測試應用程式的容量設定
+def test_admission_capacity_matches_pool():
+    """應用程式的准入容量與連接池（pool_size + max_overflow）相同"""
+    from app.main import admission_controller
+    assert admission_controller.capacity == 15
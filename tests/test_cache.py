@@ -0,0 +1,158 @@
+import time
+from datetime import date
+
+import pytest
+
+from app.utils.cache import (
+    QueryCache, LRUBackend, RedisBackend, LocalRedisServer, OrjsonSerializer, query_cache,
+)
+from .helpers import client, TestingSessionLocal, TestRecord
+
+
+@pytest.fixture
+def redis_server():
+    """行程內的 Redis 協定伺服器"""
+    server = LocalRedisServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def shared_query_cache(redis_server, monkeypatch):
+    """讓應用程式的查詢快取改用共用的 Redis 協定後端"""
+    monkeypatch.setattr(query_cache, "backend", RedisBackend(redis_server.url))
+    monkeypatch.setattr(query_cache, "serializer", OrjsonSerializer())
+    yield query_cache
+    query_cache.clear()
+
+def redis_cache(url, **kwargs):
+    cache = QueryCache(RedisBackend(url, **kwargs), OrjsonSerializer(), ttl_seconds=30)
+    cache.register("villagers", ("Villager",))
+    return cache
+
+def add_record(location_id):
+    db = TestingSessionLocal()
+    try:
+        db.add(TestRecord(Semester="113", Date=date(2024, 6, 1), Location=location_id, Account=1))
+        db.commit()
+    finally:
+        db.close()
+
+# 測試行程內 LRU 淘汰最久未使用的項目
+def test_lru_backend_evicts_least_recently_used():
+    cache = QueryCache(LRUBackend(max_entries=2))
+    cache.register("items", ("Item",))
+    cache.set("items", 1, "a")
+    cache.set("items", 2, "b")
+    assert cache.get("items", 1) == "a"
+    cache.set("items", 3, "c")
+
+    assert cache.get("items", 2) is None and cache.get("items", 1) == "a"
+    assert cache.stats()["items"]["hits"] == 2 and cache.stats()["items"]["misses"] == 1
+
+# 測試資料表版本遞增後失效
+def test_table_version_invalidation():
+    """只有寫入 namespace 依賴的資料表才讓項目失效"""
+    cache = QueryCache(LRUBackend())
+    cache.register("items", ("Item",))
+    cache.set("items", 1, "a")
+
+    cache.bump_tables({"Other"})
+    assert cache.get("items", 1) == "a"
+    cache.bump_tables({"Item"})
+    assert cache.get("items", 1) is None
+
+# 測試 Redis 協定後端的多個實例共用項目與版本
+def test_redis_backend_shared_between_instances(redis_server):
+    """兩個實例（模擬兩台機器）共用項目；一個實例遞增版本後另一個實例重新載入"""
+    first, second = redis_cache(redis_server.url), redis_cache(redis_server.url)
+    loads = []
+    loader = lambda: loads.append(1) or [{"name": "阿美", "last_visited": date(2024, 5, 1)}]
+
+    assert first.get_or_set("villagers", (1, None), loader)[0]["last_visited"] == date(2024, 5, 1)
+    assert second.get_or_set("villagers", (1, None), loader) == [{"name": "阿美", "last_visited": "2024-05-01"}]
+    assert len(loads) == 1
+
+    first.bump_tables({"Villager"})
+    second.get_or_set("villagers", (1, None), loader)
+    assert len(loads) == 2
+    second.invalidate("villagers")
+    assert first.get("villagers", (1, None)) is None
+
+# 測試 Redis 協定後端的存活時間與清除
+def test_redis_backend_ttl_and_clear(redis_server):
+    cache = redis_cache(redis_server.url)
+    cache.set("villagers", "short", 1, ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("villagers", "short") is None
+
+    cache.set("villagers", "long", 1)
+    cache.clear()
+    assert redis_server._data == {}
+
+# 測試後端無法連線時視為未命中
+def test_redis_backend_failure_counts_as_miss(redis_server):
+    """伺服器無法連線時載入資料、不寫入也不拋出例外，並記錄錯誤"""
+    cache = redis_cache(redis_server.url)
+    assert cache.get_or_set("villagers", 1, lambda: [0]) == [0]
+    redis_server.stop()
+    cache.backend.close()
+
+    loads = []
+    assert cache.get_or_set("villagers", 1, lambda: loads.append(1) or [1]) == [1]
+    assert loads == [1]
+    assert cache.get("villagers", 1, default="missing") == "missing"
+    cache.set("villagers", 1, [2])
+    assert cache.stats()["villagers"]["errors"] == 3
+
+# 測試只在共用後端快取的 namespace
+@pytest.mark.parametrize("make_backend", [
+    lambda server: LRUBackend(),
+    lambda server: RedisBackend(server.url, shared=False),
+])
+def test_shared_only_namespace_skipped_on_worker_local_backend(redis_server, make_backend):
+    """memory 後端與行程內伺服器只在目前 worker 有效，shared_only 的 namespace 不快取"""
+    backend = make_backend(redis_server)
+    cache = QueryCache(backend, OrjsonSerializer() if backend.serializes else None)
+    cache.register("by_location", ("Record",), shared_only=True)
+    loads = []
+
+    for _ in range(2):
+        assert cache.get_or_set("by_location", 1, lambda: loads.append(1) or [1]) == [1]
+    cache.set("by_location", 2, "a")
+    assert cache.get("by_location", 2) is None
+    assert len(loads) == 2
+    assert cache.status()["namespaces"]["by_location"]["enabled"] is False
+
+# 測試 memory 後端不快取地點的家訪紀錄
+def test_records_by_location_not_cached_on_memory_backend(test_villager_data):
+    path = f"/api/records/location/{test_villager_data['location'].LocationID}"
+    assert client.get(path).headers["X-DB-Query-Count"] != "0"
+    assert client.get(path).headers["X-DB-Query-Count"] != "0"
+
+# 測試共用後端的端點快取與失效
+def test_records_by_location_cached_on_shared_backend(test_villager_data, shared_query_cache):
+    """第二次不查詢資料庫，寫入家訪紀錄的交易提交後失效"""
+    location_id = test_villager_data["location"].LocationID
+    path = f"/api/records/location/{location_id}"
+    assert client.get(path).headers["X-DB-Query-Count"] != "0"
+    response = client.get(path)
+    assert response.headers["X-DB-Query-Count"] == "0"
+    count = len(response.json()["data"])
+
+    add_record(location_id)
+    response = client.get(path)
+    assert response.headers["X-DB-Query-Count"] != "0"
+    assert len(response.json()["data"]) == count + 1
+
+# 測試快取管理端點
+def test_cache_admin_status(test_villager_data, shared_query_cache, admin_headers):
+    path = f"/api/records/location/{test_villager_data['location'].LocationID}"
+    for _ in range(2):
+        client.get(path)
+
+    status = client.get("/api/admin/cache", headers=admin_headers).json()["data"]
+    assert status["shared"] is True
+    namespace = status["namespaces"]["records_by_location"]
+    assert namespace["tables"] == ["Record"]
+    assert namespace["enabled"] is True
+    assert namespace["hits"] >= 1
@@ -0,0 +1,203 @@
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from app.utils import metrics, tracing
+from app.utils.instrumentation import ServerTimingMiddleware
+from .helpers import client, engine, find_middleware
+
+
+def metric_lines():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return response.text.splitlines()
+
+def sample(lines, prefix):
+    return [float(line.rsplit(" ", 1)[1]) for line in lines if line.startswith(prefix)]
+
+def server_timing(response):
+    """解析 Server-Timing 標頭為 {階段: {參數: 值}}"""
+    phases = {}
+    for entry in response.headers["Server-Timing"].split(", "):
+        name, *params = entry.split(";")
+        phases[name] = dict(param.split("=", 1) for param in params)
+    return phases
+
+@pytest.fixture
+def traced(tmp_path):
+    """在 middleware 堆疊中插入追蹤（應用程式預設未開啟 TRACING），回傳 tracer"""
+    tracing.install(engine)
+    exporter = tracing.JSONLExporter(str(tmp_path / "traces.jsonl"))
+    tracer = tracing.Tracer(exporter=exporter, sample_rate=1.0, slow_ms=10_000)
+    middleware = find_middleware(ServerTimingMiddleware)
+    original_app = middleware.app
+    middleware.app = tracing.TracingMiddleware(original_app, tracer)
+    yield tracer
+    middleware.app = original_app
+
+# 測試 Prometheus 指標以路由樣板記錄請求
+def test_metrics_endpoint(test_villager_data):
+    """測試 /metrics 以路由樣板記錄請求數、延遲與回應大小"""
+    villager_id = test_villager_data["villager1"].VillagerID
+    for _ in range(2):
+        assert client.get(f"/api/villager/{villager_id}").status_code == 200
+    lines = metric_lines()
+
+    route = 'method="GET",route="/api/villager/{villager_id}"'
+    assert sample(lines, f'http_requests_total{{{route},status="200"}}')[0] >= 2
+    assert sample(lines, f'http_request_duration_seconds_count{{{route}}}')[0] >= 2
+    assert sample(lines, f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}')[0] >= 2
+    assert sample(lines, f'http_response_size_bytes_sum{{{route}}}')[0] > 0
+    assert sample(lines, f'http_requests_in_flight{{{route}}}') == [0]
+    assert sample(lines, f'db_statements_total{{{route}}}')[0] >= 2
+    assert "# TYPE db_pool_checkout_wait_seconds histogram" in lines
+
+# 測試找不到的路徑不以原始路徑作為標籤
+def test_metrics_unmatched_route_label():
+    assert client.get("/api/no-such-path").status_code == 404
+    lines = metric_lines()
+
+    assert sample(lines, 'http_requests_total{method="GET",route="unmatched",status="404"}')[0] >= 1
+    assert not any("no-such-path" in line for line in lines)
+
+# 測試連接池指標以事件追蹤，dispose 後仍有效
+def test_metrics_pool_events(tmp_path, monkeypatch):
+    """測試借出、歸還、強制關閉後連線數不為負數，engine.dispose() 後等待時間仍被記錄"""
+    monkeypatch.setattr(metrics.registry, "_collectors", [])
+    pool_engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=2)
+    metrics.instrument_engine(pool_engine)
+
+    def pool_gauges():
+        values = metrics.registry.snapshot()["db_pool_connections"]["values"]
+        return {labels[0]: value for labels, value in values}
+
+    def wait_count():
+        return sum(sum(state[0]) for _, state in metrics.POOL_CHECKOUT_WAIT.snapshot()["values"])
+
+    try:
+        before = wait_count()
+        conns = [pool_engine.connect() for _ in range(3)]
+        for conn in conns:
+            conn.execute(text("SELECT 1"))
+        assert pool_gauges() == {"checked_out": 3, "idle": 0, "overflow": 1}
+
+        # 借出中被強制關閉的連線歸還後不算閒置
+        conns[0].invalidate()
+        for conn in conns:
+            conn.close()
+        assert pool_gauges() == {"checked_out": 0, "idle": 1, "overflow": 0}
+
+        # dispose 建立新的連接池，事件與等待時間量測仍然有效
+        pool_engine.dispose()
+        assert pool_gauges()["idle"] == 0
+        with pool_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            assert pool_gauges()["checked_out"] == 1
+        assert wait_count() == before + 4
+        assert all(value >= 0 for value in pool_gauges().values())
+    finally:
+        pool_engine.dispose()
+
+# 測試多 worker 的指標合併
+def test_metrics_multiprocess_merge(tmp_path):
+    """測試多 worker 的快照合併：counter 與 histogram 加總，已結束 worker 的 gauge 不計入"""
+    registry = metrics.MetricsRegistry(multiprocess_dir=str(tmp_path))
+    requests_total = registry.counter("requests_total", "Requests", ("route",))
+    in_flight = registry.gauge("in_flight", "In flight")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    requests_total.inc("/a", amount=3)
+    in_flight.set(value=2)
+    latency.observe(0.05)
+    latency.observe(5.0)
+    # 模擬另一個已結束的 worker
+    dead_pid = 2 ** 22 + 12345
+    (tmp_path / f"metrics-{dead_pid}.json").write_bytes(metrics.dumps(registry.snapshot()))
+
+    exposition = registry.collect()
+    assert 'requests_total{route="/a"} 6' in exposition
+    assert "in_flight 2" in exposition
+    assert 'latency_seconds_bucket{le="0.1"} 2' in exposition
+    assert 'latency_seconds_bucket{le="1.0"} 2' in exposition
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in exposition
+    assert "latency_seconds_count 4" in exposition
+    assert (tmp_path / f"metrics-{os.getpid()}.json").exists()
+
+# 測試 Server-Timing 標頭的各階段耗時
+def test_server_timing_header(test_villager_data):
+    """測試回應帶有各階段耗時，db 階段附上查詢數，巢狀階段不超過外層"""
+    location_id = test_villager_data["location"].LocationID
+    response = client.get(f"/api/villagers/location/{location_id}")
+    assert response.status_code == 200
+
+    phases = server_timing(response)
+    assert set(phases) >= {"db", "orm", "crud", "handler", "serialize", "total"}
+    assert phases["db"]["desc"] == f'"{response.headers["X-DB-Query-Count"]} queries"'
+    assert float(phases["crud"]["dur"]) <= float(phases["handler"]["dur"]) <= float(phases["total"]["dur"])
+
+# 測試 Server-Timing 的抽樣
+def test_server_timing_sampling(test_villager_data, monkeypatch):
+    """測試抽樣比例為 0 時只量測帶有 X-Server-Timing 標頭的請求"""
+    monkeypatch.setattr(find_middleware(ServerTimingMiddleware), "sample_rate", 0.0)
+    path = f"/api/villagers/location/{test_villager_data['location'].LocationID}"
+
+    assert "Server-Timing" not in client.get(path).headers
+    assert "Server-Timing" in client.get(path, headers={"X-Server-Timing": "1"}).headers
+
+# 測試 trace 的保留條件
+def test_tracing_retention(test_villager_data, traced):
+    """測試抽中的 trace 保留，未抽中且不慢的 trace 不保留，超過 slow_ms 的 trace 保留"""
+    path = f"/api/villager/{test_villager_data['villager1'].VillagerID}"
+    assert client.get(path).status_code == 200
+    traced.sample_rate = 0.0
+    assert client.get(path).status_code == 200
+    traced.slow_ms = 0
+    assert client.get(path).status_code == 200
+
+    assert traced.stats() == {"traces": 3, "sampled": 1, "slow": 1}
+    assert [record["retained_by"] for record in traced.recent()] == ["slow", "sampled"]
+
+# 測試 span 的巢狀關係
+def test_tracing_span_tree(test_villager_data, traced):
+    """測試 handler、crud、sql 與 serialize span 掛在正確的父 span 下"""
+    assert client.get(f"/api/villager/{test_villager_data['villager1'].VillagerID}").status_code == 200
+    record = traced.recent()[0]
+    spans = {span["span_id"]: span for span in record["spans"]}
+    by_kind = {}
+    for item in record["spans"]:
+        by_kind.setdefault(item["kind"], []).append(item)
+
+    root = by_kind["request"][0]
+    assert root["name"] == "GET /api/villager/{villager_id}"
+    assert root["attributes"]["status"] == 200
+    assert by_kind["handler"][0]["parent_id"] == root["span_id"]
+    assert all(spans[crud["parent_id"]]["kind"] in ("handler", "crud") for crud in by_kind["crud"])
+    assert any(crud["name"] == "Villager.get_villager_by_id" for crud in by_kind["crud"])
+    assert all(spans[sql["parent_id"]]["kind"] == "crud" for sql in by_kind["sql"])
+    assert by_kind["serialize"][0]["parent_id"] == root["span_id"]
+    assert all(item["duration_ms"] is not None for item in record["spans"])
+
+# 測試瀑布圖
+def test_tracing_waterfall(test_villager_data, traced):
+    assert client.get(f"/api/villager/{test_villager_data['villager1'].VillagerID}").status_code == 200
+    waterfall = tracing.render_waterfall(traced.recent()[0])
+
+    assert "Villager.get_villager_by_id" in waterfall
+    assert "sql SELECT" in waterfall
+
+# 測試保留的 trace 匯出為 JSONL
+def test_tracing_jsonl_export(test_villager_data, traced, tmp_path):
+    """測試背景執行緒把保留的 trace 寫入 JSONL"""
+    path = f"/api/villager/{test_villager_data['villager1'].VillagerID}"
+    for _ in range(2):
+        assert client.get(path).status_code == 200
+
+    deadline = time.time() + 5
+    output = tmp_path / "traces.jsonl"
+    while time.time() < deadline and (not output.exists() or len(output.read_text().splitlines()) < 2):
+        time.sleep(0.05)
+    assert len(output.read_text().splitlines()) == 2
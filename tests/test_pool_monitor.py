@@ -0,0 +1,166 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from app.utils.cache import query_cache
+from app.utils.connection_monitor import ConnectionMonitor
+from app.utils.leak_tracer import LeakTracer
+from .helpers import client, engine
+
+
+@pytest.fixture
+def pool_engine(tmp_path):
+    """使用 QueuePool 的檔案資料庫（測試資料庫的 StaticPool 沒有連接池計數）"""
+    pool_engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=5)
+    yield pool_engine
+    pool_engine.dispose()
+
+@pytest.fixture
+def monitor():
+    """掛在測試資料庫上的連接池管理（門檻足夠長，不會在測試中觸發）"""
+    monitor = ConnectionMonitor(leak_threshold=3600, kill_threshold=7200)
+    monitor.attach(engine)
+    yield monitor
+    monitor.detach(engine)
+
+# 測試借出連線時記錄路由樣板
+def test_connection_monitor_tracks_routes(test_villager_data, monitor):
+    """測試請求借出的連線以路由樣板記錄，歸還後不再計入借出"""
+    routes = []
+    monitor.add_listener(lambda info: routes.append(info.route), lambda info, held: None)
+    villager_id = test_villager_data["villager1"].VillagerID
+
+    assert client.get(f"/api/villager/{villager_id}").status_code == 200
+    assert "GET /api/villager/{villager_id}" in routes
+    assert monitor.stats()["checked_out"] == 0
+
+# 測試請求以外借出的連線
+def test_connection_monitor_background_checkout(monitor):
+    """測試請求以外借出的連線記為 background，歸還後從持有列表移除"""
+    conn = engine.connect()
+    try:
+        held = monitor.held_connections()
+        assert len(held) == 1
+        assert held[0]["route"] == "background"
+        assert monitor.stats()["long_held"] == []
+    finally:
+        conn.close()
+    assert monitor.held_connections() == []
+
+# 測試閒置連線保留數量隨需求下降
+def test_connection_monitor_idle_target_decays(pool_engine):
+    """測試沒有流量時閒置連線的保留數量降到 min_idle"""
+    monitor = ConnectionMonitor(min_idle=2)
+    monitor.attach(pool_engine)
+    try:
+        for _ in range(10):
+            monitor._adjust_idle_pool()
+        assert monitor.stats()["idle_target"] == 2
+        monitor.tick()
+    finally:
+        monitor.detach(pool_engine)
+
+# 測試閒置連線保留數量只在歸還時關閉多餘的連線，不改變連接池計數
+def test_connection_monitor_idle_target_queue_pool(pool_engine):
+    """測試需求下降後多餘的閒置連線在歸還時關閉，QueuePool 的借出數與大小仍正確"""
+    monitor = ConnectionMonitor(min_idle=2)
+    monitor.attach(pool_engine)
+    try:
+        for _ in range(10):
+            monitor._adjust_idle_pool()
+
+        for _ in range(2):
+            conns = [pool_engine.connect() for _ in range(3)]
+            for conn in conns:
+                assert conn.execute(text("SELECT 1")).scalar() == 1
+            assert pool_engine.pool.checkedout() == 3
+            for conn in conns:
+                conn.close()
+
+            pool = pool_engine.pool
+            assert (pool.size(), pool.checkedin(), pool.checkedout()) == (5, 3, 0)
+            assert monitor.stats()["idle_open"] == 2
+
+        assert monitor.stats()["idle_closed"] == 2
+    finally:
+        monitor.detach(pool_engine)
+
+# 測試持有超過 leak_threshold 的連線被標記為軟性失效
+def test_connection_monitor_soft_invalidates_long_held(pool_engine):
+    """測試軟性失效不影響使用中的連線"""
+    monitor = ConnectionMonitor(leak_threshold=0.01, kill_threshold=3600)
+    monitor.attach(pool_engine)
+    try:
+        with pool_engine.connect() as conn:
+            time.sleep(0.02)
+            monitor._check_long_held()
+            assert monitor.stats()["soft_invalidated"] == 1
+            assert monitor.stats()["closed"] == 0
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        monitor.detach(pool_engine)
+
+# 測試持有超過 kill_threshold 的連線被強制關閉
+def test_connection_monitor_kill_threshold(pool_engine):
+    """測試強制關閉的連線與歸還走同一個路徑：洩漏追蹤的借出數歸零，之後歸還不重複計入"""
+    monitor = ConnectionMonitor(leak_threshold=3600, kill_threshold=0.01)
+    tracer = LeakTracer()
+    tracer.enable(monitor)
+    monitor.attach(pool_engine)
+    try:
+        conn = pool_engine.connect()
+        conn.execute(text("SELECT 1"))
+        conn.commit()
+        time.sleep(0.02)
+
+        monitor._check_long_held()
+        assert monitor.stats()["closed"] == 1
+        assert monitor.held_connections() == []
+        histogram = tracer.route_histograms()["background"]
+        assert histogram["active"] == 0 and histogram["count"] == 1
+
+        # 使用者之後歸還連線不重複計入，連接池計數正確，下次借出重新連線
+        conn.close()
+        assert tracer.route_histograms()["background"]["count"] == 1
+        assert pool_engine.pool.checkedout() == 0
+        with pool_engine.connect() as conn:
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        monitor.detach(pool_engine)
+
+# 測試連線洩漏追蹤的路由直方圖
+def test_leak_tracer_route_histograms(test_villager_data, monitor):
+    """測試追蹤開啟後記錄各路由的連線持有時間"""
+    tracer = LeakTracer()
+    tracer.enable(monitor)
+    location_id = test_villager_data["location"].LocationID
+    for _ in range(3):
+        # 命中查詢快取的請求不借用連線
+        query_cache.clear()
+        assert client.get(f"/api/villagers/location/{location_id}").status_code == 200
+
+    histogram = tracer.route_histograms()["GET /api/villagers/location/{location_id}"]
+    assert histogram["count"] == 3
+    assert histogram["active"] == 0
+    assert histogram["buckets"]["+Inf"] == 3
+
+# 測試連線洩漏追蹤記錄呼叫堆疊
+def test_leak_tracer_records_app_stack(test_villager_data, monitor):
+    """測試借出時的堆疊只包含 app 套件內的 frame"""
+    tracer = LeakTracer()
+    tracer.enable(monitor)
+    stacks = []
+    monitor.add_listener(lambda info: stacks.append(info.stack), lambda info, held: None)
+
+    location_id = test_villager_data["location"].LocationID
+    assert client.get(f"/api/villagers/location/{location_id}").status_code == 200
+    assert stacks and any("app/router/villagers.py" in frame for frame in stacks[0])
+    assert all(frame.startswith("app/") for frame in stacks[0])
+
+# 測試洩漏查詢端點
+def test_pool_status_leaks_endpoint():
+    response = client.get("/api/pool-status/leaks?min_seconds=0")
+    assert response.status_code == 200
+    assert "routes" in response.json()
@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+
+from app.database import get_read_db
+from app.main import app
+from app.utils.memory import session_tracker
+from app.utils.profiler import SamplingProfiler, ProfilerBusy
+from .helpers import client, TestingSessionLocal
+
+
+@pytest.fixture(scope="module")
+def busy_profile():
+    """取樣另一個執行緒中的忙碌迴圈 0.2 秒"""
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(i * i for i in range(1000))
+
+    worker = threading.Thread(target=busy_loop, name="busy-worker")
+    worker.start()
+    try:
+        return SamplingProfiler(interval=0.002).run(0.2)
+    finally:
+        stop.set()
+        worker.join()
+
+@pytest.fixture
+def profiler_lock():
+    """模擬另一個正在執行的分析"""
+    assert SamplingProfiler._lock.acquire(blocking=False)
+    yield
+    SamplingProfiler._lock.release()
+
+@pytest.fixture
+def tracked_sessions(monkeypatch):
+    """測試以 override_get_db 取代 get_read_db，這裡改用會記錄 session 的版本"""
+    def tracked_get_db():
+        db = TestingSessionLocal()
+        session_tracker.track(db)
+        try:
+            yield db
+        finally:
+            session_tracker.closing(db)
+            db.close()
+    session_tracker.install()
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, tracked_get_db)
+
+@pytest.fixture
+def tracemalloc_on(admin_headers):
+    assert client.post("/api/admin/memory/tracemalloc?frames=5", headers=admin_headers).json()["data"]["tracing"]
+    yield
+    assert client.delete("/api/admin/memory/tracemalloc", headers=admin_headers).status_code == 200
+
+# 測試取樣式效能分析記錄其他執行緒的堆疊
+def test_sampling_profiler_collapsed(busy_profile):
+    """測試 collapsed 格式以執行緒名稱開頭，包含忙碌迴圈的 frame"""
+    assert busy_profile.sample_count > 10
+    busy = [line for line in busy_profile.collapsed().splitlines() if line.startswith("busy-worker;")]
+    assert busy and all("busy_loop (tests/test_profiling.py:" in line for line in busy)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in busy) > 10
+
+# 測試 speedscope 格式
+def test_sampling_profiler_speedscope(busy_profile):
+    document = busy_profile.speedscope()
+    profile = next(p for p in document["profiles"] if p["name"] == "busy-worker")
+
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"])
+    assert all(0 <= index < len(document["shared"]["frames"]) for sample in profile["samples"] for index in sample)
+
+# 測試同時只能執行一個分析
+def test_sampling_profiler_busy(profiler_lock):
+    with pytest.raises(ProfilerBusy):
+        SamplingProfiler().run(0.01)
+
+# 測試分析端點
+def test_profile_endpoint(admin_headers):
+    response = client.get(
+        "/api/admin/profile?seconds=0.1&interval_ms=5&format=speedscope",
+        headers=admin_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["$schema"].startswith("https://www.speedscope.app")
+    assert int(response.headers["X-Profile-Samples"]) > 0
+
+# 測試已有分析執行中時端點回傳 409
+def test_profile_endpoint_busy(admin_headers, profiler_lock):
+    response = client.get("/api/admin/profile?seconds=0.1", headers=admin_headers)
+    assert response.status_code == 409
+
+# 測試未開啟 tracemalloc 時不能建立快照
+def test_memory_snapshot_requires_tracemalloc(admin_headers):
+    assert client.post("/api/admin/memory/snapshots", headers=admin_headers).status_code == 409
+
+# 測試 tracemalloc 快照與差異
+def test_memory_snapshot_diff(admin_headers, tracemalloc_on):
+    """測試快照列出最大的配置位置，差異指出測試中保留的記憶體"""
+    base = client.post("/api/admin/memory/snapshots", headers=admin_headers).json()["data"]["id"]
+    retained = [bytearray(1024) for _ in range(2000)]
+    target = client.post("/api/admin/memory/snapshots", headers=admin_headers).json()["data"]["id"]
+
+    top = client.get(f"/api/admin/memory/snapshots/{target}?limit=5", headers=admin_headers).json()["data"]
+    assert top and top[0]["size_bytes"] > 0
+    diff = client.get(
+        f"/api/admin/memory/snapshots/diff?base={base}&target={target}", headers=admin_headers
+    ).json()["data"]
+    assert any(
+        "tests/test_profiling.py" in item["traceback"][0] and item["size_diff_bytes"] >= 2000 * 1024
+        for item in diff
+    )
+    del retained
+
+# 測試不存在的快照
+def test_memory_snapshot_not_found(admin_headers, tracemalloc_on):
+    assert client.get("/api/admin/memory/snapshots/999", headers=admin_headers).status_code == 404
+
+# 測試記憶體概況
+def test_memory_summary(test_villager_data, admin_headers, tracked_sessions):
+    """測試程序記憶體、session identity map 大小與最大的回應"""
+    location_id = test_villager_data["location"].LocationID
+    assert client.get(f"/api/villagers/location/{location_id}").status_code == 200
+
+    data = client.get("/api/admin/memory", headers=admin_headers).json()["data"]
+    assert data["tracemalloc"] == {"tracing": False}
+    assert data["process"]["max_rss_bytes"] > 0
+    assert data["identity_map_peaks"]["GET /api/villagers/location/{location_id}"]["max_loaded"] >= 2
+    assert any(
+        response["route"] == "GET /api/villagers/location/{location_id}" and response["size_bytes"] > 0
+        for response in data["largest_responses"]
+    )
@@ -0,0 +1,105 @@
+import pytest
+
+from app.utils import query_counter
+from app.utils.slow_query import SlowQueryRecorder, slow_query_recorder
+from .helpers import client, engine
+
+
+@pytest.fixture
+def slow_queries(monkeypatch):
+    """記錄所有查詢的慢查詢紀錄器（測試後恢復門檻）"""
+    slow_query_recorder.install(engine)
+    monkeypatch.setattr(slow_query_recorder, "threshold", 0.0)
+    slow_query_recorder.clear()
+    yield slow_query_recorder
+    slow_query_recorder.clear()
+
+# 測試各端點的查詢數預算
+@pytest.mark.parametrize("path, max_queries", [
+    ("/api/locations", 1),
+    ("/api/villager?limit=10", 2),
+    ("/api/villager/{villager_id}", 3),
+    ("/api/villagers/location/{location_id}", 3),
+    ("/api/records/location/{location_id}", 3),
+])
+def test_endpoint_query_budget(test_villager_data, query_budget, path, max_queries):
+    """測試各端點的查詢數不超過預算且沒有 N+1"""
+    response = client.get(path.format(
+        villager_id=test_villager_data["villager1"].VillagerID,
+        location_id=test_villager_data["location"].LocationID
+    ))
+
+    assert response.status_code == 200
+    query_budget(response, max_queries)
+    assert float(response.headers["X-DB-Time-Ms"]) >= 0
+
+# 測試 N+1 偵測
+def test_query_counter_flags_repeated_statements():
+    """測試同一語句形狀重複執行時標記為 N+1"""
+    stats = query_counter.QueryStats()
+    for villager_id in range(6):
+        stats.record(f'SELECT * FROM "Villager" WHERE "VillagerID" = {villager_id}', 0.001)
+    stats.record("SELECT * FROM \"Villager\" WHERE \"Location\" IN (?, ?)", 0.001)
+    stats.record("SELECT * FROM \"Villager\" WHERE \"Location\" IN (?, ?, ?)", 0.001)
+
+    assert stats.count == 8
+    assert stats.repeated(5) == [('SELECT * FROM "Villager" WHERE "VillagerID" = ?', 6)]
+    assert stats.repeated(10) == []
+
+# 測試語句形狀的正規化
+def test_statement_shape_normalizes_literals():
+    """測試 IN 列表長度、具名參數、字串常值與空白不影響形狀"""
+    assert query_counter.statement_shape(
+        "SELECT *\n FROM x WHERE id IN (%(id_1_1)s, %(id_1_2)s) AND name = 'a''b'"
+    ) == "SELECT * FROM x WHERE id IN (?...) AND name = ?"
+
+# 測試慢查詢紀錄
+def test_slow_query_log(test_villager_data, slow_queries, admin_headers):
+    """測試慢查詢記錄語句形狀、參數型別與呼叫的 crud 函式"""
+    villager_id = test_villager_data["villager1"].VillagerID
+    assert client.get(f"/api/villager/{villager_id}").status_code == 200
+
+    response = client.get("/api/admin/slow-queries", headers=admin_headers)
+    assert response.status_code == 200
+    data = response.json()["data"]
+    recent = [entry for entry in data["recent"] if entry["route"] == "GET /api/villager/{villager_id}"]
+    assert recent
+    assert any(entry["caller"].startswith("app/crud/") for entry in recent)
+    # 只保存參數型別，不保存參數值
+    assert all(str(villager_id) not in str(entry["binds"].values()) for entry in recent if isinstance(entry["binds"], dict))
+    assert any("int" in str(entry["binds"]) for entry in recent)
+    assert {shape["shape"] for shape in data["shapes"]} >= {entry["shape"] for entry in recent}
+
+# 測試清除慢查詢紀錄
+def test_slow_query_clear(test_villager_data, slow_queries, admin_headers):
+    assert client.get("/api/locations").status_code == 200
+    assert slow_queries.entries()
+
+    assert client.delete("/api/admin/slow-queries", headers=admin_headers).status_code == 200
+    assert slow_queries.entries() == []
+
+# 測試未設定管理權杖時停用管理端點
+def test_admin_endpoint_disabled_without_token(monkeypatch):
+    from app import config
+
+    monkeypatch.setattr(config, "ADMIN_TOKEN", None)
+    assert client.get("/api/admin/slow-queries").status_code == 403
+    assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "secret"}).status_code == 403
+
+# 測試權杖缺少或錯誤時拒絕
+def test_admin_endpoint_rejects_missing_or_wrong_token(admin_headers):
+    assert client.get("/api/admin/slow-queries").status_code == 401
+    assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "wrong"}).status_code == 401
+
+# 測試慢查詢的語句形狀統計有數量上限
+def test_slow_query_shapes_bounded():
+    """測試超過 max_shapes 時淘汰最久沒有變慢的語句形狀"""
+    recorder = SlowQueryRecorder(threshold_ms=0, max_shapes=2)
+    recorder.record("SELECT 1 FROM a", None, 0.1)
+    recorder.record("SELECT 1 FROM b", None, 0.1)
+    recorder.record("SELECT 1 FROM a", None, 0.1)
+    recorder.record("SELECT 1 FROM c", None, 0.1)
+
+    shapes = {summary["shape"]: summary["count"] for summary in recorder.shapes()}
+    assert shapes == {"SELECT ? FROM a": 2, "SELECT ? FROM c": 1}
+    assert len(recorder.entries()) == 4
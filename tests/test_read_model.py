@@ -0,0 +1,110 @@
+import fcntl
+import time
+from datetime import date
+
+import pytest
+
+from app.services.read_model import SNAPSHOT_SOURCES, load_snapshot_tables
+from app.utils.read_model import read_model, Snapshot, encode_snapshot
+from .helpers import client, TestingSessionLocal, TestLocation, TestVillager
+
+
+def load():
+    db = TestingSessionLocal()
+    try:
+        return load_snapshot_tables(db)
+    finally:
+        db.close()
+
+def location_names():
+    response = client.get("/api/locations?fields=name")
+    return response.headers["X-DB-Query-Count"], [item["name"] for item in response.json()["data"]]
+
+@pytest.fixture
+def shared_read_model(tmp_path, monkeypatch):
+    """以暫存檔案作為快照路徑並訂閱寫入（尚未建立快照）"""
+    monkeypatch.setattr(read_model, "path", str(tmp_path / "read-model.bin"))
+    monkeypatch.setattr(read_model, "_snapshot", None)
+    read_model.install(SNAPSHOT_SOURCES)
+    return read_model
+
+@pytest.fixture
+def built_read_model(test_villager_data, shared_read_model):
+    """已由測試資料建立的快照"""
+    assert shared_read_model.refresh(load)
+    return shared_read_model
+
+# 測試快照的編碼與解碼
+def test_snapshot_roundtrip(tmp_path):
+    """測試 NULL、日期、陣列、多位元組字元，以及依主鍵查詢"""
+    path = tmp_path / "roundtrip.bin"
+    path.write_bytes(encode_snapshot({
+        "items": (["id", "name", "tags", "visited"], [
+            (7, "阿美", ["海岸", "漁業"], date(2024, 5, 1)),
+            (3, None, [], None),
+        ])
+    }, version=4, source_time_ns=time.time_ns()))
+    snapshot = Snapshot(str(path))
+    items = snapshot.tables["items"]
+
+    assert snapshot.version == 4 and len(items) == 2
+    assert items.rows(["name", "id"]) == [(None, 3), ("阿美", 7)]
+    assert items.get(7) == (7, "阿美", ["海岸", "漁業"], date(2024, 5, 1))
+    assert items.get(5) is None
+
+# 測試沒有快照時查詢資料庫
+def test_read_model_missing_snapshot(test_villager_data, shared_read_model):
+    assert client.get("/api/locations?fields=id,name").headers["X-DB-Query-Count"] == "1"
+    assert shared_read_model.is_stale()
+
+# 測試建立快照後由快照回應
+def test_read_model_serves_locations(test_villager_data, built_read_model):
+    """測試未過期時不重建，地點列表由快照回應，不查詢資料庫"""
+    assert not built_read_model.refresh(load)
+    status = built_read_model.status()
+    assert status["fresh"] == {"locations": True} and status["version"] == 1
+    assert status["tables"] == {"locations": 1}
+
+    response = client.get("/api/locations?fields=id,name")
+    assert response.headers["X-DB-Query-Count"] == "0"
+    location = test_villager_data["location"]
+    assert response.json()["data"] == [{"id": location.LocationID, "name": "測試地點"}]
+
+# 測試寫入其他資料表不讓快照過期
+def test_read_model_ignores_unrelated_writes(test_villager_data, built_read_model):
+    """寫入村民（例如家訪統計）不影響地點快照"""
+    db = TestingSessionLocal()
+    try:
+        db.query(TestVillager).filter_by(VillagerID=test_villager_data["villager1"].VillagerID).update({"VisitCount": 3})
+        db.commit()
+    finally:
+        db.close()
+    assert not built_read_model.is_stale()
+    assert client.get("/api/locations?fields=id,name").headers["X-DB-Query-Count"] == "0"
+
+# 測試寫入來源資料表後快照過期
+def test_read_model_stale_after_source_write(built_read_model):
+    """寫入地點後改查資料庫，讀到剛寫入的資料；重建後再由快照回應"""
+    db = TestingSessionLocal()
+    try:
+        db.add(TestLocation(name="新地點", Latitude="23.6", Longitude="121.6"))
+        db.commit()
+    finally:
+        db.close()
+    assert built_read_model.is_stale()
+    assert location_names() == ("1", ["測試地點", "新地點"])
+
+    assert built_read_model.refresh(load)
+    assert built_read_model.status()["version"] == 2
+    assert location_names() == ("0", ["測試地點", "新地點"])
+
+# 測試同時只有一個 worker 重建
+def test_read_model_refresh_lock(test_villager_data, shared_read_model):
+    """另一個 worker 持有重建鎖時直接返回"""
+    with open(f"{shared_read_model.path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            assert not shared_read_model.refresh(load)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    assert shared_read_model.refresh(load)
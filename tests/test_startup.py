@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import app.main as main
+from app.crud import Villager as VillagerCrud
+from app.database import CONNECT_ARGS
+from app.utils.scheduler import AdvisoryLeaderLock, Scheduler
+from app.utils.startup import StartupState, warm_pool
+from .helpers import client, engine, TestingSessionLocal
+
+
+def broken_step():
+    raise RuntimeError("cache unavailable")
+
+@pytest.fixture
+def startup_state(monkeypatch):
+    """以新的啟動狀態取代應用程式的狀態（尚未暖機）"""
+    state = StartupState()
+    monkeypatch.setattr(main, "startup_state", state)
+    return state
+
+class Follower:
+    """永遠不是 leader 的選舉（singleton 工作不執行）"""
+
+    def is_leader(self):
+        return False
+
+    def release(self):
+        pass
+
+def run_scheduler(jobs, seconds=0.15):
+    """註冊工作、執行 seconds 秒後關閉，回傳各工作的統計"""
+    async def run():
+        scheduler = Scheduler(leader=Follower(), jitter=0)
+        for name, func, interval, singleton in jobs:
+            scheduler.add_job(name, func, interval, singleton=singleton)
+        scheduler.start()
+        await asyncio.sleep(seconds)
+        await scheduler.stop()
+        return scheduler.stats()
+    return asyncio.run(run())
+
+# 測試暖機完成前未就緒
+def test_not_ready_before_warm_up(startup_state):
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+# 測試非必要步驟失敗不影響就緒
+def test_ready_when_optional_step_fails(startup_state):
+    """測試暖機完成後 /ready 回傳 200，並記錄各步驟的耗時與錯誤"""
+    startup_state.run_warm_up([
+        ("pool", lambda: warm_pool(engine, 2), False),
+        ("cache", broken_step, False),
+    ])
+    response = client.get("/ready")
+    assert response.status_code == 200
+    phases = response.json()["phases"]
+    assert phases["pool"]["ok"] and phases["pool"]["seconds"] >= 0
+    assert phases["cache"] == {"seconds": phases["cache"]["seconds"], "ok": False, "error": "cache unavailable"}
+
+# 測試必要步驟失敗時維持未就緒
+def test_not_ready_when_required_step_fails(startup_state):
+    """測試背景暖機的必要步驟失敗時 /ready 維持 503，之後的步驟不執行"""
+    startup_state.start_warm_up([("schema", broken_step, True), ("pool", lambda: None, False)]).join()
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["error"] == "schema: cache unavailable"
+    assert "pool" not in response.json()["phases"]
+
+# 測試排程不重疊執行，關閉時等待執行中的工作
+def test_scheduler_skips_overlapping_runs():
+    finished = []
+
+    def slow_job():
+        time.sleep(0.1)
+        finished.append("slow")
+
+    stats = run_scheduler([("slow", slow_job, 0.02, False)])
+    assert stats["slow"]["runs"] >= 1 and stats["slow"]["skipped_overlap"] >= 1
+    assert finished.count("slow") == stats["slow"]["runs"]
+
+# 測試排程記錄失敗並繼續執行
+def test_scheduler_records_failures():
+    stats = run_scheduler([("failing", broken_step, 0.02, False)])
+    assert stats["failing"]["failures"] == stats["failing"]["runs"] >= 2
+    assert stats["failing"]["last_error"] == "cache unavailable"
+
+# 測試非 leader 略過 singleton 工作
+def test_scheduler_skips_singleton_on_follower():
+    finished = []
+    stats = run_scheduler([("singleton", lambda: finished.append("singleton"), 0.02, True)])
+    assert stats["singleton"]["runs"] == 0 and stats["singleton"]["skipped_not_leader"] >= 2
+    assert finished == []
+
+# 測試家訪統計重算修正不一致的計數
+def test_reconcile_visit_counters(test_villager_data):
+    db = TestingSessionLocal()
+    try:
+        db.execute(text('UPDATE "Villager" SET "VisitCount" = 99'))
+        db.commit()
+        assert VillagerCrud.reconcile_visit_counters(db, batch_size=1) == 2
+        assert db.execute(text('SELECT max("VisitCount") FROM "Villager"')).scalar() == 0
+    finally:
+        db.close()
+
+# 測試管理端點列出並立即執行已註冊的工作
+def test_scheduler_admin_endpoints(admin_headers):
+    jobs = client.get("/api/admin/scheduler", headers=admin_headers).json()["data"]["jobs"]
+    assert {"pool-check", "cache-refresh"} <= set(jobs)
+    response = client.post("/api/admin/scheduler/pool-check/run", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["data"]["runs"] >= 1
+    assert client.post("/api/admin/scheduler/missing/run", headers=admin_headers).status_code == 404
+
+# 測試 leader 選舉連線使用與主連接池相同的連線參數
+def test_leader_lock_uses_engine_connect_args():
+    """測試專用連線帶有 SSL 與連線逾時等參數（不實際連線）"""
+    lock = AdvisoryLeaderLock(create_engine("postgresql://user@db.invalid/app"))
+    captured = {}
+
+    @event.listens_for(lock._engine, "do_connect")
+    def capture(dialect, connection_record, cargs, cparams):
+        captured.update(cparams)
+        raise RuntimeError("not connecting")
+
+    with pytest.raises(Exception):
+        lock._engine.connect()
+    assert captured["sslmode"] == "require"
+    assert captured["connect_timeout"] == 10
+    assert {key: captured[key] for key in CONNECT_ARGS} == CONNECT_ARGS
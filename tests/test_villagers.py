@@ -1,175 +1,14 @@
-import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, Date, CHAR, Boolean, UniqueConstraint, Table, MetaData
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.pool import StaticPool
 from datetime import date
-from sqlalchemy import text
+import time
+
+from sqlalchemy import text, event
 
 from app.main import app
 from app.database import get_db
-from app.models import Villager, RelationshipType, VillagerRelationship
-
-# 創建測試用的臨時資料庫 - 使用SQLite內存數據庫
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
+from .helpers import (
+    client, engine, TestingSessionLocal, TestLocation, TestVillager, TestRelationshipType,
+    TestVillagerRelationship, TestAccount, TestRecord, TestVillagersAtRecord, TestStudentsAtRecord,
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# 創建一個測試專用的Base類別，避免與應用程式的Base衝突
-TestBase = declarative_base()
-
-# 創建測試用的Location模型
-class TestLocation(TestBase):
-    __tablename__ = "Location"
-    
-    LocationID = Column("LocationID", Integer, primary_key=True, index=True, autoincrement=True)
-    name = Column("name", String(20), index=True, nullable=False)
-    Latitude = Column("Latitude", String(30), nullable=False)
-    Longitude = Column("Longitude", String(30), nullable=False)
-    Address = Column("Address", String(50))
-    BriefDescription = Column(String(300))
-    Photo = Column(Text)
-    # 用String代替ARRAY
-    Tag = Column("Tag", String(200))
-
-# 創建測試用的Villager模型
-class TestVillager(TestBase):
-    __tablename__ = "Villager"
-    
-    VillagerID = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    Name = Column(String(20), nullable=False)
-    Gender = Column(CHAR(1), nullable=False)
-    Job = Column(String(20))
-    URL = Column(Text)
-    Photo = Column(Text)
-    Location = Column(Integer, ForeignKey("Location.LocationID"))
-
-# 創建測試用的RelationshipType模型
-class TestRelationshipType(TestBase):
-    __tablename__ = "RelationshipType"
-    
-    RelationshipTypeID = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    Name = Column(String(20), nullable=False, unique=True)
-    Source_Role = Column(String(20), nullable=False)
-    Target_Role = Column(String(20), nullable=False)
-    Description = Column(String(100))
-
-# 創建測試用的VillagerRelationship模型
-class TestVillagerRelationship(TestBase):
-    __tablename__ = "VillagerRelationship"
-    
-    RelationshipID = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    SourceVillagerID = Column(Integer, ForeignKey("Villager.VillagerID"), nullable=False)
-    TargetVillagerID = Column(Integer, ForeignKey("Villager.VillagerID"), nullable=False)
-    RelationshipTypeID = Column(Integer, ForeignKey("RelationshipType.RelationshipTypeID"), nullable=False)
-
-# 創建測試所需的表格
-TestBase.metadata.create_all(bind=engine)
-
-# 建立測試客戶端
-client = TestClient(app)
-
-# 1. FastAPI 依賴覆蓋 - 替換資料庫連接
-def override_get_db():
-    """替換 FastAPI 的資料庫依賴，使用測試資料庫"""
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# 告訴 FastAPI 在測試中使用我們的測試資料庫
-app.dependency_overrides[get_db] = override_get_db
-
-# 2. Pytest Fixture - 管理測試資料
-@pytest.fixture(scope="function")
-def test_db():
-    """提供測試用的資料庫會話"""
-    db = TestingSessionLocal()
-    yield db
-    
-    # 測試後清理所有資料
-    try:
-        db.execute(text("DELETE FROM VillagerRelationship"))
-        db.execute(text("DELETE FROM RelationshipType"))
-        db.execute(text("DELETE FROM Villager"))
-        db.execute(text("DELETE FROM Location"))
-        db.commit()
-    except Exception as e:
-        print(f"清理資料錯誤: {e}")
-        db.rollback()
-    finally:
-        db.close()
-
-@pytest.fixture(scope="function")
-def test_villager_data(test_db):
-    """創建測試村民數據"""
-    # 首先添加地點
-    location = TestLocation(
-        name="測試地點",
-        Latitude="23.5",
-        Longitude="121.5",
-        Address="測試地址",
-        BriefDescription="測試描述"
-    )
-    test_db.add(location)
-    test_db.commit()
-    test_db.refresh(location)
-    
-    # 添加村民
-    villager1 = TestVillager(
-        Name="測試村民1",
-        Gender="M",
-        Job="務農",
-        Location=location.LocationID
-    )
-    
-    villager2 = TestVillager(
-        Name="測試村民2",
-        Gender="F",
-        Job="教師",
-        Location=location.LocationID
-    )
-    
-    test_db.add(villager1)
-    test_db.add(villager2)
-    test_db.commit()
-    test_db.refresh(villager1)
-    test_db.refresh(villager2)
-    
-    # 添加關係類型
-    relationship_type = TestRelationshipType(
-        Name="夫妻",
-        Source_Role="丈夫",
-        Target_Role="妻子",
-        Description="婚姻關係"
-    )
-    test_db.add(relationship_type)
-    test_db.commit()
-    test_db.refresh(relationship_type)
-    
-    # 建立親屬關係
-    relationship = TestVillagerRelationship(
-        SourceVillagerID=villager1.VillagerID,
-        TargetVillagerID=villager2.VillagerID,
-        RelationshipTypeID=relationship_type.RelationshipTypeID
-    )
-    test_db.add(relationship)
-    test_db.commit()
-    test_db.refresh(relationship)
-    
-    return {
-        "location": location,
-        "villager1": villager1,
-        "villager2": villager2,
-        "relationship_type": relationship_type,
-        "relationship": relationship
-    }
 
 # 測試 GET /api/villager 獲取所有村民
 def test_get_villagers(test_villager_data):
@@ -350,4 +189,509 @@ def test_delete_relationship(test_villager_data):
     assert data["status"] == "success"
     assert "已成功移除" in data["message"]
 
-# # 測試指令：pytest -W ignore
\ No newline at end of file
+# 測試 POST /api/villager/relationship/bulk 批次添加親屬關係
+def test_bulk_add_relationships(test_villager_data):
+    """測試批次添加親屬關係，並逐筆回報失敗原因"""
+    villager1_id = test_villager_data["villager1"].VillagerID
+    villager2_id = test_villager_data["villager2"].VillagerID
+    type_id = test_villager_data["relationship_type"].RelationshipTypeID
+    
+    payload = {
+        "relationships": [
+            # 與既有關係重複
+            {"source_villager_id": villager1_id, "target_villager_id": villager2_id, "relationship_type_id": type_id},
+            # 有效
+            {"source_villager_id": villager2_id, "target_villager_id": villager1_id, "relationship_type_id": type_id},
+            # 同一批次內重複
+            {"source_villager_id": villager2_id, "target_villager_id": villager1_id, "relationship_type_id": type_id},
+            # 村民不存在
+            {"source_villager_id": 99999, "target_villager_id": villager1_id, "relationship_type_id": type_id},
+            # 關係類型不存在
+            {"source_villager_id": villager1_id, "target_villager_id": villager2_id, "relationship_type_id": 99999}
+        ]
+    }
+    
+    response = client.post("/api/villager/relationship/bulk", json=payload)
+    
+    assert response.status_code == 201
+    
+    data = response.json()
+    assert data["status"] == "success"
+    assert data["summary"] == {"total": 5, "created": 1, "failed": 4}
+    assert data["data"][0]["index"] == 1
+    assert data["data"][0]["relationship_id"] is not None
+    assert [error["index"] for error in data["errors"]] == [0, 2, 3, 4]
+    assert data["errors"][2]["error"] == "找不到來源村民"
+    assert data["errors"][3]["error"] == "找不到指定的關係類型"
+
+# 測試 python -m app.cli import-relationships 遇到格式錯誤的列
+def test_cli_import_relationships_invalid_rows(tmp_path, capsys):
+    """測試格式錯誤的列回報列號，且不匯入任何資料"""
+    from app import cli
+    
+    path = tmp_path / "relationships.csv"
+    path.write_text(
+        "source_villager_id,target_villager_id,relationship_type_id\n"
+        "1,2,1\n"
+        "abc,2,1\n",
+        encoding="utf-8"
+    )
+    
+    assert cli.main(["import-relationships", str(path)]) == 1
+    
+    err = capsys.readouterr().err
+    assert "第 2 筆格式錯誤: source_villager_id" in err
+    assert "未匯入任何資料" in err
+
+# 測試 JSON 檔案的最上層或列不是物件、以及 JSON 格式錯誤
+def test_cli_import_malformed_json(tmp_path, capsys):
+    """測試不是陣列的最上層、不是物件的列與無法解析的 JSON 都輸出原因並回傳 1"""
+    from app import cli
+    
+    path = tmp_path / "relationships.json"
+    path.write_text('{"a": 1}', encoding="utf-8")
+    assert cli.main(["import-relationships", str(path), "--dry-run"]) == 1
+    assert "最上層必須是陣列" in capsys.readouterr().err
+    
+    path.write_text('[1, "ab"]', encoding="utf-8")
+    assert cli.main(["import-villagers", str(path), "--dry-run"]) == 1
+    err = capsys.readouterr().err
+    assert "第 1 筆格式錯誤: 必須是物件" in err and "第 2 筆格式錯誤" in err
+    
+    path.write_text('[{"source_villager_id": 1,', encoding="utf-8")
+    assert cli.main(["import-relationships", str(path)]) == 1
+    assert f"無法讀取 {path}" in capsys.readouterr().err
+
+# 測試 POST /api/villager/bulk 批次新增村民並標記疑似重複
+def test_bulk_create_villagers(test_villager_data):
+    """測試批次新增村民的重複偵測"""
+    location_id = test_villager_data["location"].LocationID
+    
+    payload = {
+        "villagers": [
+            # 與既有村民「測試村民1」同性別同地點，姓名相近
+            {"name": "測試村民 1", "gender": "M", "location_id": location_id},
+            # 新村民
+            {"name": "林阿美", "gender": "F", "job": "織布", "location_id": location_id},
+            # 與同批次的「林阿美」相近
+            {"name": "林亞美", "gender": "F", "location_id": location_id},
+            # 地點不存在
+            {"name": "王大明", "gender": "M", "location_id": 99999}
+        ]
+    }
+    
+    response = client.post("/api/villager/bulk", json=payload)
+    
+    assert response.status_code == 201
+    
+    data = response.json()
+    assert data["status"] == "success"
+    assert data["summary"] == {"total": 4, "created": 1, "duplicates": 2, "failed": 1, "skipped_blocks": 0}
+    assert data["data"][0]["name"] == "林阿美"
+    assert data["duplicates"][0]["matches"][0]["villagerid"] == test_villager_data["villager1"].VillagerID
+    assert data["duplicates"][1]["matches"][0]["index"] == 1
+    assert data["errors"][0]["index"] == 3
+    
+    # 確認只寫入了一筆
+    location_response = client.get(f"/api/villagers/location/{location_id}")
+    assert len(location_response.json()["data"]) == 3
+
+# 測試過於常見的姓名 block 被略過時仍能找到完全相同的姓名
+def test_duplicate_index_oversized_blocks():
+    """測試所有 n-gram block 都超過 max_block_size 時，完全相同的姓名仍被標記，並記錄略過的 block 數"""
+    from app.services.villager_import import DuplicateIndex
+    
+    index = DuplicateIndex(max_block_size=3)
+    for key in range(4):
+        index.add(key, "Panay", "F", 1)
+    
+    matches = index.find_matches("panay", "F", 1)
+    assert sorted(key for key, _, _ in matches) == [0, 1, 2, 3]
+    assert all(score == 1.0 for _, _, score in matches)
+    assert index.skipped_blocks == 6
+    # 相似但不完全相同的姓名只能由 n-gram block 找到，block 過大時不產生候選
+    assert index.find_matches("Panai", "F", 1) == []
+    assert index.find_matches("Panay", "M", 1) == []
+
+# 測試 GET /api/villager 的 cursor 分頁與篩選
+def test_get_villagers_cursor_pagination(test_villager_data):
+    """測試 cursor 分頁、總數與篩選條件"""
+    response = client.get("/api/villager", params={"limit": 1})
+    
+    assert response.status_code == 200
+    
+    first_page = response.json()
+    assert len(first_page["data"]) == 1
+    assert first_page["data"][0]["villagerid"] == test_villager_data["villager1"].VillagerID
+    assert first_page["pagination"]["total"] == 2
+    assert first_page["pagination"]["has_more"] is True
+    
+    response = client.get("/api/villager", params={"limit": 1, "cursor": first_page["pagination"]["next_cursor"]})
+    second_page = response.json()
+    assert second_page["data"][0]["villagerid"] == test_villager_data["villager2"].VillagerID
+    assert second_page["pagination"]["has_more"] is False
+    assert second_page["pagination"]["next_cursor"] is None
+    
+    # 篩選條件
+    response = client.get("/api/villager", params={"gender": "F"})
+    data = response.json()
+    assert [item["name"] for item in data["data"]] == ["測試村民2"]
+    assert data["pagination"]["total"] == 1
+    
+    # 無效的 cursor
+    response = client.get("/api/villager", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+# 測試 POST /api/villager/batch-delete 批次刪除村民
+def test_batch_delete_villagers(test_villager_data):
+    """測試以村民ID列表與地點ID批次刪除村民，親屬關係與家訪關聯由 ON DELETE CASCADE 一併刪除"""
+    villager1_id = test_villager_data["villager1"].VillagerID
+    villager2_id = test_villager_data["villager2"].VillagerID
+    db = TestingSessionLocal()
+    try:
+        db.add(TestVillagersAtRecord(Villager=villager1_id, Record=1))
+        db.add(TestVillagersAtRecord(Villager=villager2_id, Record=1))
+        db.commit()
+    finally:
+        db.close()
+    
+    def dependent_rows():
+        db = TestingSessionLocal()
+        try:
+            return (
+                db.query(TestVillagerRelationship).count(),
+                [row.Villager for row in db.query(TestVillagersAtRecord).all()]
+            )
+        finally:
+            db.close()
+    
+    assert dependent_rows() == (1, [villager1_id, villager2_id])
+    
+    response = client.post("/api/villager/batch-delete", json={"villager_ids": [villager1_id, 99999]})
+    
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["status"] == "success"
+    assert data["data"]["deleted_ids"] == [villager1_id]
+    assert data["data"]["not_found_ids"] == [99999]
+    assert dependent_rows() == (0, [villager2_id])
+    
+    # 依地點刪除剩下的村民
+    location_id = test_villager_data["location"].LocationID
+    response = client.post("/api/villager/batch-delete", json={"location_id": location_id})
+    assert response.status_code == 200
+    assert response.json()["data"]["deleted_ids"] == [villager2_id]
+    assert dependent_rows() == (0, [])
+    
+    # 已無村民可刪除
+    response = client.post("/api/villager/batch-delete", json={"location_id": location_id})
+    assert response.status_code == 404
+    
+    # 未指定刪除條件
+    response = client.post("/api/villager/batch-delete", json={})
+    assert response.status_code == 422
+
+# 測試串聯刪除遷移以 inspector 取得外鍵名稱
+def test_cascade_migration_statements():
+    """測試已是 CASCADE 的外鍵不重建，沒有外鍵時以預設名稱新增"""
+    from app.migrations import _cascade_villager_fk
+    
+    with engine.connect() as conn:
+        assert _cascade_villager_fk(conn, "VillagerRelationship", "SourceVillagerID") == []
+        assert _cascade_villager_fk(conn, "Villagers_at_record", "Villager", schema="public") == [
+            'ALTER TABLE public."Villagers_at_record" ADD CONSTRAINT "Villagers_at_record_Villager_fkey" '
+            'FOREIGN KEY ("Villager") REFERENCES "Villager" ("VillagerID") ON DELETE CASCADE'
+        ]
+
+# 測試家訪紀錄與村民家訪統計
+def test_villager_visits_and_counters(test_villager_data):
+    """測試家訪關聯異動時維護 visit_count / last_visited，並以 cursor 分頁取得家訪紀錄"""
+    location_id = test_villager_data["location"].LocationID
+    villager1_id = test_villager_data["villager1"].VillagerID
+    villager2_id = test_villager_data["villager2"].VillagerID
+    
+    # 建立兩筆家訪紀錄，villager1 兩次都受訪
+    record_ids = []
+    for visit_date in ["2024-03-01", "2024-05-20"]:
+        response = client.post("/api/create", json={
+            "semester": "112",
+            "date": visit_date,
+            "location_id": location_id,
+            "account_id": 1,
+            "villager_ids": [villager1_id]
+        })
+        assert response.status_code == 201
+        record_ids.append(response.json()["data"]["record_id"])
+    
+    response = client.get(f"/api/villager/{villager1_id}")
+    assert response.json()["data"]["visit_count"] == 2
+    assert response.json()["data"]["last_visited"] == "2024-05-20"
+    
+    # 最久未家訪排序：從未家訪的 villager2 在前
+    response = client.get("/api/villager", params={"sort": "least_recently_visited", "limit": 1})
+    data = response.json()
+    assert data["data"][0]["villagerid"] == villager2_id
+    response = client.get("/api/villager", params={
+        "sort": "least_recently_visited", "limit": 1, "cursor": data["pagination"]["next_cursor"]
+    })
+    assert response.json()["data"][0]["villagerid"] == villager1_id
+    
+    # 家訪紀錄 cursor 分頁（由新到舊）
+    response = client.get(f"/api/villager/{villager1_id}/visits", params={"limit": 1})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert first_page["data"]["visit_count"] == 2
+    assert first_page["data"]["visits"][0]["record_id"] == record_ids[1]
+    response = client.get(f"/api/villager/{villager1_id}/visits", params={
+        "limit": 1, "cursor": first_page["pagination"]["next_cursor"]
+    })
+    second_page = response.json()
+    assert second_page["data"]["visits"][0]["record_id"] == record_ids[0]
+    assert second_page["pagination"]["has_more"] is False
+    
+    # 加入與移除村民關聯
+    response = client.post(f"/api/records/{record_ids[0]}/villagers", json={"villager_ids": [villager2_id]})
+    assert response.status_code == 201
+    assert client.get(f"/api/villager/{villager2_id}").json()["data"]["visit_count"] == 1
+    
+    response = client.delete(f"/api/records/{record_ids[1]}/villagers/{villager1_id}")
+    assert response.status_code == 200
+    data = client.get(f"/api/villager/{villager1_id}").json()["data"]
+    assert data["visit_count"] == 1
+    assert data["last_visited"] == "2024-03-01"
+    
+    # 刪除家訪紀錄
+    response = client.delete(f"/api/delete/{record_ids[0]}")
+    assert response.status_code == 200
+    data = client.get(f"/api/villager/{villager1_id}").json()["data"]
+    assert data["visit_count"] == 0
+    assert data["last_visited"] is None
+
+# 測試建立家訪紀錄時指定不存在的村民
+def test_create_record_unknown_villager(test_villager_data):
+    """測試回傳 400，且不建立紀錄與村民關聯"""
+    location_id = test_villager_data["location"].LocationID
+    villager_id = test_villager_data["villager1"].VillagerID
+    
+    response = client.post("/api/create", json={
+        "semester": "112",
+        "date": "2024-03-01",
+        "location_id": location_id,
+        "account_id": 1,
+        "villager_ids": [villager_id, 9999]
+    })
+    assert response.status_code == 400
+    assert "9999" in response.json()["detail"]
+    
+    db = TestingSessionLocal()
+    try:
+        assert db.query(TestRecord).count() == 0
+        assert db.query(TestVillagersAtRecord).count() == 0
+    finally:
+        db.close()
+    assert client.get(f"/api/villager/{villager_id}").json()["data"]["visit_count"] == 0
+
+# 測試 GET /api/location/{location_id}/detail 的查詢數固定
+def test_location_detail_bounded_queries(test_db, test_villager_data, query_budget):
+    """測試地點完整資訊的內容，以及查詢數不隨村民與紀錄數量增加"""
+    location_id = test_villager_data["location"].LocationID
+    type_id = test_villager_data["relationship_type"].RelationshipTypeID
+    
+    def fetch_detail():
+        started = time.perf_counter()
+        response = client.get(f"/api/location/{location_id}/detail")
+        return response, query_budget(response, 7), time.perf_counter() - started
+    
+    account = TestAccount(Name="學生甲", Password="x", EntrySemester="112")
+    test_db.add(account)
+    test_db.commit()
+    
+    def add_visit(visit_date, villager_ids):
+        record = TestRecord(Semester="112", Date=visit_date, Location=location_id, Account=account.AccountID)
+        test_db.add(record)
+        test_db.commit()
+        test_db.add(TestStudentsAtRecord(Account=account.AccountID, Record=record.RecordID))
+        test_db.add_all([TestVillagersAtRecord(Villager=vid, Record=record.RecordID) for vid in villager_ids])
+        test_db.commit()
+        return record.RecordID
+    
+    first_record = add_visit(date(2024, 3, 1), [test_villager_data["villager1"].VillagerID])
+    
+    response, small_count, _ = fetch_detail()
+    
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["location"]["id"] == location_id
+    assert len(data["villagers"]) == 2
+    assert data["villagers"][0]["relationships"][0]["role"] == "丈夫"
+    assert data["villagers"][1]["relationships"][0]["role"] == "妻子"
+    assert data["records"][0]["record_id"] == first_record
+    assert data["records"][0]["students"] == [{"account_id": account.AccountID, "name": "學生甲"}]
+    assert data["records"][0]["villagers"][0]["name"] == "測試村民1"
+    
+    # 增加更多村民、親屬關係與家訪紀錄
+    for i in range(10):
+        villager = TestVillager(Name=f"村民{i}", Gender="M", Location=location_id)
+        test_db.add(villager)
+        test_db.commit()
+        test_db.add(TestVillagerRelationship(
+            SourceVillagerID=test_villager_data["villager1"].VillagerID,
+            TargetVillagerID=villager.VillagerID,
+            RelationshipTypeID=type_id
+        ))
+        test_db.commit()
+        add_visit(date(2024, 4, 1 + i), [villager.VillagerID, test_villager_data["villager2"].VillagerID])
+    
+    response, large_count, elapsed = fetch_detail()
+    
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data["villagers"]) == 12
+    assert len(data["records"]) == 10
+    assert len(data["villagers"][0]["relationships"]) == 11
+    
+    # 查詢數固定且不隨資料量增加
+    assert large_count == small_count
+    assert elapsed < 1.0
+    
+    # 不存在的地點
+    response = client.get("/api/location/99999/detail")
+    assert response.status_code == 404
+
+# 測試 POST /api/batch 批次查詢
+def test_batch_operations(test_villager_data):
+    """測試批次查詢依序回傳各操作結果，個別失敗不影響其他操作"""
+    location_id = test_villager_data["location"].LocationID
+    villager1_id = test_villager_data["villager1"].VillagerID
+    
+    response = client.post("/api/batch", json={"operations": [
+        {"id": "map", "op": "locations"},
+        {"id": "people", "op": "villagers_by_location", "params": {"location_id": location_id}},
+        {"op": "villager", "params": {"villager_id": villager1_id}},
+        {"op": "villager", "params": {"villager_id": 99999}},
+        {"op": "villagers", "params": {"limit": 0}},
+        {"op": "drop_table"},
+        {"op": "records_by_location", "params": {"location_id": location_id}}
+    ]})
+    
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == [200, 200, 200, 404, 422, 400, 200]
+    assert results[0]["id"] == "map"
+    assert results[0]["body"]["data"][0]["id"] == location_id
+    assert results[1]["id"] == "people"
+    assert len(results[1]["body"]["data"]) == 2
+    assert results[2]["body"]["data"]["name"] == "測試村民1"
+    assert results[3]["body"]["detail"] == "找不到對應的村民資料"
+    assert results[6]["body"]["data"] == []
+    
+    # 操作數量限制
+    response = client.post("/api/batch", json={"operations": []})
+    assert response.status_code == 422
+
+# 測試批次查詢中單一操作發生非 HTTP 錯誤
+def test_batch_operation_database_error(test_villager_data, monkeypatch):
+    """測試操作的 SQL 錯誤只回滾該操作的 SAVEPOINT，回傳 500，後續操作仍在同一個交易中執行"""
+    from app.router import batch
+    
+    def broken(db, location_id):
+        db.execute(text("SELECT * FROM missing_table"))
+    
+    def crashing(db, location_id):
+        raise ValueError("壞掉了")
+    
+    monkeypatch.setitem(batch.BATCH_OPERATIONS, "broken", (broken, batch._LocationParams))
+    monkeypatch.setitem(batch.BATCH_OPERATIONS, "crashing", (crashing, batch._LocationParams))
+    location_id = test_villager_data["location"].LocationID
+    
+    response = client.post("/api/batch", json={"operations": [
+        {"op": "broken", "params": {"location_id": location_id}},
+        {"op": "villager", "params": {"villager_id": test_villager_data["villager1"].VillagerID}},
+        {"op": "crashing", "params": {"location_id": location_id}},
+        {"op": "villagers_by_location", "params": {"location_id": location_id}}
+    ]})
+    
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == [500, 200, 500, 200]
+    assert "missing_table" in results[0]["body"]["detail"]
+    assert results[1]["body"]["data"]["name"] == "測試村民1"
+    assert results[2]["body"]["detail"] == "操作失敗: 壞掉了"
+    assert len(results[3]["body"]["data"]) == 2
+
+# 測試 fields= 稀疏欄位
+def test_sparse_fields(test_db, test_villager_data):
+    """測試 fields 參數只查詢並回傳指定欄位"""
+    location_id = test_villager_data["location"].LocationID
+    statements = []
+    
+    def capture_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(engine, "before_cursor_execute", capture_statement)
+    try:
+        response = client.get("/api/locations?fields=id,name")
+        assert response.status_code == 200
+        assert response.json()["data"] == [{"id": location_id, "name": "測試地點"}]
+        location_sql = [s for s in statements if 'FROM "Location"' in s][0]
+        assert "BriefDescription" not in location_sql
+        assert '"Photo"' not in location_sql
+        
+        statements.clear()
+        response = client.get("/api/villager?fields=villagerid,name")
+        assert response.status_code == 200
+        assert response.json()["data"] == [
+            {"villagerid": test_villager_data["villager1"].VillagerID, "name": "測試村民1"},
+            {"villagerid": test_villager_data["villager2"].VillagerID, "name": "測試村民2"}
+        ]
+        villager_sql = [s for s in statements if 'FROM "Villager"' in s and "count" not in s][0]
+        assert '"Job"' not in villager_sql
+        assert '"URL"' not in villager_sql
+    finally:
+        event.remove(engine, "before_cursor_execute", capture_statement)
+    
+    # 未指定 fields 時回傳完整欄位
+    assert client.get("/api/locations").json()["data"] == [{
+        "id": location_id,
+        "name": "測試地點",
+        "latitude": "23.5",
+        "longitude": "121.5",
+        "address": "測試地址",
+        "brief_description": "測試描述",
+        "photo": None,
+        "tag": None
+    }]
+    data = client.get("/api/villager").json()["data"]
+    assert set(data[0]) == {"villagerid", "name", "gender", "job", "locationid", "visit_count", "last_visited"}
+    
+    # 排序鍵不在 fields 中仍可分頁
+    response = client.get("/api/villager?fields=name&limit=1&sort=least_recently_visited")
+    assert response.status_code == 200
+    assert response.json()["data"] == [{"name": "測試村民1"}]
+    assert response.json()["pagination"]["has_more"] is True
+    
+    # 家訪紀錄列表
+    response = client.get("/api/records?fields=record_id,date")
+    assert response.status_code == 200
+    
+    # 不存在的欄位
+    response = client.get("/api/villager?fields=name,password")
+    assert response.status_code == 400
+    response = client.get("/api/locations?fields=")
+    assert response.status_code == 400
+    response = client.get(f"/api/records/location/{location_id}?fields=secret")
+    assert response.status_code == 400
+
+# 測試 GET 路由使用唯讀 session
+def test_get_routes_use_read_only_session():
+    """所有 GET 路由都應使用 get_read_db，不使用可寫入的 get_db"""
+    from fastapi.routing import APIRoute
+    
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods:
+            continue
+        dependencies = [dependency.call for dependency in route.dependant.dependencies]
+        assert get_db not in dependencies, route.path
+
+# # 測試指令：pytest -W ignore